@@ -0,0 +1,4 @@
+"""
+Benchmarks of the pipeline on synthetic data, run from the repository root, see for each:
+    PYTHONPATH=src python -m benchmarks.<name> --help
+"""
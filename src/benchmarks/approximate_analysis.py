@@ -0,0 +1,118 @@
+"""
+Accuracy, runtime and peak memory of the approximate analysis against the exact one, on synthetic
+datasets of growing size.
+
+For each size, a deterministic dataset is generated, then the streaming analysis runs in its own
+process, exact and then approximate (see `iter_analysis`), with the dataset as working directory.
+The accuracy of the approximate results is measured against the exact ones:
+
+- the relative error of the failure events of question 1 and the largest one of an equipment in
+  question 2;
+- the precision of the top sensors of question 4, the share of the ranked sensors that are among
+  the exact top sensors of their equipment, ties included;
+- the largest overestimation of the failures of a ranked sensor, and its bound.
+
+The sensors fail uniformly by default, without any heavy hitter for the Space-Saving summaries
+to find; `--sensor-skew` makes them follow a Zipf law instead.
+"""
+
+import os
+
+from benchmarks.pipeline import measure_stage, run_in_process
+from benchmarks.synthetic_data import benchmark_parser, datasets_directory, synthetic_dataset
+from data.generate_analysis import generate_analysis
+from data.process_raw_data import DEFAULT_CHUNK_SIZE
+from data.sketches import DEFAULT_COUNT_ERROR, DEFAULT_DISTINCT_ERROR
+
+TOP_SENSORS = 3
+
+
+def run_analysis(dataset_path: str, **analysis_options) -> tuple:
+    """Run the analysis on a dataset, returning its results, wall time and peak RSS."""
+    os.chdir(dataset_path)
+    return measure_stage(lambda: generate_analysis(**analysis_options))
+
+
+def accuracy(approximate: dict, exact: dict) -> dict:
+    """The errors of the approximate results against the exact ones, see the module documentation."""
+    events, exact_events = approximate["q1_result"]["v2"], exact["q1_result"]["v2"]
+    equipment_events = approximate["q2_result"].set_index("equipment_id")["failures"]
+    exact_equipment_events = exact["q2_result"].set_index("equipment_id")["failures"].reindex(equipment_events.index)
+
+    ranked = approximate["q4_result"].merge(
+        exact["q4_result"], on=["equipment_id", "sensor_id"], how="left", suffixes=("", "_exact")
+    )
+    found = ranked["failures_exact"].notna()
+    return {
+        "events_error": abs(events - exact_events) / exact_events,
+        "max_equipment_events_error": float(
+            ((equipment_events - exact_equipment_events).abs() / exact_equipment_events).max()
+        ),
+        "top_sensors_precision": float(found.mean()),
+        "max_sensor_overestimate": int((ranked["failures"] - ranked["failures_exact"])[found].max()),
+        "sensor_overestimate_bound": int(max(approximate["q4_result"].attrs["count_errors"].values())),
+    }
+
+
+def benchmark_size(
+    n_lines: int, n_events: int, sensor_skew: float, data_path: str, chunk_size: int, **sketch_options
+) -> list:
+    """
+    Generate, or reuse, the dataset of a size under `data_path` and run the exact and approximate
+    streaming analyses on it, in chunks of `chunk_size` bytes.
+    """
+    dataset_path = synthetic_dataset(data_path, n_lines, n_events=n_events, sensor_skew=sensor_skew)
+
+    # The exact ranking keeps the sensors tied with the last one, so the precision counts ties.
+    modes = {"exact": {"keep_ties": True}, "approximate": {"approximate": True, **sketch_options}}
+    runs = {
+        mode: run_in_process(run_analysis, dataset_path, chunk_size=chunk_size, top_sensors=TOP_SENSORS, **options)
+        for mode, options in modes.items()
+    }
+
+    exact_results, approximate_results = runs["exact"][0], runs["approximate"][0]
+    return [
+        {"lines": n_lines, "events": n_events, "mode": "exact", "seconds": runs["exact"][1],
+         "peak_rss_mb": runs["exact"][2] / 1024 ** 2},
+        {"lines": n_lines, "events": n_events, "mode": "approximate", "seconds": runs["approximate"][1],
+         "peak_rss_mb": runs["approximate"][2] / 1024 ** 2, **accuracy(approximate_results, exact_results)},
+    ]
+
+
+def main():
+    parser = benchmark_parser(__spec__.name, __doc__, [1_000_000], datasets=True)
+    parser.add_argument("--events", type=int, default=200_000, help="distinct failure timestamps of the log")
+    parser.add_argument("--sensor-skew", type=float, default=0.0, help="Zipf exponent of the sensor failures")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--distinct-error", type=float, default=DEFAULT_DISTINCT_ERROR)
+    parser.add_argument("--count-error", type=float, default=DEFAULT_COUNT_ERROR)
+    args = parser.parse_args()
+
+    with datasets_directory(args.data_dir) as data_path:
+        for n_lines in args.lines:
+            for result in benchmark_size(
+                n_lines,
+                args.events,
+                args.sensor_skew,
+                data_path,
+                chunk_size=args.chunk_size,
+                distinct_error=args.distinct_error,
+                count_error=args.count_error,
+            ):
+                line = (
+                    f"{result['lines']:>12,} {result['mode']:>12}: {result['seconds']:8.3f} s  "
+                    f"peak RSS {result['peak_rss_mb']:8.1f} MB"
+                )
+                if result["mode"] == "approximate":
+                    line += (
+                        f"  events error {result['events_error']:.2%}"
+                        f" (equipment max {result['max_equipment_events_error']:.2%})"
+                        f"  top sensors precision {result['top_sensors_precision']:.0%}"
+                        f"  sensor overestimate {result['max_sensor_overestimate']:,}"
+                        f" (bound {result['sensor_overestimate_bound']:,})"
+                    )
+                print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Throughput benchmark of parsing the log streamed out of the .tar.gz archive, against extracting
+the archive to disk and parsing the extracted file.
+"""
+
+import os
+import tarfile
+import tempfile
+
+from benchmarks.pipeline import best_time
+from benchmarks.synthetic_data import benchmark_parser, synthetic_log
+from data.extract_tar_gz import DEFAULT_BLOCK_SIZE, extract_tar_gz, stream_tar_member
+from data.process_raw_data import get_log_dataframe
+
+LOG_MEMBER_NAME = "equipment_failure_sensors/equpment_failure_sensors.txt"
+
+
+def decompress(tar_file_path: str) -> None:
+    """Read the log member out of the archive, without parsing it."""
+    with stream_tar_member(tar_file_path, LOG_MEMBER_NAME) as stream:
+        while stream.read(DEFAULT_BLOCK_SIZE):
+            pass
+
+
+def extract_then_parse(tar_file_path: str) -> None:
+    """Extract the archive to a directory, then parse the extracted log."""
+    with tempfile.TemporaryDirectory() as destination_path:
+        extract_tar_gz(tar_file_path, destination_path)
+        get_log_dataframe(os.path.join(destination_path, LOG_MEMBER_NAME))
+
+
+def stream_and_parse(tar_file_path: str) -> None:
+    """Parse the log streamed out of the archive."""
+    get_log_dataframe(LOG_MEMBER_NAME, archive_path=tar_file_path)
+
+
+def main():
+    parser = benchmark_parser(__spec__.name, __doc__, 1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with synthetic_log(args.lines) as log_file_path:
+        size_mb = os.path.getsize(log_file_path) / 1024 ** 2
+
+        tar_file_path = os.path.join(os.path.dirname(log_file_path), "equipment_failure_sensors.tar.gz")
+        with tarfile.open(tar_file_path, "w:gz") as tar:
+            tar.add(log_file_path, arcname=LOG_MEMBER_NAME)
+
+        print(f"Synthetic log: {args.lines:,} lines, {size_mb:.1f} MB, "
+              f"{os.path.getsize(tar_file_path) / 1024 ** 2:.1f} MB compressed")
+        for name, function in [
+            ("decompress only", decompress),
+            ("extract then parse", extract_then_parse),
+            ("stream and parse", stream_and_parse),
+        ]:
+            seconds = best_time(lambda: function(tar_file_path), args.repeat)
+            print(f"{name:>20}: {seconds:8.3f} s  {args.lines / seconds:12,.0f} lines/s  {size_mb / seconds:8.1f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
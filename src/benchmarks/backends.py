@@ -0,0 +1,78 @@
+"""
+Conformance and runtime of the execution backends of the analysis (see `data.backends`), on a
+synthetic dataset.
+
+Every backend runs in its own process, with the dataset as working directory: parsing the log and
+joining it with the equipment (`process_data`), aggregating the failures and answering the
+questions, with the telemetry. The results of every backend must be identical to the ones of the
+pandas backend, column types included; the differences are printed and make the run fail. The
+installed backends run by default.
+"""
+
+import os
+import sys
+
+import pandas as pd
+from benchmarks.pipeline import measure_stage, run_in_process
+from benchmarks.synthetic_data import benchmark_parser, datasets_directory, synthetic_dataset
+from data.backends import available_backends, get_backend
+from data.generate_analysis import answer_questions
+
+
+def run_backend(dataset_path: str, name: str) -> tuple:
+    """Run the analysis with a backend on a dataset, returning its results and the wall time of every stage."""
+    os.chdir(dataset_path)
+    backend = get_backend(name)
+    equipment_failures, process_seconds, _ = measure_stage(backend.process_data)
+    aggregates, aggregate_seconds, _ = measure_stage(backend.aggregate, equipment_failures, True)
+    results, answer_seconds, _ = measure_stage(answer_questions, aggregates)
+    return results, {"process_data": process_seconds, "aggregate": aggregate_seconds, "answer": answer_seconds}
+
+
+def differences(results: dict, reference: dict) -> list:
+    """The results that differ from the reference ones, with how they differ."""
+    found = []
+    for key, expected in reference.items():
+        result = results.get(key)
+        if isinstance(expected, pd.DataFrame):
+            try:
+                pd.testing.assert_frame_equal(result.reset_index(drop=True), expected.reset_index(drop=True))
+            except AssertionError as e:
+                found.append(f"{key}: {e}")
+        elif result != expected:
+            found.append(f"{key}: {result} instead of {expected}")
+    return found
+
+
+def main():
+    parser = benchmark_parser(__spec__.name, __doc__, [1_000_000], datasets=True)
+    parser.add_argument("--backends", nargs="+", default=available_backends())
+    args = parser.parse_args()
+
+    backends = ["pandas"] + [name for name in args.backends if name != "pandas"]
+    conforming = True
+    with datasets_directory(args.data_dir) as data_path:
+        for n_lines in args.lines:
+            dataset_path = synthetic_dataset(data_path, n_lines)
+
+            reference = None
+            for name in backends:
+                results, seconds = run_in_process(run_backend, dataset_path, name)
+                reference = reference or results
+                found = differences(results, reference)
+                conforming &= not found
+                print(
+                    f"{n_lines:>12,} {name:>8}: "
+                    + "  ".join(f"{stage} {stage_seconds:7.3f} s" for stage, stage_seconds in seconds.items())
+                    + f"  total {sum(seconds.values()):7.3f} s  "
+                    + ("identical to pandas" if not found else f"{len(found)} results differ from pandas")
+                )
+                for difference in found:
+                    print(f"    {difference}")
+
+    if not conforming:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
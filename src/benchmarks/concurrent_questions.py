@@ -0,0 +1,36 @@
+"""
+Runtime of answering the questions from the equipment failures, one after another versus on a
+pool of threads.
+"""
+
+import os
+
+from benchmarks.pipeline import best_time
+from benchmarks.synthetic_data import benchmark_parser, synthetic_log
+from data.aggregates import aggregate_failures
+from data.generate_analysis import answer_questions, iter_concurrent_answers
+from data.process_raw_data import get_equipment_lookup, get_log_dataframe, join_equipment_failures
+
+
+def main():
+    parser = benchmark_parser(__spec__.name, __doc__, 5_000_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 3, 4])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with synthetic_log(args.lines) as log_file_path:
+        log = get_log_dataframe(log_file_path, engine="mmap", status="ERROR")
+
+    equipment_failures = join_equipment_failures(get_equipment_lookup(), log)
+    del log
+    print(f"Equipment failures: {equipment_failures.shape[0]:,} rows, {os.cpu_count()} CPUs")
+
+    sequential = best_time(lambda: answer_questions(aggregate_failures(equipment_failures)), args.repeat)
+    print(f"{'sequential':>12}: {sequential:8.3f} s")
+    for workers in args.workers:
+        seconds = best_time(lambda: dict(iter_concurrent_answers(equipment_failures, workers)), args.repeat)
+        print(f"{workers:>4} threads: {seconds:8.3f} s  speedup x{sequential / seconds:5.2f}")
+
+
+if __name__ == "__main__":
+    main()
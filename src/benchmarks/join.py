@@ -0,0 +1,69 @@
+"""
+Runtime and peak memory of the equipment failures join, before and after the lookup join.
+
+"merge" is the previous `process_data`: parse every line with the regex engine, merge equipment
+x sensors x log, drop duplicates on all columns and filter the ERROR rows last. "lookup" is the
+current one, parsing the ERROR lines only with the columnar engine.
+Each variant runs in its own process so the peak RSS is its own.
+"""
+
+import os
+import resource
+import time
+
+import pandas as pd
+from benchmarks.pipeline import run_in_process
+from benchmarks.synthetic_data import benchmark_parser, synthetic_log
+from data.process_raw_data import (
+    EQUIPMENT_FILE_PATH,
+    EQUIPMENT_SENSORS_FILE_PATH,
+    get_equipment_lookup,
+    get_log_dataframe,
+    join_equipment_failures,
+)
+
+
+def merge_join(log_file_path: str) -> pd.DataFrame:
+    """The equipment failures join as done before the lookup join."""
+    equipment = pd.read_json(EQUIPMENT_FILE_PATH)
+    equipment_sensors = pd.read_csv(EQUIPMENT_SENSORS_FILE_PATH)
+    equipment_failure_sensors = get_log_dataframe(log_file_path, engine="regex")
+
+    equipment_failures = (
+        equipment
+        .merge(equipment_sensors, on="equipment_id", how="left")
+        .merge(equipment_failure_sensors, on="sensor_id", how="left")
+        .drop_duplicates()
+    )
+    return equipment_failures[equipment_failures["status"] == "ERROR"]
+
+
+def lookup_join(log_file_path: str) -> pd.DataFrame:
+    """The equipment failures join of `process_data`."""
+    equipment_lookup = get_equipment_lookup()
+    equipment_failure_sensors = get_log_dataframe(log_file_path, status="ERROR")
+    return join_equipment_failures(equipment_lookup, equipment_failure_sensors)
+
+
+def run_variant(variant: str, log_file_path: str) -> tuple:
+    """Run a join variant, returning its wall time, output rows and the peak RSS of the process."""
+    join = {"merge": merge_join, "lookup": lookup_join}[variant]
+    start = time.perf_counter()
+    rows = join(log_file_path).shape[0]
+    seconds = time.perf_counter() - start
+    return seconds, rows, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    args = benchmark_parser(__spec__.name, __doc__, 5_000_000).parse_args()
+
+    with synthetic_log(args.lines) as log_file_path:
+        print(f"Synthetic log: {args.lines:,} lines, {os.path.getsize(log_file_path) / 1024 ** 2:.1f} MB")
+
+        for variant in ["merge", "lookup"]:
+            seconds, rows, peak_mb = run_in_process(run_variant, variant, log_file_path)
+            print(f"{variant:>8}: {seconds:8.3f} s  peak RSS {peak_mb:8.1f} MB  {rows:,} failures")
+
+
+if __name__ == "__main__":
+    main()
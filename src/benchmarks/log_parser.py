@@ -0,0 +1,27 @@
+"""
+Throughput benchmark of the log parser engines.
+"""
+
+import os
+
+from benchmarks.pipeline import best_time
+from benchmarks.synthetic_data import benchmark_parser, synthetic_log
+from data.process_raw_data import get_log_dataframe
+
+
+def main():
+    parser = benchmark_parser(__spec__.name, __doc__, 1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with synthetic_log(args.lines) as log_file_path:
+        size_mb = os.path.getsize(log_file_path) / 1024 ** 2
+
+        print(f"Synthetic log: {args.lines:,} lines, {size_mb:.1f} MB")
+        for engine in ["regex", "columnar"]:
+            seconds = best_time(lambda: get_log_dataframe(log_file_path, engine=engine), args.repeat)
+            print(f"{engine:>10}: {seconds:8.3f} s  {args.lines / seconds:12,.0f} lines/s  {size_mb / seconds:8.1f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+"""
+Bytes per row of the parsed log and of the equipment failures, default versus compact types.
+"""
+
+import pandas as pd
+from benchmarks.synthetic_data import benchmark_parser, synthetic_log
+from data.process_raw_data import compact_types, get_equipment_lookup, get_log_dataframe, join_equipment_failures
+
+
+def bytes_per_row(df: pd.DataFrame) -> float:
+    """Memory used by a DataFrame per row, counting the Python objects it references."""
+    return df.memory_usage(index=False, deep=True).sum() / len(df)
+
+
+def main():
+    args = benchmark_parser(__spec__.name, __doc__, 1_000_000).parse_args()
+
+    with synthetic_log(args.lines) as log_file_path:
+        log = get_log_dataframe(log_file_path)
+        equipment_failures = join_equipment_failures(get_equipment_lookup(), log)
+
+    for name, df in [("log", log), ("equipment failures", equipment_failures)]:
+        default = bytes_per_row(df)
+        compact = bytes_per_row(compact_types(df))
+        print(f"{name:>20}: {default:6.1f} -> {compact:6.1f} bytes per row ({1 - compact / default:.0%} less)")
+
+
+if __name__ == "__main__":
+    main()
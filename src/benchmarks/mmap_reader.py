@@ -0,0 +1,42 @@
+"""
+Throughput and peak memory of the log readers, parsing the ERROR lines as `process_data` does.
+
+"regex" reads the file line by line through a text file object, "columnar" parses it with the
+Arrow CSV reader and "mmap" parses it from a memory map, after dropping the lines without the
+status from the raw bytes. Each reader runs in its own process so the peak RSS is its own; the
+pages of the mapped file count in the RSS of "mmap", although they belong to the page cache.
+"""
+
+import os
+import resource
+import time
+
+from benchmarks.pipeline import run_in_process
+from benchmarks.synthetic_data import benchmark_parser, synthetic_log
+from data.process_raw_data import get_log_dataframe
+
+
+def run_engine(engine: str, log_file_path: str) -> tuple:
+    """Parse the ERROR lines of the log, returning the wall time, rows and peak RSS of the process."""
+    start = time.perf_counter()
+    rows = get_log_dataframe(log_file_path, engine=engine, status="ERROR").shape[0]
+    seconds = time.perf_counter() - start
+    return seconds, rows, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = benchmark_parser(__spec__.name, __doc__, 3_000_000)
+    parser.add_argument("--error-ratio", type=float, default=0.9, help="share of ERROR lines in the log")
+    args = parser.parse_args()
+
+    with synthetic_log(args.lines, error_ratio=args.error_ratio) as log_file_path:
+        size_mb = os.path.getsize(log_file_path) / 1024 ** 2
+        print(f"Synthetic log: {args.lines:,} lines, {size_mb:.1f} MB, {args.error_ratio:.0%} ERROR")
+
+        for engine in ["regex", "columnar", "mmap"]:
+            seconds, rows, peak_mb = run_in_process(run_engine, engine, log_file_path)
+            print(f"{engine:>10}: {seconds:8.3f} s  {size_mb / seconds:8.1f} MB/s  peak RSS {peak_mb:8.1f} MB  {rows:,} rows")
+
+
+if __name__ == "__main__":
+    main()
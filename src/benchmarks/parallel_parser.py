@@ -0,0 +1,30 @@
+"""
+Scaling benchmark of the parallel log parser, from 1 to N worker processes.
+"""
+
+import os
+import time
+
+from benchmarks.synthetic_data import benchmark_parser, synthetic_log
+from data.process_raw_data import get_log_dataframe
+
+
+def main():
+    parser = benchmark_parser(__spec__.name, __doc__, 5_000_000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    with synthetic_log(args.lines) as log_file_path:
+        print(f"Synthetic log: {args.lines:,} lines, {os.path.getsize(log_file_path) / 1024 ** 2:.1f} MB, {os.cpu_count()} CPUs")
+
+        baseline = None
+        for workers in range(1, args.workers + 1):
+            start = time.perf_counter()
+            get_log_dataframe(log_file_path, workers=workers)
+            seconds = time.perf_counter() - start
+            baseline = baseline or seconds
+            print(f"{workers:>3} workers: {seconds:8.3f} s  {args.lines / seconds:12,.0f} lines/s  speedup {baseline / seconds:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Runtime and peak memory of every stage of the report pipeline, on synthetic datasets of growing size.
+
+For each size, a deterministic equipment file, sensor mapping and failure log are generated,
+then the pipeline runs in its own process, with the dataset as working directory: loading the
+equipment, parsing the log, joining them (together `process_data`), aggregating the failures
+and answering the questions (with the above, `generate_analysis`) and rendering the report
+(`HtmlReport.generate`). The peak RSS of a stage is sampled while it runs.
+
+The results are written as JSON, with the versions they were measured on. Given the results of
+a previous run with `--compare`, the time and memory ratios of every stage are printed.
+
+The other benchmarks time their stages with the helpers of this module.
+"""
+
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import get_context
+
+import pandas as pd
+import pyarrow as pa
+from benchmarks.synthetic_data import benchmark_parser, datasets_directory, synthetic_dataset
+from data.aggregates import aggregate_failures
+from data.generate_analysis import answer_questions
+from data.instrumentation import current_rss
+from data.process_raw_data import LOG_FILE_PATH, get_equipment_lookup, get_log_dataframe, join_equipment_failures
+from reports.html_report import HtmlReport
+
+SAMPLE_INTERVAL = 0.01
+
+
+def measure_stage(function, *args) -> tuple:
+    """Call a function, returning its result, wall time in seconds and the peak RSS in bytes while it ran."""
+    peak_rss = current_rss()
+    done = threading.Event()
+
+    def sample():
+        nonlocal peak_rss
+        while not done.wait(SAMPLE_INTERVAL):
+            peak_rss = max(peak_rss, current_rss())
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    start = time.perf_counter()
+    try:
+        result = function(*args)
+    finally:
+        seconds = time.perf_counter() - start
+        done.set()
+        sampler.join()
+
+    return result, seconds, max(peak_rss, current_rss())
+
+
+def best_time(function, repeat: int) -> float:
+    """Return the best wall time, in seconds, of calling a function `repeat` times."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run_in_process(function, *args, **kwargs):
+    """Call a function in a new process, so that its peak RSS is its own, returning its result."""
+    with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as executor:
+        return executor.submit(function, *args, **kwargs).result()
+
+
+def run_pipeline(dataset_path: str) -> list:
+    """Run the pipeline stages on a dataset, returning the wall time and peak RSS of each."""
+    os.chdir(dataset_path)
+    stages = []
+
+    def run(stage, function, *args):
+        result, seconds, peak_rss = measure_stage(function, *args)
+        stages.append({"stage": stage, "seconds": seconds, "peak_rss_mb": peak_rss / 1024 ** 2})
+        return result
+
+    equipment_lookup = run("load_equipment", get_equipment_lookup)
+    log = run("parse_log", lambda: get_log_dataframe(LOG_FILE_PATH, engine="mmap", status="ERROR"))
+    equipment_failures = run("join", join_equipment_failures, equipment_lookup, log)
+    del log
+    aggregates = run("aggregate", aggregate_failures, equipment_failures)
+    del equipment_failures
+    results = run("answer", answer_questions, aggregates)
+    run("report", lambda: HtmlReport(results).generate())
+    return stages
+
+
+def environment() -> dict:
+    """The code and library versions the benchmark runs on."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "commit": commit,
+        "python": sys.version.split()[0],
+        "pandas": pd.__version__,
+        "pyarrow": pa.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+
+
+def benchmark_size(n_lines: int, data_path: str) -> list:
+    """Generate, or reuse, the dataset of a size under `data_path` and run the pipeline on it."""
+    dataset_path = synthetic_dataset(data_path, n_lines)
+    log_mb = os.path.getsize(os.path.join(dataset_path, LOG_FILE_PATH)) / 1024 ** 2
+    stages = run_in_process(run_pipeline, dataset_path)
+    return [{"lines": n_lines, "log_mb": log_mb, **stage} for stage in stages]
+
+
+def compare(results: list, previous_results: list) -> None:
+    """Print the time and peak memory ratios of every stage against a previous run."""
+    previous = {(result["lines"], result["stage"]): result for result in previous_results}
+    for result in results:
+        before = previous.get((result["lines"], result["stage"]))
+        if before is not None:
+            print(
+                f"{result['lines']:>12,} {result['stage']:>16}: "
+                f"time x{result['seconds'] / before['seconds']:6.2f}  "
+                f"peak RSS x{result['peak_rss_mb'] / before['peak_rss_mb']:6.2f}"
+            )
+
+
+def main():
+    parser = benchmark_parser(__spec__.name, __doc__, [100_000, 1_000_000], datasets=True)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", default=None, help="results of a previous run to compare with")
+    args = parser.parse_args()
+
+    results = []
+    with datasets_directory(args.data_dir) as data_path:
+        for n_lines in args.lines:
+            for result in benchmark_size(n_lines, data_path):
+                print(
+                    f"{result['lines']:>12,} {result['stage']:>16}: {result['seconds']:8.3f} s  "
+                    f"peak RSS {result['peak_rss_mb']:8.1f} MB"
+                )
+                results.append(result)
+
+    with open(args.output, "w") as f:
+        json.dump({"environment": environment(), "results": results}, f, indent=4)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f)["results"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""Deterministic synthetic data following the FPSO equipment files and failure log format."""
+
+import argparse
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from data.process_raw_data import EQUIPMENT_FILE_PATH, EQUIPMENT_SENSORS_FILE_PATH, LOG_FILE_PATH
+
+BLOCK_SIZE = 100_000
+START_DATE = datetime(2020, 1, 1)
+
+
+def _format_timestamp(moment: datetime, style: int) -> str:
+    """Format a timestamp in one of the date layouts accepted by the log parser."""
+    if style == 0:
+        return moment.strftime("%Y-%m-%d %H:%M:%S")
+    if style == 1:
+        return f"{moment.year}/{moment.month}/{moment.day} {moment.hour}:{moment.minute:02d}:{moment.second:02d}"
+    return f"{moment.year}/{moment.month}/{moment.day}"
+
+
+def _format_measure(value: float, is_err: bool) -> str:
+    """Format a temperature or vibration reading, as written by the sensors."""
+    return "err" if is_err else f"{value:.2f}"
+
+
+def generate_log_lines(
+    n_lines: int,
+    sensor_ids=range(1, 10001),
+    n_events: int = 5000,
+    seed: int = 0,
+    error_ratio: float = 0.9,
+    sensor_skew: float = 0.0,
+):
+    """
+    Yield blocks of log lines, every line sharing the timestamp of one of `n_events` failures.
+
+    A share `error_ratio` of the lines has the ERROR status, the others WARNING. The sensors of
+    the lines are uniform, or with a `sensor_skew` follow a Zipf law of that exponent, the i-th
+    sensor failing in proportion to i ** -sensor_skew.
+    """
+    rng = np.random.default_rng(seed)
+    sensor_ids = np.asarray(sensor_ids)
+    sensor_weights = None
+    if sensor_skew:
+        sensor_weights = np.arange(1, len(sensor_ids) + 1) ** -sensor_skew
+        sensor_weights /= sensor_weights.sum()
+
+    offsets = np.sort(rng.integers(0, 365 * 24 * 3600, size=n_events))
+    styles = rng.choice(3, size=n_events, p=[0.6, 0.3, 0.1])
+    timestamps = [
+        _format_timestamp(START_DATE + timedelta(seconds=int(offset)), style)
+        for offset, style in zip(offsets, styles)
+    ]
+
+    for start in range(0, n_lines, BLOCK_SIZE):
+        size = min(BLOCK_SIZE, n_lines - start)
+        events = np.sort(rng.integers(0, n_events, size=size))
+        sensors = rng.choice(sensor_ids, size=size, p=sensor_weights)
+        is_error = rng.random(size) < error_ratio
+        temperatures = rng.uniform(-500, 500, size=size)
+        vibrations = rng.uniform(-10000, 10000, size=size)
+        temperature_err = rng.random(size) < 0.01
+        vibration_err = rng.random(size) < 0.01
+
+        yield [
+            f"[{timestamps[event]}]\t{'ERROR' if error else 'WARNING'}\tsensor[{sensor}]:\t"
+            f"(temperature\t{_format_measure(temperature, t_err)}, vibration\t{_format_measure(vibration, v_err)})\n"
+            for event, sensor, error, temperature, vibration, t_err, v_err in zip(
+                events, sensors, is_error, temperatures, vibrations, temperature_err, vibration_err
+            )
+        ]
+
+
+def write_failure_log(log_file_path: str, n_lines: int, **kwargs) -> None:
+    """Write a synthetic failure log with `n_lines` lines."""
+    with open(log_file_path, "w") as f:
+        for lines in generate_log_lines(n_lines, **kwargs):
+            f.writelines(lines)
+
+
+def _random_code(rng: np.random.Generator) -> str:
+    """An 8 characters code, like the equipment names and groups."""
+    return "".join(rng.choice(list("0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"), size=8))
+
+
+def write_equipment(equipment_file_path: str, n_equipment: int = 14, n_groups: int = 5, seed: int = 0) -> None:
+    """Write a synthetic equipment file, with ids from 1 to `n_equipment` spread over `n_groups` groups."""
+    rng = np.random.default_rng(seed)
+    groups = [_random_code(rng) for _ in range(n_groups)]
+    equipment = [
+        {"equipment_id": equipment_id, "name": _random_code(rng), "group_name": groups[rng.integers(n_groups)]}
+        for equipment_id in range(1, n_equipment + 1)
+    ]
+    with open(equipment_file_path, "w") as f:
+        json.dump(equipment, f, indent="\t")
+
+
+def write_equipment_sensors(
+    equipment_sensors_file_path: str,
+    n_equipment: int = 14,
+    sensor_ids=range(1, 10001),
+    seed: int = 0,
+) -> None:
+    """Write a synthetic mapping of every sensor to one of the equipment."""
+    rng = np.random.default_rng(seed)
+    pd.DataFrame({
+        "equipment_id": rng.integers(1, n_equipment + 1, size=len(sensor_ids)),
+        "sensor_id": sensor_ids,
+    }).to_csv(equipment_sensors_file_path, index=False)
+
+
+def write_dataset(
+    root_path: str,
+    n_lines: int,
+    n_equipment: int = 14,
+    n_groups: int = 5,
+    n_sensors: int = 10000,
+    seed: int = 0,
+    **kwargs,
+) -> None:
+    """
+    Write a synthetic equipment file, sensor mapping and failure log under `root_path`, at the
+    paths the pipeline reads them from when run with `root_path` as working directory.
+    """
+    sensor_ids = range(1, n_sensors + 1)
+    for path in [EQUIPMENT_FILE_PATH, EQUIPMENT_SENSORS_FILE_PATH, LOG_FILE_PATH]:
+        os.makedirs(os.path.dirname(os.path.join(root_path, path)), exist_ok=True)
+
+    write_equipment(os.path.join(root_path, EQUIPMENT_FILE_PATH), n_equipment, n_groups, seed)
+    write_equipment_sensors(os.path.join(root_path, EQUIPMENT_SENSORS_FILE_PATH), n_equipment, sensor_ids, seed)
+    write_failure_log(os.path.join(root_path, LOG_FILE_PATH), n_lines, sensor_ids=sensor_ids, seed=seed, **kwargs)
+
+
+def benchmark_parser(module_name: str, description: str, lines, datasets: bool = False) -> argparse.ArgumentParser:
+    """
+    Command line parser of a benchmark module, with the `--lines` of its synthetic data, a list of
+    sizes when `lines` is one, and with `datasets` the `--data-dir` to keep the datasets in.
+    """
+    parser = argparse.ArgumentParser(
+        prog=f"PYTHONPATH=src python -m {module_name}",
+        description=description + "\nRun from the repository root.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "--lines", type=int, nargs="+" if isinstance(lines, list) else None, default=lines,
+        help="log lines of the synthetic data",
+    )
+    if datasets:
+        parser.add_argument("--data-dir", default=None, help="keep the generated datasets there, to reuse them")
+    return parser
+
+
+@contextmanager
+def synthetic_log(n_lines: int, **kwargs):
+    """Write a synthetic failure log with `n_lines` lines in a temporary directory, yielding its path."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        log_file_path = os.path.join(tmp_dir, os.path.basename(LOG_FILE_PATH))
+        write_failure_log(log_file_path, n_lines, **kwargs)
+        yield log_file_path
+
+
+@contextmanager
+def datasets_directory(data_path: str = None):
+    """Yield `data_path`, or a temporary directory when not given, to generate the datasets in."""
+    if data_path:
+        yield data_path
+        return
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        yield tmp_dir
+
+
+def synthetic_dataset(data_path: str, n_lines: int, **kwargs) -> str:
+    """
+    Generate, unless already there, the dataset of `n_lines` log lines written with the options
+    `kwargs` of `write_dataset` under `data_path`, returning its absolute path.
+    """
+    name = "-".join([f"lines-{n_lines}"] + [f"{key.replace('_', '-')}-{value}" for key, value in kwargs.items()])
+    dataset_path = os.path.abspath(os.path.join(data_path, name))
+    if not os.path.exists(os.path.join(dataset_path, LOG_FILE_PATH)):
+        print(f"Generating a dataset with {n_lines:,} log lines...")
+        write_dataset(dataset_path, n_lines, **kwargs)
+    return dataset_path
@@ -0,0 +1,151 @@
+"""
+The aggregates every question is answered from: the failure count, the equipment, the distinct
+failure events and the failures per equipment sensor, or their sketches, and the telemetry
+partials, mergeable across log chunks. The pandas backend, the streaming and incremental analyses
+and the query service reduce the failures with the functions of this module.
+"""
+
+from functools import reduce
+
+import pandas as pd
+from data.instrumentation import stage
+from data.process_raw_data import EQUIPMENT_COLUMNS
+from data.sketches import DEFAULT_COUNT_ERROR, DEFAULT_DISTINCT_ERROR, HyperLogLog, SpaceSaving
+from data.telemetry import TelemetryPartials
+
+EVENT_COLUMNS = ["equipment_id", "timestamp"]
+SENSOR_COLUMNS = ["equipment_id", "sensor_id"]
+READINGS_COLUMNS = ["equipment_id", "sensor_id", "timestamp", "temperature", "vibration"]
+
+
+def failure_events(equipment_failures: pd.DataFrame) -> pd.DataFrame:
+    """The distinct (equipment, timestamp) failure events, with the equipment name and group."""
+    with stage("failure_events", rows_in=len(equipment_failures)) as rows:
+        events = equipment_failures \
+            .drop_duplicates(subset=EVENT_COLUMNS)[EQUIPMENT_COLUMNS + ["timestamp"]]
+        rows["rows_out"] = len(events)
+    return events
+
+
+def sensor_failure_counts(equipment_failures: pd.DataFrame) -> pd.Series:
+    """The number of failures of every equipment sensor."""
+    with stage("sensor_failures", rows_in=len(equipment_failures)) as rows:
+        sensor_failures = equipment_failures.groupby(SENSOR_COLUMNS).size()
+        rows["rows_out"] = len(sensor_failures)
+    return sensor_failures
+
+
+def failure_sketches(distinct_error: float = DEFAULT_DISTINCT_ERROR, count_error: float = DEFAULT_COUNT_ERROR) -> dict:
+    """
+    The empty sketches of the approximate analysis: a HyperLogLog of the failure events of every
+    equipment, with a relative standard error of `distinct_error`, and a Space-Saving summary of
+    the failures of its sensors, overestimating them by about `count_error` of its failures.
+    """
+    return {
+        "event_sketch": HyperLogLog.from_error(distinct_error),
+        "sensor_sketch": SpaceSaving.from_error(count_error),
+    }
+
+
+def telemetry_partials(readings: pd.DataFrame) -> TelemetryPartials:
+    """The mergeable statistics of the readings of failures per equipment sensor, see `TelemetryPartials`."""
+    with stage("telemetry_partials", rows_in=len(readings)) as rows:
+        partials = TelemetryPartials.from_readings(readings, SENSOR_COLUMNS)
+        rows["rows_out"] = len(partials)
+    return partials
+
+
+def _sketch_failures(equipment_failures: pd.DataFrame, sketches: dict) -> dict:
+    """Add the failure events and the failures per sensor of equipment failures to the sketches."""
+    with stage("sketch_failures", rows_in=len(equipment_failures)):
+        return {
+            "event_sketch": sketches["event_sketch"].add(
+                equipment_failures["equipment_id"].to_numpy(), equipment_failures["timestamp"].to_numpy()
+            ),
+            "sensor_sketch": sketches["sensor_sketch"].add(sensor_failure_counts(equipment_failures)),
+        }
+
+
+def aggregate_failures(equipment_failures: pd.DataFrame, telemetry: bool = False, sketches: dict = None) -> dict:
+    """
+    Reduce equipment failures to the small tables every question is answered from.
+
+    The failures are scanned twice: once for the distinct (equipment, timestamp) failure events
+    and once for the failures per equipment sensor. With `telemetry`, the readings of the
+    failures are reduced to their `telemetry_partials` too. With the empty `sketches` of
+    `failure_sketches`, the events and the failures per sensor are sketched instead, in memory
+    that does not grow with the failures. The aggregates are mergeable across log chunks with `merge_aggregates`.
+    """
+    with stage("aggregate", rows_in=len(equipment_failures)):
+        if sketches is not None:
+            aggregates = {
+                "failures": equipment_failures.shape[0],
+                "equipment": equipment_failures[EQUIPMENT_COLUMNS].drop_duplicates(),
+                **_sketch_failures(equipment_failures, sketches),
+            }
+            if telemetry:
+                aggregates["telemetry"] = telemetry_partials(equipment_failures[READINGS_COLUMNS])
+            return aggregates
+
+        events = failure_events(equipment_failures)
+
+        aggregates = {
+            "failures": equipment_failures.shape[0],
+            "equipment": events[EQUIPMENT_COLUMNS].drop_duplicates(),
+            "events": events[EVENT_COLUMNS],
+            "sensor_failures": sensor_failure_counts(equipment_failures),
+        }
+        if telemetry:
+            aggregates["telemetry"] = telemetry_partials(equipment_failures[READINGS_COLUMNS])
+        return aggregates
+
+
+def merge_aggregates(parts: list) -> dict:
+    """Merge the aggregates of some log chunks, deduplicating the events of all of them at once."""
+    with stage("merge_aggregates"):
+        merged = {
+            "failures": sum(part["failures"] for part in parts),
+            "equipment": pd.concat([part["equipment"] for part in parts]).drop_duplicates(),
+        }
+        if "event_sketch" in parts[0]:
+            merged["event_sketch"] = reduce(lambda a, b: a.merge(b), [part["event_sketch"] for part in parts])
+            merged["sensor_sketch"] = reduce(lambda a, b: a.merge(b), [part["sensor_sketch"] for part in parts])
+        else:
+            merged["events"] = pd.concat([part["events"] for part in parts]).drop_duplicates()
+            merged["sensor_failures"] = pd.concat([part["sensor_failures"] for part in parts]) \
+                .groupby(level=SENSOR_COLUMNS) \
+                .sum()
+        if "telemetry" in parts[0]:
+            merged["telemetry"] = parts[0]["telemetry"].merge(*[part["telemetry"] for part in parts[1:]])
+        return merged
+
+
+def _aggregates_rows(aggregates: dict) -> int:
+    """The number of rows of the aggregates that grow with the failures, the ones deduplicated by a merge."""
+    return sum(len(aggregates[name]) for name in ("events", "sensor_failures", "sensor_events", "sensor_days", "telemetry") if name in aggregates)
+
+
+def fold_partials(aggregates: dict, partials, merge=merge_aggregates, rows=_aggregates_rows) -> dict:
+    """
+    Fold the partial aggregates of log chunks into `aggregates`, None for none yet, with `merge`,
+    which merges a list of aggregates.
+
+    The partials are merged in batches, once they have as many `rows` as the running aggregates,
+    instead of one by one, so the running aggregates are deduplicated again only when they have
+    doubled, and the cost of the fold grows linearly with the chunks instead of quadratically.
+    Partials without failures, such as the ones of chunks of duplicated failures only, are only
+    kept when there is nothing else to return.
+    """
+    pending, empty = [], None
+    for partial in partials:
+        if partial["failures"] == 0:
+            empty = partial
+            continue
+        pending.append(partial)
+        if aggregates is None or sum(rows(part) for part in pending) >= rows(aggregates):
+            aggregates = merge(pending if aggregates is None else [aggregates] + pending)
+            pending = []
+
+    if pending:
+        aggregates = merge([aggregates] + pending)
+    return empty if aggregates is None else aggregates
@@ -0,0 +1,273 @@
+"""
+Execution backends of the join of the log with the equipment and of the aggregations the
+questions are answered from.
+
+The log is parsed into a pandas DataFrame as in `process_data`; a backend then joins its ERROR
+rows with the equipment of their sensors, drops the duplicated failures, and reduces them to the
+aggregates of `aggregate_failures`: the failure count, the equipment, the distinct failure
+events and the failures per equipment sensor, as pandas objects. The questions are answered
+from these small aggregates the same way whatever the backend, so all backends give identical
+results.
+
+- pandas: the reference implementation, single-threaded;
+- arrow: pyarrow's Acero engine, a hash join and hash aggregations on all the CPUs;
+- polars: Polars' multi-threaded engine, when the polars package is installed;
+- spark: PySpark in local mode, on all the CPUs, when the pyspark package and Java are installed.
+"""
+
+import importlib.util
+import os
+import shutil
+import sys
+from abc import ABC, abstractmethod
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from data.aggregates import EVENT_COLUMNS, READINGS_COLUMNS, SENSOR_COLUMNS, aggregate_failures, telemetry_partials
+from data.instrumentation import stage
+from data.process_raw_data import (
+    EQUIPMENT_COLUMNS,
+    FAILURE_COLUMNS,
+    LOG_FILE_PATH,
+    TAR_FILE_PATH,
+    failure_key_columns,
+    failure_scan_columns,
+    get_equipment_lookup,
+    get_log_dataframe,
+    join_equipment_failures,
+)
+
+DEFAULT_BACKEND = "pandas"
+SPARK_MASTER = "local[*]"
+# The failure columns the backends keep: all of them but the status, which they filter on.
+BACKEND_COLUMNS = [column for column in FAILURE_COLUMNS if column != "status"]
+
+
+def _equipment_sensors(equipment_lookup: tuple) -> pd.DataFrame:
+    """The table of the sensors with the id, name and group of their equipment, from `get_equipment_lookup`."""
+    equipment, sensor_lookup = equipment_lookup
+    sensor_ids = np.flatnonzero(sensor_lookup >= 0)
+    return equipment[EQUIPMENT_COLUMNS] \
+        .take(sensor_lookup[sensor_ids]) \
+        .astype({"equipment_name": str, "equipment_group": str}) \
+        .assign(sensor_id=sensor_ids) \
+        .reset_index(drop=True)
+
+
+def _key_columns(status: str, log_columns: list) -> list:
+    """The columns of `failure_key_columns` the joined failures are deduplicated on, the status only if the log has it."""
+    return [column for column in failure_key_columns(status) if column != "status" or column in log_columns]
+
+
+class Backend(ABC):
+    """
+    An execution backend: `join` turns the parsed log into the distinct equipment failures, in
+    the backend's own frame type, and `aggregate` reduces them to the aggregates of
+    `aggregate_failures`. The backends implement both.
+    """
+
+    name = None
+    requires = []
+    requirements = None
+
+    @classmethod
+    def is_available(cls) -> bool:
+        """Whether the packages the backend requires are installed."""
+        return all(importlib.util.find_spec(package) is not None for package in cls.requires)
+
+    @abstractmethod
+    def join(self, equipment_lookup: tuple, log: pd.DataFrame, status: str = "ERROR"):
+        """Join the log rows with `status` with the equipment of their sensors, dropping the duplicated failures."""
+
+    @abstractmethod
+    def aggregate(self, equipment_failures, telemetry: bool = False) -> dict:
+        """Reduce the equipment failures to the aggregates of `aggregate_failures`, with the telemetry partials with `telemetry`."""
+
+    def process_data(self, workers: int = 1, from_archive: bool = False, use_cache: bool = False):
+        """Parse the log as `process_data` does, by `workers` processes, and join it with the backend."""
+        print("Loading data...")
+        equipment_lookup = get_equipment_lookup()
+        log_columns, _ = failure_scan_columns(BACKEND_COLUMNS)
+        log = get_log_dataframe(
+            LOG_FILE_PATH,
+            engine="mmap",
+            workers=workers,
+            status="ERROR",
+            archive_path=TAR_FILE_PATH if from_archive else None,
+            use_cache=use_cache,
+            columns=log_columns,
+        )
+
+        print(f"Processing data with the {self.name} backend...")
+        with stage(f"{self.name}_join", rows_in=len(log)):
+            return self.join(equipment_lookup, log)
+
+
+class PandasBackend(Backend):
+    """The pandas implementation of `join_equipment_failures` and `aggregate_failures`."""
+
+    name = "pandas"
+    requires = ["pandas"]
+
+    def join(self, equipment_lookup: tuple, log: pd.DataFrame, status: str = "ERROR") -> pd.DataFrame:
+        return join_equipment_failures(equipment_lookup, log, BACKEND_COLUMNS, status)
+
+    def aggregate(self, equipment_failures: pd.DataFrame, telemetry: bool = False) -> dict:
+        return aggregate_failures(equipment_failures, telemetry)
+
+
+class ArrowBackend(Backend):
+    """The failures as a pyarrow Table, joined and aggregated by Acero on all the CPUs."""
+
+    name = "arrow"
+    requires = ["pyarrow"]
+
+    def join(self, equipment_lookup: tuple, log: pd.DataFrame, status: str = "ERROR") -> pa.Table:
+        log = pa.Table.from_pandas(log, preserve_index=False)
+        if status is not None and "status" in log.column_names:
+            log = log.filter(pc.equal(log["status"], status))
+        sensors = pa.Table.from_pandas(_equipment_sensors(equipment_lookup), preserve_index=False)
+        key_columns = _key_columns(status, log.column_names)
+
+        # The hash join and the distinct groups come out in no particular order.
+        return log \
+            .join(sensors, "sensor_id", join_type="inner") \
+            .group_by(key_columns + ["equipment_name", "equipment_group"]) \
+            .aggregate([]) \
+            .select(BACKEND_COLUMNS)
+
+    def aggregate(self, equipment_failures: pa.Table, telemetry: bool = False) -> dict:
+        sensor_failures = equipment_failures \
+            .group_by(SENSOR_COLUMNS) \
+            .aggregate([([], "count_all")]) \
+            .to_pandas()
+        aggregates = {
+            "failures": equipment_failures.num_rows,
+            "equipment": equipment_failures.group_by(EQUIPMENT_COLUMNS).aggregate([]).to_pandas(),
+            "events": equipment_failures.group_by(EVENT_COLUMNS).aggregate([]).to_pandas(),
+            "sensor_failures": sensor_failures.set_index(SENSOR_COLUMNS)["count_all"].sort_index(),
+        }
+        if telemetry:
+            aggregates["telemetry"] = telemetry_partials(equipment_failures.select(READINGS_COLUMNS).to_pandas())
+        return aggregates
+
+
+class PolarsBackend(Backend):
+    """The failures as a Polars DataFrame, joined and aggregated by Polars on all the CPUs."""
+
+    name = "polars"
+    requires = ["polars"]
+    requirements = "the polars package"
+
+    def join(self, equipment_lookup: tuple, log: pd.DataFrame, status: str = "ERROR"):
+        import polars as pl
+
+        log = pl.from_pandas(log)
+        if status is not None and "status" in log.columns:
+            log = log.filter(pl.col("status") == status)
+        sensors = pl.from_pandas(_equipment_sensors(equipment_lookup))
+        key_columns = _key_columns(status, log.columns)
+
+        return log \
+            .join(sensors, on="sensor_id", how="inner") \
+            .unique(subset=key_columns) \
+            .select(BACKEND_COLUMNS)
+
+    def aggregate(self, equipment_failures, telemetry: bool = False) -> dict:
+        sensor_failures = equipment_failures.group_by(SENSOR_COLUMNS).len().to_pandas()
+        aggregates = {
+            "failures": equipment_failures.height,
+            "equipment": equipment_failures.select(EQUIPMENT_COLUMNS).unique().to_pandas(),
+            "events": equipment_failures.select(EVENT_COLUMNS).unique().to_pandas(),
+            "sensor_failures": sensor_failures.set_index(SENSOR_COLUMNS)["len"].sort_index(),
+        }
+        if telemetry:
+            aggregates["telemetry"] = telemetry_partials(equipment_failures.select(READINGS_COLUMNS).to_pandas())
+        return aggregates
+
+
+class SparkBackend(Backend):
+    """
+    The failures as a Spark DataFrame, joined and aggregated by PySpark in local mode on all the
+    CPUs. The sensors are broadcast to the join, and the session uses UTC, as the log does. The
+    join is lazy: it runs when the aggregates are collected, in the time of the aggregate stage.
+    """
+
+    name = "spark"
+    requires = ["pyspark"]
+    requirements = "the pyspark package and Java"
+
+    @classmethod
+    def is_available(cls) -> bool:
+        return super().is_available() and (shutil.which("java") is not None or "JAVA_HOME" in os.environ)
+
+    def _session(self):
+        from pyspark.sql import SparkSession
+
+        # The local workers run the Python of the driver, and Arrow needs the Netty reflection
+        # access Java 11 and later deny by default.
+        os.environ.setdefault("PYSPARK_PYTHON", sys.executable)
+        return SparkSession.builder \
+            .master(SPARK_MASTER) \
+            .appName("equipment-failures") \
+            .config("spark.driver.extraJavaOptions", "-Dio.netty.tryReflectionSetAccessible=true") \
+            .config("spark.ui.showConsoleProgress", "false") \
+            .config("spark.sql.session.timeZone", "UTC") \
+            .config("spark.sql.execution.arrow.pyspark.enabled", "true") \
+            .getOrCreate()
+
+    def join(self, equipment_lookup: tuple, log: pd.DataFrame, status: str = "ERROR"):
+        from pyspark.sql import functions as F
+
+        spark = self._session()
+        log = spark.createDataFrame(log)
+        if status is not None and "status" in log.columns:
+            log = log.filter(F.col("status") == status)
+        sensors = spark.createDataFrame(_equipment_sensors(equipment_lookup))
+        key_columns = _key_columns(status, log.columns)
+
+        return log \
+            .join(F.broadcast(sensors), on="sensor_id", how="inner") \
+            .dropDuplicates(key_columns) \
+            .select(BACKEND_COLUMNS) \
+            .cache()
+
+    @staticmethod
+    def _to_pandas(frame) -> pd.DataFrame:
+        """A Spark DataFrame as a pandas one, with the nanosecond timestamps of the parsed log."""
+        frame = frame.toPandas()
+        if "timestamp" in frame.columns:
+            frame["timestamp"] = frame["timestamp"].astype("datetime64[ns]")
+        return frame
+
+    def aggregate(self, equipment_failures, telemetry: bool = False) -> dict:
+        sensor_failures = equipment_failures.groupBy(SENSOR_COLUMNS).count().toPandas()
+        aggregates = {
+            "failures": equipment_failures.count(),
+            "equipment": equipment_failures.select(EQUIPMENT_COLUMNS).distinct().toPandas(),
+            "events": self._to_pandas(equipment_failures.select(EVENT_COLUMNS).distinct()),
+            "sensor_failures": sensor_failures.set_index(SENSOR_COLUMNS)["count"].sort_index(),
+        }
+        if telemetry:
+            aggregates["telemetry"] = telemetry_partials(self._to_pandas(equipment_failures.select(READINGS_COLUMNS)))
+        equipment_failures.unpersist()
+        return aggregates
+
+
+BACKENDS = {backend.name: backend for backend in [PandasBackend, ArrowBackend, PolarsBackend, SparkBackend]}
+
+
+def available_backends() -> list:
+    """The names of the backends whose packages are installed."""
+    return [name for name, backend in BACKENDS.items() if backend.is_available()]
+
+
+def get_backend(name: str = DEFAULT_BACKEND) -> Backend:
+    """The backend of a name, raising a ValueError for unknown or not installed ones."""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend {name!r}, choose one of {list(BACKENDS)}")
+    if not BACKENDS[name].is_available():
+        raise ValueError(f"The {name} backend needs {BACKENDS[name].requirements} to be installed")
+    return BACKENDS[name]()
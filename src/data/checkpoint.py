@@ -0,0 +1,115 @@
+"""Checkpoint of the incremental analysis: how far the log was read and the running aggregates."""
+
+import hashlib
+import json
+import os
+import shutil
+
+import pandas as pd
+from data.data_cache import input_digests, replace_directory, restore_directory
+
+CHECKPOINT_PATH = "data/checkpoint"
+FINGERPRINT_SIZE = 64 * 1024
+# Version of the layout of the checkpoint files, raised when it changes.
+CHECKPOINT_FORMAT = 3
+
+
+def log_fingerprint(log_file_path: str, offset: int) -> str:
+    """Hash the first bytes of the log and the bytes just before `offset`, to detect rewritten logs."""
+    digest = hashlib.sha256(str(offset).encode())
+    with open(log_file_path, "rb") as f:
+        digest.update(f.read(min(offset, FINGERPRINT_SIZE)))
+        f.seek(max(0, offset - FINGERPRINT_SIZE))
+        digest.update(f.read(min(offset, FINGERPRINT_SIZE)))
+    return digest.hexdigest()
+
+
+def load_checkpoint(
+    log_file_path: str,
+    checkpoint_path: str = CHECKPOINT_PATH,
+    input_paths: list = (),
+    version: str = None,
+) -> tuple:
+    """
+    Load the byte offset reached in the log and the aggregates of the bytes before it.
+
+    Returns `(0, None)` when there is no checkpoint, or when it was taken on another log, on a
+    log that was not only appended to since, with other contents of the `input_paths`, such as
+    the equipment files, or with another `version` of the code producing the aggregates.
+    """
+    restore_directory(checkpoint_path)
+    metadata_path = os.path.join(checkpoint_path, "checkpoint.json")
+    if not os.path.exists(metadata_path):
+        return 0, None
+
+    with open(metadata_path, "r") as f:
+        metadata = json.load(f)
+
+    offset = metadata["offset"]
+    if (
+        metadata["log_file_path"] != log_file_path
+        or os.path.getsize(log_file_path) < offset
+        or log_fingerprint(log_file_path, offset) != metadata["fingerprint"]
+    ):
+        print("Checkpoint does not match the log, processing it from the start")
+        return 0, None
+    if (
+        metadata.get("format") != CHECKPOINT_FORMAT
+        or metadata.get("version") != version
+        or metadata.get("inputs") != input_digests(input_paths)
+    ):
+        print("Checkpoint was taken with other input files or code, processing the log from the start")
+        return 0, None
+
+    aggregates = dict(metadata["scalars"])
+    for name in metadata["frames"]:
+        aggregates[name] = pd.read_parquet(os.path.join(checkpoint_path, f"{name}.parquet"))
+    for name in metadata["series"]:
+        aggregates[name] = pd.read_parquet(os.path.join(checkpoint_path, f"{name}.parquet")).iloc[:, 0]
+
+    return offset, aggregates
+
+
+def save_checkpoint(
+    log_file_path: str,
+    offset: int,
+    aggregates: dict,
+    checkpoint_path: str = CHECKPOINT_PATH,
+    input_paths: list = (),
+    version: str = None,
+) -> None:
+    """
+    Persist the byte offset reached in the log with its aggregates. The new checkpoint is written
+    next to the previous one, which it replaces once complete (see `replace_directory`), so a
+    crash never leaves no checkpoint. The digests of the `input_paths` and the `version` of the
+    code are recorded, see `load_checkpoint`.
+    """
+    new_checkpoint_path = f"{checkpoint_path}.new"
+    shutil.rmtree(new_checkpoint_path, ignore_errors=True)
+    os.makedirs(new_checkpoint_path)
+
+    metadata = {
+        "log_file_path": log_file_path,
+        "offset": offset,
+        "fingerprint": log_fingerprint(log_file_path, offset),
+        "format": CHECKPOINT_FORMAT,
+        "version": version,
+        "inputs": input_digests(input_paths),
+        "scalars": {},
+        "frames": [],
+        "series": [],
+    }
+    for name, value in aggregates.items():
+        if isinstance(value, pd.DataFrame):
+            value.to_parquet(os.path.join(new_checkpoint_path, f"{name}.parquet"))
+            metadata["frames"].append(name)
+        elif isinstance(value, pd.Series):
+            value.to_frame().to_parquet(os.path.join(new_checkpoint_path, f"{name}.parquet"))
+            metadata["series"].append(name)
+        else:
+            metadata["scalars"][name] = value
+
+    with open(os.path.join(new_checkpoint_path, "checkpoint.json"), "w") as f:
+        json.dump(metadata, f, indent=4)
+
+    replace_directory(new_checkpoint_path, checkpoint_path)
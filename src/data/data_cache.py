@@ -0,0 +1,177 @@
+"""Content addressed cache of the parsed and joined data, kept as Arrow snapshots on disk."""
+
+import hashlib
+import json
+import os
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+from data.instrumentation import stage
+
+CACHE_PATH = "data/cache"
+MAX_CACHE_SIZE = 2 * 1024 ** 3
+HASH_BLOCK_SIZE = 4 * 1024 ** 2
+DIGESTS_FILE_NAME = "digests.json"
+SNAPSHOT_SUFFIX = ".arrow"
+
+
+def _write_atomically(path: str, write) -> None:
+    """Call `write` on a temporary path next to `path`, then rename it over `path`."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def replace_directory(new_path: str, path: str) -> None:
+    """
+    Replace the directory `path` with the complete directory `new_path`: the old directory is
+    renamed aside to `{path}.old`, the new one renamed in, then the old one removed. A crash in
+    between leaves the old directory aside, which `restore_directory` renames back.
+    """
+    old_path = f"{path}.old"
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.rename(path, old_path)
+    os.rename(new_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def restore_directory(path: str) -> None:
+    """Rename back the directory a `replace_directory` interrupted by a crash left aside, if any."""
+    old_path = f"{path}.old"
+    if not os.path.exists(path) and os.path.exists(old_path):
+        os.rename(old_path, path)
+
+
+def file_digest(file_path: str, cache_path: str = CACHE_PATH) -> str:
+    """
+    Hash the content of an input file.
+
+    The digests are remembered with the size and modification time of the files, so an input
+    that was not modified since is not read again.
+    """
+    digests_path = os.path.join(cache_path, DIGESTS_FILE_NAME)
+    digests = {}
+    if os.path.exists(digests_path):
+        with open(digests_path, "r") as f:
+            digests = json.load(f)
+
+    stat = os.stat(file_path)
+    real_path = os.path.realpath(file_path)
+    size, mtime_ns, digest = digests.get(real_path, (None, None, None))
+    if (size, mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+        return digest
+
+    print(f"Hashing {file_path}...")
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while block := f.read(HASH_BLOCK_SIZE):
+            sha256.update(block)
+
+    digests[real_path] = (stat.st_size, stat.st_mtime_ns, sha256.hexdigest())
+    os.makedirs(cache_path, exist_ok=True)
+
+    def write_digests(path):
+        with open(path, "w") as f:
+            json.dump(digests, f, indent=4)
+
+    _write_atomically(digests_path, write_digests)
+    return sha256.hexdigest()
+
+
+def input_digests(input_paths: list, cache_path: str = CACHE_PATH) -> dict:
+    """The size and content digest of every input file, by path, to tell when data derived from them is stale."""
+    return {path: [os.path.getsize(path), file_digest(path, cache_path)] for path in input_paths}
+
+
+def code_version(*source_paths: str) -> str:
+    """Hash the source files producing the cached data, with the versions of pandas and pyarrow."""
+    sha256 = hashlib.sha256(f"pandas {pd.__version__} pyarrow {pa.__version__}".encode())
+    for source_path in source_paths:
+        with open(source_path, "rb") as f:
+            sha256.update(f.read())
+    return sha256.hexdigest()
+
+
+def cache_key(name: str, input_paths: list, params: dict, version: str, cache_path: str = CACHE_PATH) -> str:
+    """Key of a cached output: its name and parameters, the size and digest of its inputs and the code version."""
+    inputs = [(os.path.getsize(path), file_digest(path, cache_path)) for path in input_paths]
+    key = json.dumps([name, params, inputs, version], sort_keys=True, default=str)
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def load_snapshot(key: str, cache_path: str = CACHE_PATH):
+    """Load the DataFrame cached with a key, or None when it is not cached, marking it as recently used."""
+    snapshot_path = os.path.join(cache_path, key + SNAPSHOT_SUFFIX)
+    try:
+        os.utime(snapshot_path)
+        return feather.read_table(snapshot_path, memory_map=True).to_pandas()
+    except FileNotFoundError:
+        return None
+
+
+def save_snapshot(key: str, df: pd.DataFrame, cache_path: str = CACHE_PATH, max_size: int = MAX_CACHE_SIZE) -> None:
+    """Write a DataFrame to the cache atomically, then evict the least recently used snapshots over `max_size`."""
+    os.makedirs(cache_path, exist_ok=True)
+    table = pa.Table.from_pandas(df)
+    _write_atomically(
+        os.path.join(cache_path, key + SNAPSHOT_SUFFIX),
+        lambda path: feather.write_feather(table, path, compression="uncompressed"),
+    )
+    evict_snapshots(cache_path, max_size)
+
+
+def evict_snapshots(cache_path: str = CACHE_PATH, max_size: int = MAX_CACHE_SIZE) -> None:
+    """Remove the least recently used snapshots until the cache takes at most `max_size` bytes."""
+    snapshots = []
+    with os.scandir(cache_path) as entries:
+        for entry in entries:
+            if entry.name.endswith(SNAPSHOT_SUFFIX):
+                stat = entry.stat()
+                snapshots.append((stat.st_mtime_ns, stat.st_size, entry.path))
+
+    total_size = sum(size for _, size, _ in snapshots)
+    for _, size, path in sorted(snapshots):
+        if total_size <= max_size:
+            break
+        print(f"Evicting cached snapshot {os.path.basename(path)}")
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total_size -= size
+
+
+def cached_dataframe(
+    name: str,
+    input_paths: list,
+    params: dict,
+    compute,
+    version: str,
+    cache_path: str = CACHE_PATH,
+    max_size: int = MAX_CACHE_SIZE,
+) -> pd.DataFrame:
+    """
+    Return the DataFrame computed by `compute()` from the input files, loading it from the cache
+    when the same inputs, parameters and code version were already computed.
+
+    A cache hit reads the Arrow snapshot only, without touching the inputs beyond their digests.
+    """
+    with stage("cache_lookup"):
+        key = cache_key(name, input_paths, params, version, cache_path)
+        df = load_snapshot(key, cache_path)
+
+    if df is not None:
+        print(f"Loaded {name} from the cache")
+        return df
+
+    df = compute()
+    with stage("cache_save", rows_in=len(df)):
+        save_snapshot(key, df, cache_path, max_size)
+    return df
@@ -1,5 +1,13 @@
+import io
 import os
+import queue
 import tarfile
+import threading
+from contextlib import contextmanager
+
+DEFAULT_BLOCK_SIZE = 4 * 1024 ** 2
+DEFAULT_PREFETCH_BLOCKS = 4
+
 
 def extract_tar_gz(tar_file_path: str, destination_path: str) -> bool:
     """Extract the content of a .tar.gz file to a destination directory."""
@@ -22,6 +30,122 @@ def extract_tar_gz(tar_file_path: str, destination_path: str) -> bool:
         return False
 
 
+class _PrefetchedStream(io.RawIOBase):
+    """Read only binary stream over the blocks put in a queue by a producer thread."""
+
+    def __init__(self, blocks: queue.Queue):
+        self._blocks = blocks
+        self._block = b""
+        self._position = 0
+        self._at_end = False
+
+    def readable(self) -> bool:
+        return True
+
+    def _next_block(self) -> bool:
+        """Wait for the next block once the current one is read, returning False at the end."""
+        if self._position < len(self._block):
+            return True
+        if self._at_end:
+            return False
+
+        block = self._blocks.get()
+        if isinstance(block, BaseException):
+            self._at_end = True
+            raise block
+        if not block:
+            self._at_end = True
+            return False
+
+        self._block, self._position = block, 0
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            return self.readall()
+        if not size or not self._next_block():
+            return b""
+
+        # Short reads are allowed, so the parsers get whole blocks without a copy.
+        if self._position == 0 and len(self._block) <= size:
+            self._position = len(self._block)
+            return self._block
+
+        data = self._block[self._position:self._position + size]
+        self._position += len(data)
+        return data
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        memoryview(buffer).cast("B")[:len(data)] = data
+        return len(data)
+
+
+def _put_block(blocks: queue.Queue, block, stop: threading.Event) -> bool:
+    """Put a block in the queue once it has room, unless the reader stops first. Returns whether it was put."""
+    while not stop.is_set():
+        try:
+            blocks.put(block, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _produce_blocks(member, blocks: queue.Queue, stop: threading.Event, block_size: int) -> None:
+    """
+    Read and decompress the member in blocks, until its end or until the reader stops. An error
+    is passed to the reader as a block, unless it stopped, so the producer never waits on a full
+    queue nobody reads.
+    """
+    try:
+        while not stop.is_set():
+            block = member.read(block_size)
+            if not _put_block(blocks, block, stop) or not block:
+                return
+    except BaseException as e:
+        _put_block(blocks, e, stop)
+
+
+@contextmanager
+def stream_tar_member(
+    tar_file_path: str,
+    member_name: str,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    prefetch_blocks: int = DEFAULT_PREFETCH_BLOCKS,
+):
+    """
+    Open a file of a .tar.gz archive as a binary stream, without extracting it to disk.
+
+    The member, found by its base name, is decompressed in blocks of `block_size` bytes by a
+    producer thread, which keeps up to `prefetch_blocks` blocks ahead of the reader, so the
+    decompression overlaps with the parsing of the blocks already read.
+    """
+    with tarfile.open(tar_file_path, "r|gz", bufsize=block_size) as tar:
+        member = next(
+            (info for info in tar if info.isfile() and os.path.basename(info.name) == os.path.basename(member_name)),
+            None,
+        )
+        if member is None:
+            raise FileNotFoundError(f"No file {member_name} in {tar_file_path}")
+
+        blocks = queue.Queue(maxsize=prefetch_blocks)
+        stop = threading.Event()
+        producer = threading.Thread(
+            target=_produce_blocks,
+            args=(tar.extractfile(member), blocks, stop, block_size),
+            daemon=True,
+        )
+        producer.start()
+
+        try:
+            with _PrefetchedStream(blocks) as stream:
+                yield stream
+        finally:
+            stop.set()
+            producer.join()
+
+
 def main():
     tar_file_path = "data/equipment_failure_sensors.tar.gz"
     destination_path = "data/extracted"
@@ -0,0 +1,209 @@
+"""SQLite database of the equipment failures, with ACID batch loads and indexed SQL queries."""
+
+import json
+import os
+import sqlite3
+from contextlib import closing
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from data.data_cache import input_digests
+from data.process_raw_data import (
+    DEFAULT_CHUNK_SIZE,
+    EQUIPMENT_FILE_PATH,
+    EQUIPMENT_FILE_PATHS,
+    EQUIPMENT_SENSORS_FILE_PATH,
+    LOG_FILE_PATH,
+    get_equipment_lookup,
+    iter_log_dataframes,
+    join_equipment_failures,
+    log_source_path,
+    processing_version,
+)
+
+DATABASE_PATH = "data/equipment_failures.db"
+
+# metadata records the digests of the input files and the version of the code the database was
+# written with, once it is complete.
+# failure_events keeps the equipment of the sensor next to the timestamp so that the failure
+# events of an equipment are a range of its unique index. That index also drops duplicated log
+# rows on insert, with err readings (NULL) compared as equal.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS equipment (
+    equipment_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    group_name TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS sensors (
+    sensor_id INTEGER PRIMARY KEY,
+    equipment_id INTEGER NOT NULL REFERENCES equipment (equipment_id)
+);
+
+CREATE TABLE IF NOT EXISTS failure_events (
+    equipment_id INTEGER NOT NULL REFERENCES equipment (equipment_id),
+    sensor_id INTEGER NOT NULL REFERENCES sensors (sensor_id),
+    timestamp TEXT NOT NULL,
+    date TEXT NOT NULL,
+    temperature REAL,
+    vibration REAL
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS failure_events_equipment_timestamp ON failure_events (
+    equipment_id, timestamp, sensor_id, IFNULL(temperature, 'err'), IFNULL(vibration, 'err')
+);
+CREATE INDEX IF NOT EXISTS failure_events_sensor ON failure_events (sensor_id);
+CREATE INDEX IF NOT EXISTS failure_events_date ON failure_events (date);
+"""
+
+INSERT_FAILURE_EVENTS = """
+INSERT OR IGNORE INTO failure_events (equipment_id, sensor_id, timestamp, date, temperature, vibration)
+VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+TOTALS_QUERY = """
+SELECT
+    (SELECT COUNT(*) FROM failure_events) AS failures,
+    (SELECT COUNT(*) FROM (SELECT DISTINCT equipment_id, timestamp FROM failure_events)) AS events
+"""
+
+EQUIPMENT_EVENTS_QUERY = """
+SELECT e.equipment_id, e.name AS equipment_name, e.group_name AS equipment_group, f.failures
+FROM equipment AS e
+JOIN (
+    SELECT equipment_id, COUNT(DISTINCT timestamp) AS failures
+    FROM failure_events
+    GROUP BY equipment_id
+) AS f USING (equipment_id)
+ORDER BY e.equipment_id
+"""
+
+TOP_SENSORS_QUERY = """
+SELECT e.equipment_id, e.name AS equipment_name, e.group_name AS equipment_group, r.sensor_id, r.failures
+FROM (
+    SELECT s.equipment_id, f.sensor_id, f.failures,
+        RANK() OVER (PARTITION BY s.equipment_id ORDER BY f.failures DESC) AS sensor_rank
+    FROM (
+        SELECT sensor_id, COUNT(*) AS failures
+        FROM failure_events
+        GROUP BY sensor_id
+    ) AS f
+    JOIN sensors AS s USING (sensor_id)
+) AS r
+JOIN equipment AS e USING (equipment_id)
+WHERE r.sensor_rank <= :top
+ORDER BY e.equipment_id, r.sensor_id
+"""
+
+
+def _failure_event_rows(equipment_failures: pd.DataFrame):
+    """Convert equipment failures to failure_events rows, formatting the timestamps as ISO text."""
+    timestamps = pa.array(equipment_failures["timestamp"])
+    return zip(
+        equipment_failures["equipment_id"].tolist(),
+        equipment_failures["sensor_id"].tolist(),
+        pc.strftime(timestamps, format="%Y-%m-%d %H:%M:%S").to_pylist(),
+        pc.strftime(timestamps, format="%Y-%m-%d").to_pylist(),
+        equipment_failures["temperature"].tolist(),
+        equipment_failures["vibration"].tolist(),
+    )
+
+
+def _database_metadata(log_file_path: str) -> dict:
+    """The metadata rows of the database: the digests of its input files and the version of the code writing it."""
+    inputs = input_digests(EQUIPMENT_FILE_PATHS + [log_source_path(log_file_path)])
+    return {"inputs": json.dumps(inputs, sort_keys=True), "version": processing_version(__file__)}
+
+
+def is_failure_database_current(database_path: str = DATABASE_PATH, log_file_path: str = LOG_FILE_PATH) -> bool:
+    """Whether the database was completely written from the current log and equipment files, by the current code."""
+    if not os.path.exists(database_path):
+        return False
+
+    with closing(sqlite3.connect(database_path)) as connection:
+        try:
+            metadata = dict(connection.execute("SELECT key, value FROM metadata"))
+        except sqlite3.OperationalError:
+            # A database written before the metadata table existed.
+            return False
+    return metadata == _database_metadata(log_file_path)
+
+
+def write_failure_database(
+    database_path: str = DATABASE_PATH,
+    log_file_path: str = LOG_FILE_PATH,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> None:
+    """
+    Load the equipment, the sensors and the log ERROR rows into the database.
+
+    Every log chunk is inserted in its own transaction, so an interrupted load keeps whole
+    chunks only. Loading the same log again inserts nothing new. The metadata of
+    `is_failure_database_current` is cleared first and recorded once the load is complete.
+    """
+    print(f"Writing failure database to: {database_path}")
+    metadata = _database_metadata(log_file_path)
+    equipment = pd.read_json(EQUIPMENT_FILE_PATH)
+    equipment_sensors = pd.read_csv(EQUIPMENT_SENSORS_FILE_PATH).drop_duplicates()
+    equipment_lookup = get_equipment_lookup()
+
+    with closing(sqlite3.connect(database_path)) as connection:
+        connection.executescript(SCHEMA)
+
+        with connection:
+            connection.execute("DELETE FROM metadata")
+            connection.executemany(
+                "INSERT OR REPLACE INTO equipment (equipment_id, name, group_name) VALUES (?, ?, ?)",
+                equipment[["equipment_id", "name", "group_name"]].itertuples(index=False),
+            )
+            connection.executemany(
+                "INSERT OR REPLACE INTO sensors (sensor_id, equipment_id) VALUES (?, ?)",
+                equipment_sensors[["sensor_id", "equipment_id"]].itertuples(index=False),
+            )
+
+        for log in iter_log_dataframes(log_file_path, chunk_size, status="ERROR"):
+            equipment_failures = join_equipment_failures(equipment_lookup, log)
+            with connection:
+                connection.executemany(INSERT_FAILURE_EVENTS, _failure_event_rows(equipment_failures))
+
+        with connection:
+            connection.executemany("INSERT INTO metadata (key, value) VALUES (?, ?)", metadata.items())
+
+    print("Failure database written successfully!")
+
+
+def query_failure_aggregates(database_path: str = DATABASE_PATH, top: int = 3) -> tuple:
+    """
+    Query the failure and failure event totals, the failure events per equipment and the `top`
+    sensors with most failures of each equipment, with the sensors tied with the last one.
+
+    The database is written from the log when it does not exist yet, and written again from
+    scratch when the log, the equipment files or the code writing it changed since.
+    """
+    if not is_failure_database_current(database_path):
+        if os.path.exists(database_path):
+            print("The failure database is out of date with its input files, writing it again")
+            os.remove(database_path)
+        write_failure_database(database_path)
+
+    print("Querying the failure database...")
+    with closing(sqlite3.connect(database_path)) as connection:
+        failures, events = connection.execute(TOTALS_QUERY).fetchone()
+        equipment_events = pd.read_sql_query(EQUIPMENT_EVENTS_QUERY, connection)
+        top_sensors = pd.read_sql_query(TOP_SENSORS_QUERY, connection, params={"top": top})
+
+    return failures, events, equipment_events, top_sensors
+
+
+def main():
+    write_failure_database()
+
+
+if __name__ == "__main__":
+    main()
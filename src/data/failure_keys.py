@@ -0,0 +1,72 @@
+"""
+The keys of the distinct failures seen across log chunks, so a failure duplicated in two chunks,
+or in two runs of the incremental analysis, is counted once, as the whole log analysis does.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def key_hashes(keys: pd.DataFrame) -> np.ndarray:
+    """
+    The 64-bit hashes of the rows of `keys`, equal for the rows `drop_duplicates` finds equal:
+    -0.0 and 0.0 hash alike, as do the missing readings.
+    """
+    floats = keys.select_dtypes("floating").columns
+    keys = keys.assign(**{column: keys[column] + 0.0 for column in floats})
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy()
+
+
+class FailureKeys():
+    """
+    The hashes of the keys of the distinct failures seen, as sorted runs.
+
+    A new run is merged with the previous one while it is as large, so the runs at least double
+    in size from the newest to the oldest: adding the hashes of n failures costs O(n log n) in
+    all, and looking one up a binary search in each of the O(log n) runs. The keys take 8 bytes
+    per distinct failure. Two distinct keys share a hash with a probability of about
+    n ** 2 / 2 ** 65, under one in a million for ten million failures.
+
+    The runs are never modified in place, so a `copy` is cheap and left unchanged by `drop_seen`.
+    """
+
+    def __init__(self, hashes: np.ndarray = None):
+        self.runs = [] if hashes is None or not len(hashes) else [np.sort(np.asarray(hashes, dtype="uint64"))]
+
+    def __len__(self) -> int:
+        return sum(len(run) for run in self.runs)
+
+    def copy(self) -> "FailureKeys":
+        """The keys seen so far, which adding keys to this object leaves unchanged."""
+        keys = FailureKeys()
+        keys.runs = list(self.runs)
+        return keys
+
+    def hashes(self) -> pd.Series:
+        """The sorted hashes of all the keys, as a Series to checkpoint them."""
+        if not self.runs:
+            return pd.Series([], dtype="uint64", name="hash")
+        return pd.Series(np.sort(np.concatenate(self.runs), kind="stable"), name="hash")
+
+    def drop_seen(self, failures: pd.DataFrame, key_columns: list) -> pd.DataFrame:
+        """
+        The failures whose `key_columns` were not seen yet, adding their keys. The failures must
+        be distinct on the key columns already.
+        """
+        hashes = key_hashes(failures[key_columns])
+        is_new = np.ones(len(hashes), dtype=bool)
+        for run in self.runs:
+            positions = np.minimum(np.searchsorted(run, hashes), len(run) - 1)
+            is_new &= run[positions] != hashes
+
+        self._add_run(np.sort(hashes[is_new]))
+        return failures if is_new.all() else failures[is_new]
+
+    def _add_run(self, run: np.ndarray) -> None:
+        """Add a sorted run of new hashes, merging the newest runs while the newer is as large."""
+        if not len(run):
+            return
+        self.runs.append(run)
+        while len(self.runs) > 1 and len(self.runs[-2]) <= len(self.runs[-1]):
+            newer = self.runs.pop()
+            self.runs[-1] = np.sort(np.concatenate([self.runs[-1], newer]), kind="stable")
@@ -0,0 +1,221 @@
+"""
+Columnar Parquet store of the equipment failures, partitioned by date and equipment group.
+
+The store records the digests of the log and equipment files it was written from, and is
+written again when they change.
+
+Write it from the repository root:
+    PYTHONPATH=src python -m data.failure_store
+"""
+
+import argparse
+import json
+import operator
+import os
+import shutil
+from functools import reduce
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from data.data_cache import input_digests, replace_directory, restore_directory
+from data.process_raw_data import (
+    DEFAULT_CHUNK_SIZE,
+    EQUIPMENT_COLUMN_NAMES,
+    EQUIPMENT_FILE_PATHS,
+    FAILURE_COLUMNS,
+    LOG_FILE_PATH,
+    get_equipment_sensors,
+    iter_log_dataframes,
+    log_source_path,
+    processing_version,
+)
+
+FAILURE_STORE_PATH = "data/failure_store"
+STORE_PARTITIONING = ds.partitioning(
+    pa.schema([("date", pa.date32()), ("equipment_group", pa.string())]),
+    flavor="hive",
+)
+# Rows are sorted inside each partition so the row group statistics of these columns are tight.
+SORT_COLUMNS = ["equipment_id", "timestamp", "sensor_id"]
+DICTIONARY_COLUMNS = ["equipment_id", "equipment_name", "sensor_id", "status"]
+ROW_GROUP_SIZE = 128 * 1024
+MAX_PARTITIONS = 64 * 1024
+# Parquet datasets skip the files starting with an underscore, so the metadata is not read as data.
+STORE_METADATA_FILE_NAME = "_store.json"
+
+
+def _store_metadata(log_file_path: str) -> dict:
+    """The digests of the log and equipment files the store is written from, and the version of the code writing it."""
+    return {
+        "inputs": input_digests(EQUIPMENT_FILE_PATHS + [log_source_path(log_file_path)]),
+        "version": processing_version(__file__),
+    }
+
+
+def is_failure_store_current(store_path: str = FAILURE_STORE_PATH, log_file_path: str = LOG_FILE_PATH) -> bool:
+    """Whether the store exists and was written from the current log and equipment files, by the current code."""
+    restore_directory(store_path)
+    metadata_path = os.path.join(store_path, STORE_METADATA_FILE_NAME)
+    if not os.path.exists(metadata_path):
+        return False
+
+    with open(metadata_path, "r") as f:
+        return json.load(f) == _store_metadata(log_file_path)
+
+
+def _write_staging(staging_path: str, log_file_path: str, chunk_size: int) -> None:
+    """Join the log chunks with the equipment sensors and write them to the staging partitions."""
+    equipment_sensors = get_equipment_sensors().rename(columns=EQUIPMENT_COLUMN_NAMES)
+
+    for index, log in enumerate(iter_log_dataframes(log_file_path, chunk_size)):
+        failures = equipment_sensors.merge(log, on="sensor_id")[FAILURE_COLUMNS]
+        table = pa.Table.from_pandas(failures, preserve_index=False)
+        table = table.append_column("date", pc.cast(table["timestamp"], pa.date32()))
+
+        ds.write_dataset(
+            table,
+            staging_path,
+            format="parquet",
+            partitioning=STORE_PARTITIONING,
+            basename_template=f"chunk-{index}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+            max_partitions=MAX_PARTITIONS,
+        )
+
+
+def _compact_partition(staging_partition_path: str, partition_path: str) -> None:
+    """Rewrite a staging partition as one sorted, deduplicated and compressed Parquet file."""
+    failures = pq.read_table(staging_partition_path)
+    failures = failures \
+        .group_by(failures.column_names, use_threads=False).aggregate([]) \
+        .sort_by([(column, "ascending") for column in SORT_COLUMNS])
+
+    os.makedirs(partition_path, exist_ok=True)
+    pq.write_table(
+        failures,
+        os.path.join(partition_path, "part-0.parquet"),
+        compression="zstd",
+        use_dictionary=DICTIONARY_COLUMNS,
+        write_statistics=True,
+        row_group_size=ROW_GROUP_SIZE,
+    )
+
+
+def write_failure_store(
+    store_path: str = FAILURE_STORE_PATH,
+    log_file_path: str = LOG_FILE_PATH,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> None:
+    """
+    Convert the log, joined with the equipment and sensors data, to the failure store.
+
+    The log is streamed into staging partitions, then every partition is deduplicated and sorted
+    on its own, so memory is bounded by the size of a day of one equipment group. The store is
+    replaced only once it is complete, with the metadata of `is_failure_store_current`, and the
+    previous store is kept aside until then (see `replace_directory`).
+    """
+    print(f"Writing failure store to: {store_path}")
+    staging_path = f"{store_path}.staging"
+    new_store_path = f"{store_path}.new"
+    shutil.rmtree(staging_path, ignore_errors=True)
+    shutil.rmtree(new_store_path, ignore_errors=True)
+
+    # The inputs are hashed before being read, so a change while the store is written makes it stale.
+    metadata = _store_metadata(log_file_path)
+    _write_staging(staging_path, log_file_path, chunk_size)
+
+    for directory, _, files in os.walk(staging_path):
+        if files:
+            partition = os.path.relpath(directory, staging_path)
+            _compact_partition(directory, os.path.join(new_store_path, partition))
+
+    shutil.rmtree(staging_path)
+    os.makedirs(new_store_path, exist_ok=True)
+    with open(os.path.join(new_store_path, STORE_METADATA_FILE_NAME), "w") as f:
+        json.dump(metadata, f, indent=4)
+
+    replace_directory(new_store_path, store_path)
+    print("Failure store written successfully!")
+
+
+def read_failure_store(
+    columns: list = None,
+    filter: pc.Expression = None,
+    store_path: str = FAILURE_STORE_PATH,
+) -> pd.DataFrame:
+    """
+    Read the failure store, loading only `columns` from the partitions and row groups that can
+    match `filter`.
+    """
+    dataset = ds.dataset(store_path, format="parquet", partitioning=STORE_PARTITIONING)
+    return dataset.to_table(columns=columns or FAILURE_COLUMNS, filter=filter).to_pandas()
+
+
+def failure_filter(
+    start=None,
+    end=None,
+    equipment_ids: list = None,
+    equipment_groups: list = None,
+    sensor_ids: list = None,
+) -> pc.Expression:
+    """
+    Build a filter of the ERROR rows between the `start` (included) and `end` (excluded)
+    timestamps, of some equipment, equipment groups and sensors. Conditions left as None are
+    not applied.
+
+    The date and equipment group conditions prune whole partitions, while the equipment,
+    timestamp and sensor ones skip row groups through their statistics.
+    """
+    conditions = [pc.field("status") == "ERROR"]
+
+    if start is not None:
+        start = pd.Timestamp(start)
+        conditions.append(pc.field("date") >= pa.scalar(start.date(), pa.date32()))
+        conditions.append(pc.field("timestamp") >= pa.scalar(start, pa.timestamp("ns")))
+    if end is not None:
+        end = pd.Timestamp(end)
+        conditions.append(pc.field("date") <= pa.scalar(end.date(), pa.date32()))
+        conditions.append(pc.field("timestamp") < pa.scalar(end, pa.timestamp("ns")))
+    if equipment_ids is not None:
+        conditions.append(pc.field("equipment_id").isin(list(equipment_ids)))
+    if equipment_groups is not None:
+        conditions.append(pc.field("equipment_group").isin(list(equipment_groups)))
+    if sensor_ids is not None:
+        conditions.append(pc.field("sensor_id").isin(list(sensor_ids)))
+
+    return reduce(operator.and_, conditions)
+
+
+def process_stored_data(columns: list = None, filter: pc.Expression = None) -> pd.DataFrame:
+    """
+    Return the equipment failures from the failure store, as `process_data` does from the log.
+
+    `filter` narrows the failures down, see `failure_filter`. The store is written from the log
+    when it does not exist yet, and written again when the log, the equipment files or the code
+    writing it changed since.
+    """
+    if not is_failure_store_current():
+        if os.path.exists(FAILURE_STORE_PATH):
+            print("The failure store is out of date with its input files, writing it again")
+        write_failure_store()
+
+    print("Loading data from the failure store...")
+    equipment_failures = read_failure_store(columns, filter=failure_filter() if filter is None else filter)
+
+    print("Data processed successfully!")
+    return equipment_failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="log bytes parsed at once")
+    args = parser.parse_args()
+
+    write_failure_store(chunk_size=args.chunk_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,63 +1,594 @@
-from data.process_raw_data import process_data
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
+import pandas as pd
+from data.aggregates import (
+    EVENT_COLUMNS,
+    READINGS_COLUMNS,
+    SENSOR_COLUMNS,
+    aggregate_failures,
+    failure_events,
+    failure_sketches,
+    fold_partials,
+    sensor_failure_counts,
+    telemetry_partials,
+)
+from data.backends import DEFAULT_BACKEND, get_backend
+from data.checkpoint import load_checkpoint, save_checkpoint
+from data.failure_database import query_failure_aggregates
+from data.failure_keys import FailureKeys
+from data.failure_store import failure_filter, process_stored_data
+from data.instrumentation import stage
+from data.process_raw_data import (
+    DEFAULT_CHUNK_SIZE,
+    EQUIPMENT_COLUMNS,
+    EQUIPMENT_FILE_PATHS,
+    LOG_FILE_PATH,
+    MIN_CHUNK_SIZE,
+    complete_lines_size,
+    iter_equipment_failures,
+    processing_version,
+)
+from data.query_plan import FailureQuery, scan_failures
+from data.sessions import sessionize_events
+from data.sketches import DEFAULT_COUNT_ERROR, DEFAULT_DISTINCT_ERROR
+from data.telemetry import DEFAULT_ROLLING_WINDOW, TelemetryPartials
+from data.top_k import top_k_per_group
 
-def generate_analysis() -> dict:
-    """Generate the analysis for the equipment failures."""
-    equipment_failures = process_data()
+QUESTION_KEYS = ["q1_result", "q2_result", "q3_result", "q4_result"]
+TELEMETRY_KEYS = ["equipment_telemetry", "rolling_telemetry", "sensor_telemetry"]
+# The failure columns each result reads: the failures and failure events of question 1, the
+# failure events per equipment of questions 2 and 3, the failures per sensor of question 4 and
+# the readings of the telemetry.
+QUESTION_COLUMNS = {
+    "q1_result": ["equipment_id", "timestamp"],
+    "q2_result": ["equipment_id", "equipment_name", "timestamp"],
+    "q3_result": ["equipment_id", "equipment_group", "timestamp"],
+    "q4_result": ["equipment_id", "equipment_name", "equipment_group", "sensor_id"],
+    "equipment_telemetry": READINGS_COLUMNS + ["equipment_name", "equipment_group"],
+    "rolling_telemetry": READINGS_COLUMNS + ["equipment_name", "equipment_group"],
+    "sensor_telemetry": READINGS_COLUMNS,
+}
+DEFAULT_TOP_SENSORS = 3
 
-    # Question 1: How many equipment failures happened?
+
+def _question_columns(question_keys: list) -> list:
+    """The failure columns read by some questions, in the failure column order."""
+    columns = {column for key in question_keys for column in QUESTION_COLUMNS[key]}
+    return [
+        column for column in EQUIPMENT_COLUMNS + ["sensor_id", "timestamp", "temperature", "vibration"]
+        if column in columns
+    ]
+
+
+def _analysis_keys(telemetry: bool = False) -> list:
+    """The keys of the results of the analysis, with the telemetry ones when `telemetry` is set."""
+    return QUESTION_KEYS + TELEMETRY_KEYS if telemetry else QUESTION_KEYS
+
+
+ANALYSIS_COLUMNS = _question_columns(QUESTION_KEYS)
+
+
+def failure_query(question_keys: list = QUESTION_KEYS) -> FailureQuery:
+    """The lazy query of the distinct ERROR failures, with the columns read by the questions."""
+    return scan_failures() \
+        .filter(status="ERROR") \
+        .distinct() \
+        .select(*_question_columns(question_keys))
+
+
+def _failure_sessions(events: pd.DataFrame, event_gap=None) -> pd.DataFrame:
+    """
+    The failure events, or with `event_gap` the sessions of failure events of every equipment
+    (see `sessionize_events`), with the same columns.
+    """
+    if event_gap is None:
+        return events
+
+    with stage("sessionize_events", rows_in=len(events)) as rows:
+        sessions = sessionize_events(events, event_gap)[EVENT_COLUMNS]
+        rows["rows_out"] = len(sessions)
+    return sessions
+
+
+def typed_equipment(equipment: pd.DataFrame) -> pd.DataFrame:
+    """The equipment of the failures with plain id, name and group types, for the results."""
+    return equipment.astype({"equipment_id": "int64", "equipment_name": object, "equipment_group": object})
+
+
+def _equipment_events(equipment: pd.DataFrame, events: pd.DataFrame) -> pd.DataFrame:
+    """The number of failure events of every equipment, ordered by equipment id."""
+    return equipment \
+        .merge(events.groupby("equipment_id").size().rename("failures").reset_index(), on="equipment_id") \
+        .sort_values(by="equipment_id")
+
+
+def sensor_failures_table(sensor_failures: pd.Series, equipment: pd.DataFrame) -> pd.DataFrame:
+    """The failures of every equipment sensor with the equipment name and group, in the order of the counts."""
+    return sensor_failures.astype("int64").rename("failures") \
+        .reset_index() \
+        .astype({"equipment_id": "int64", "sensor_id": "int64"}) \
+        .merge(equipment, on="equipment_id")[EQUIPMENT_COLUMNS + ["sensor_id", "failures"]] \
+        .reset_index(drop=True)
+
+
+def answer_questions(
+    aggregates: dict,
+    top_sensors: int = DEFAULT_TOP_SENSORS,
+    keep_ties: bool = False,
+    rolling_window: str = DEFAULT_ROLLING_WINDOW,
+    event_gap=None,
+) -> dict:
+    """
+    Answer the questions from the aggregates of all equipment failures, with the telemetry when
+    the aggregates have the telemetry partials. With `event_gap`, the failure events of questions
+    1 to 3 are the sessions of `sessionize_events` instead of the distinct (equipment, timestamp)
+    pairs. From sketched aggregates, the failure events and the failures per sensor are estimates:
+    the relative standard error of the events is kept in question 1, as `event_error`, and the
+    upper bound of the overestimation of the failures of every equipment sensor in the
+    `count_errors` attribute of question 4.
+    """
+    if "event_sketch" in aggregates:
+        return _answer_sketched_questions(aggregates, top_sensors, keep_ties, rolling_window)
+
+    with stage("merge_equipment"):
+        equipment = typed_equipment(aggregates["equipment"])
+        events = _failure_sessions(aggregates["events"], event_gap)
+        equipment_events = _equipment_events(equipment, events)
+        sensor_failures = sensor_failures_table(aggregates["sensor_failures"], equipment)
+
+    results = build_results(
+        aggregates["failures"], events.shape[0], equipment_events, sensor_failures, top_sensors, keep_ties, event_gap
+    )
+    _add_telemetry(results, aggregates, equipment, rolling_window)
+    return results
+
+
+def _answer_sketched_questions(
+    aggregates: dict,
+    top_sensors: int = DEFAULT_TOP_SENSORS,
+    keep_ties: bool = False,
+    rolling_window: str = DEFAULT_ROLLING_WINDOW,
+) -> dict:
+    """Answer the questions from the sketched aggregates, see `answer_questions`."""
+    event_sketch, sensor_sketch = aggregates["event_sketch"], aggregates["sensor_sketch"]
+    if top_sensors > sensor_sketch.capacity:
+        raise ValueError(
+            f"Only {sensor_sketch.capacity} sensors are counted per equipment, cannot rank the top {top_sensors}"
+        )
+
+    with stage("merge_equipment"):
+        equipment = typed_equipment(aggregates["equipment"])
+        event_counts = event_sketch.estimates().rename("failures").rename_axis("equipment_id").reset_index()
+        equipment_events = equipment \
+            .merge(event_counts, on="equipment_id") \
+            .sort_values(by="equipment_id")
+        sensor_failures = sensor_failures_table(sensor_sketch.counts(), equipment)
+
+    results = build_results(
+        aggregates["failures"],
+        int(event_counts["failures"].sum()),
+        equipment_events,
+        sensor_failures,
+        top_sensors,
+        keep_ties,
+    )
+    results["q1_result"]["event_error"] = event_sketch.error
+    results["q4_result"].attrs["count_errors"] = sensor_sketch.floors.to_dict()
+    _add_telemetry(results, aggregates, equipment, rolling_window)
+    return results
+
+
+def _add_telemetry(results: dict, aggregates: dict, equipment: pd.DataFrame, rolling_window: str) -> None:
+    """Add the telemetry results to the question results, when the aggregates have the telemetry partials."""
+    if "telemetry" in aggregates:
+        partials = aggregates["telemetry"]
+        results.update({
+            "equipment_telemetry": _equipment_telemetry(partials, equipment),
+            "rolling_telemetry": _rolling_telemetry(partials, equipment, rolling_window),
+            "sensor_telemetry": _sensor_telemetry(partials),
+        })
+
+
+def _question_1(failures: int, events: int, event_gap=None) -> dict:
+    """
+    Question 1: How many equipment failures happened?
+
+    With `event_gap`, the events are sessions of failures and the gap is part of the result.
+    """
     print("Answering question 1...")
-    q1_resultv1 = equipment_failures \
-        .shape[0]
-
-    q1_resultv2 = equipment_failures \
-        .drop_duplicates(subset=["equipment_id", "timestamp"]) \
-        .shape[0]
-    
-    q1_result = {
-        "v1": q1_resultv1,
-        "v2": q1_resultv2
-    }
+    with stage("question_1"):
+        q1_result = {
+            "v1": failures,
+            "v2": events
+        }
+        if event_gap is not None:
+            q1_result["event_gap"] = str(event_gap)
+        return q1_result
 
-    # Question 2: Which piece of equipment had most failures?
+
+def _question_2(equipment_events: pd.DataFrame) -> pd.DataFrame:
+    """Question 2: Which piece of equipment had most failures?"""
     print("Answering question 2...")
-    q2_result = equipment_failures \
-        .drop_duplicates(subset=["equipment_id", "timestamp"]) \
-        .groupby(["equipment_id", "equipment_name"]).size().rename("failures") \
-        .sort_values(ascending=False) \
-        .reset_index()
+    with stage("question_2", rows_in=len(equipment_events)) as rows:
+        q2_result = equipment_events \
+            .set_index(["equipment_id", "equipment_name"])["failures"] \
+            .sort_values(ascending=False) \
+            .reset_index()
+
+        q2_result["percentage"] = round(q2_result["failures"] / q2_result["failures"].sum() * 100, 2)
+        q2_result["percentage"] = q2_result["percentage"].astype(str) + "%"
+        rows["rows_out"] = len(q2_result)
+    return q2_result
 
-    q2_result["percentage"] = round(q2_result["failures"] / q2_result["failures"].sum() * 100, 2)
-    q2_result["percentage"] = q2_result["percentage"].astype(str) + "%"
 
-    # Question 3: Average failures per asset across equipment groups
+def _question_3(equipment_events: pd.DataFrame) -> pd.DataFrame:
+    """Question 3: Average failures per asset across equipment groups."""
     print("Answering question 3...")
-    q3_result = equipment_failures \
-        .groupby(["equipment_group", "equipment_id"])["timestamp"].nunique().rename("failures") \
-        .reset_index()
-
-    q3_result = q3_result \
-        .groupby("equipment_group").agg(
-            equipment_list=("equipment_id", lambda x: sorted(list(x))),
-            avg_failures=("failures", "mean"),
-            total_failures=("failures", "sum")
-        ).sort_values(by="total_failures", ascending=True) \
-        .reset_index()
-
-    q3_result["percentage"] = round(q3_result["total_failures"] / q3_result["total_failures"].sum() * 100, 2)
-    q3_result["percentage"] = q3_result["percentage"].astype(str) + "%"
-
-    # Question 4: Rank sensors by failures per asset
+    with stage("question_3", rows_in=len(equipment_events)) as rows:
+        q3_result = equipment_events[["equipment_group", "equipment_id", "failures"]] \
+            .sort_values(by=["equipment_group", "equipment_id"]) \
+            .reset_index(drop=True)
+
+        q3_result = q3_result \
+            .groupby("equipment_group", observed=True).agg(
+                equipment_list=("equipment_id", lambda x: sorted(list(x))),
+                avg_failures=("failures", "mean"),
+                total_failures=("failures", "sum")
+            ).sort_values(by="total_failures", ascending=True) \
+            .reset_index()
+
+        q3_result["percentage"] = round(q3_result["total_failures"] / q3_result["total_failures"].sum() * 100, 2)
+        q3_result["percentage"] = q3_result["percentage"].astype(str) + "%"
+        rows["rows_out"] = len(q3_result)
+    return q3_result
+
+
+def _question_4(
+    sensor_failures: pd.DataFrame, top_sensors: int = DEFAULT_TOP_SENSORS, keep_ties: bool = False
+) -> pd.DataFrame:
+    """
+    Question 4: Rank sensors by failures per asset.
+
+    Only the `top_sensors` sensors of every equipment are ranked (see `top_k_per_group`); the
+    number is kept in the `top_sensors` attribute of the result.
+    """
     print("Answering question 4...")
-    q4_result = equipment_failures \
-        .groupby(["equipment_id", "equipment_name", "equipment_group", "sensor_id"]).size().rename("failures") \
-        .reset_index() \
-        .sort_values(by=["equipment_id", "failures"], ascending=[True, False]) \
-        .groupby("equipment_id").head(3)
+    with stage("question_4", rows_in=len(sensor_failures)) as rows:
+        q4_result = top_k_per_group(sensor_failures, "equipment_id", "sensor_id", "failures", top_sensors, keep_ties)
+        q4_result.attrs["top_sensors"] = top_sensors
+        rows["rows_out"] = len(q4_result)
+    return q4_result
+
 
+def build_results(
+    failures: int,
+    events: int,
+    equipment_events: pd.DataFrame,
+    sensor_failures: pd.DataFrame,
+    top_sensors: int = DEFAULT_TOP_SENSORS,
+    keep_ties: bool = False,
+    event_gap=None,
+) -> dict:
+    """
+    Build the question results from the failure and failure event totals, the failure events per
+    equipment, ordered by equipment id, and the failures per equipment sensor. `event_gap` is the
+    gap the failure events were sessionized with, if any.
+    """
     return {
-        "q1_result": q1_result,
-        "q2_result": q2_result,
-        "q3_result": q3_result,
-        "q4_result": q4_result
+        "q1_result": _question_1(failures, events, event_gap),
+        "q2_result": _question_2(equipment_events),
+        "q3_result": _question_3(equipment_events),
+        "q4_result": _question_4(sensor_failures, top_sensors, keep_ties),
     }
+
+
+def _sensor_telemetry(partials: TelemetryPartials) -> pd.DataFrame:
+    """Statistics of the temperature and vibration readings of every equipment sensor."""
+    print("Summarizing sensor telemetry...")
+    with stage("sensor_telemetry", rows_in=len(partials.stats)) as rows:
+        sensor_telemetry = partials.summary(SENSOR_COLUMNS)
+        rows["rows_out"] = len(sensor_telemetry)
+    return sensor_telemetry
+
+
+def _equipment_telemetry(partials: TelemetryPartials, equipment: pd.DataFrame) -> pd.DataFrame:
+    """Statistics of the temperature and vibration readings of every equipment, with its name and group."""
+    print("Summarizing equipment telemetry...")
+    with stage("equipment_telemetry", rows_in=len(partials.stats)) as rows:
+        summary = partials.summary(["equipment_id"])
+        equipment_telemetry = equipment \
+            .merge(summary, on="equipment_id") \
+            .sort_values(by="equipment_id", kind="stable") \
+            .reset_index(drop=True)
+        equipment_telemetry.attrs = summary.attrs
+        rows["rows_out"] = len(equipment_telemetry)
+    return equipment_telemetry
+
+
+def _rolling_telemetry(partials: TelemetryPartials, equipment: pd.DataFrame, window: str) -> pd.DataFrame:
+    """The latest and peak means of the readings of every equipment over a rolling time window."""
+    print("Summarizing rolling telemetry...")
+    with stage("rolling_telemetry", rows_in=len(partials)) as rows:
+        rolling = equipment \
+            .merge(partials.rolling_means(window), on="equipment_id") \
+            .sort_values(by="equipment_id", kind="stable") \
+            .reset_index(drop=True)
+        rows["rows_out"] = len(rolling)
+    return rolling
+
+
+def _sensor_failures_of(equipment_failures: pd.DataFrame) -> pd.DataFrame:
+    """The table of failures per equipment sensor of `answer_questions`, straight from the failures."""
+    equipment = equipment_failures.drop_duplicates(subset="equipment_id")[EQUIPMENT_COLUMNS]
+    return sensor_failures_table(sensor_failure_counts(equipment_failures), typed_equipment(equipment))
+
+
+def iter_concurrent_answers(
+    equipment_failures: pd.DataFrame,
+    workers: int,
+    top_sensors: int = DEFAULT_TOP_SENSORS,
+    keep_ties: bool = False,
+    telemetry: bool = False,
+    rolling_window: str = DEFAULT_ROLLING_WINDOW,
+    event_gap=None,
+):
+    """
+    Answer the questions from the equipment failures on a pool of `workers` threads, yielding
+    (question key, result) pairs as the questions are answered.
+
+    The threads share the failures in memory. The failure events scan, which questions 1 to 3
+    are answered from, runs concurrently with the failures per sensor scan of question 4, and
+    questions 2 and 3 are scheduled as soon as the failure events, or their sessions with
+    `event_gap`, are ready. With `telemetry`, the readings are reduced to their telemetry
+    partials alongside, and the telemetry summaries scheduled once they are ready.
+    """
+    with ThreadPoolExecutor(workers) as executor:
+        pending = {
+            executor.submit(failure_events, equipment_failures): "events",
+            executor.submit(_sensor_failures_of, equipment_failures): "sensor_failures",
+        }
+        if telemetry:
+            pending[executor.submit(telemetry_partials, equipment_failures[READINGS_COLUMNS])] = "telemetry"
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, result = pending.pop(future), future.result()
+
+                if name == "events":
+                    equipment = typed_equipment(result[EQUIPMENT_COLUMNS].drop_duplicates())
+                    events = _failure_sessions(result[EVENT_COLUMNS], event_gap)
+                    equipment_events = _equipment_events(equipment, events)
+                    yield "q1_result", _question_1(equipment_failures.shape[0], events.shape[0], event_gap)
+                    pending[executor.submit(_question_2, equipment_events)] = "q2_result"
+                    pending[executor.submit(_question_3, equipment_events)] = "q3_result"
+                elif name == "telemetry":
+                    equipment = typed_equipment(
+                        equipment_failures.drop_duplicates(subset="equipment_id")[EQUIPMENT_COLUMNS]
+                    )
+                    pending[executor.submit(_equipment_telemetry, result, equipment)] = "equipment_telemetry"
+                    pending[executor.submit(_rolling_telemetry, result, equipment, rolling_window)] = "rolling_telemetry"
+                    pending[executor.submit(_sensor_telemetry, result)] = "sensor_telemetry"
+                elif name == "sensor_failures":
+                    pending[executor.submit(_question_4, result, top_sensors, keep_ties)] = "q4_result"
+                else:
+                    yield name, result
+
+
+def _fold_aggregates(aggregates: dict, equipment_failures_chunks, telemetry: bool = False, sketches: dict = None) -> dict:
+    """Fold the partial aggregates, or sketches, of every chunk of equipment failures into `aggregates`."""
+    partials = (aggregate_failures(equipment_failures, telemetry, sketches) for equipment_failures in equipment_failures_chunks)
+    return fold_partials(aggregates, partials)
+
+
+def generate_streaming_analysis(
+    chunk_size: int, from_archive: bool = False, telemetry: bool = False, sketches: dict = None, **question_options
+) -> dict:
+    """
+    Generate the analysis reading the log in chunks of about `chunk_size` bytes.
+
+    Each chunk is reduced to partial aggregates (failure count, distinct failure events and
+    failures per sensor) that are folded together, so peak memory depends on the chunk size and
+    the number of distinct events, not on the log size. The failures seen in an earlier chunk
+    are dropped, as in the whole log, by the keys of `iter_equipment_failures`, which take 8
+    bytes per distinct failure. With the `sketches` of `failure_sketches`, the events and
+    failures per sensor of the chunks are sketched and the sketches merged, so the aggregates do
+    not depend on the number of events either. With `from_archive`, the log is streamed out of
+    the .tar.gz archive. With `telemetry`, the readings of every chunk are reduced to mergeable
+    `TelemetryPartials`, which grow with the failure events, not with the failures.
+    """
+    columns = _question_columns(_analysis_keys(telemetry))
+    aggregates = _fold_aggregates(
+        None, iter_equipment_failures(chunk_size, from_archive=from_archive, columns=columns), telemetry, sketches
+    )
+    return answer_questions(aggregates, **question_options)
+
+
+def _backend_aggregates(
+    backend: str, workers: int = 1, from_archive: bool = False, use_cache: bool = False, telemetry: bool = False
+) -> dict:
+    """
+    Parse the whole log, then join and aggregate its failures with a backend, see `get_backend`.
+    The join and the aggregation are recorded as stages named after the backend, such as
+    "arrow_join" and "arrow_aggregate", so the run profiles of the backends compare directly.
+    """
+    backend = get_backend(backend)
+    equipment_failures = backend.process_data(workers, from_archive, use_cache)
+
+    print("Aggregating failures...")
+    with stage(f"{backend.name}_aggregate"):
+        return backend.aggregate(equipment_failures, telemetry)
+
+
+def generate_incremental_analysis(chunk_size: int = DEFAULT_CHUNK_SIZE, **question_options) -> dict:
+    """
+    Generate the analysis parsing only the log bytes appended since the last run.
+
+    The aggregates of the new complete lines are folded into the ones saved in the checkpoint,
+    which then records the new byte offset, with the keys of the failures seen so far, so a
+    failure duplicated in lines of an earlier run is counted once. A log that was rewritten
+    instead of appended to is processed again from the start, as well as the log of a checkpoint
+    taken with other equipment files or another version of the code.
+    """
+    checkpoint_options = {"input_paths": EQUIPMENT_FILE_PATHS, "version": processing_version(__file__)}
+    offset, aggregates = load_checkpoint(LOG_FILE_PATH, **checkpoint_options)
+    failure_keys = FailureKeys(aggregates.pop("failure_keys")) if aggregates is not None else FailureKeys()
+    end = complete_lines_size(LOG_FILE_PATH)
+
+    print(f"Processing log bytes {offset:,} to {end:,}...")
+    aggregates = _fold_aggregates(
+        aggregates, iter_equipment_failures(chunk_size, offset, end, columns=ANALYSIS_COLUMNS, failure_keys=failure_keys)
+    )
+    save_checkpoint(LOG_FILE_PATH, end, {**aggregates, "failure_keys": failure_keys.hashes()}, **checkpoint_options)
+
+    return answer_questions(aggregates, **question_options)
+
+
+def generate_filtered_analysis(
+    start=None,
+    end=None,
+    equipment_ids: list = None,
+    equipment_groups: list = None,
+    sensor_ids: list = None,
+    telemetry: bool = False,
+    **question_options,
+) -> dict:
+    """
+    Generate the analysis for the failures between the `start` (included) and `end` (excluded)
+    timestamps, of some equipment ids, equipment groups and sensor ids.
+
+    The filters are pushed down to the Parquet failure store, so only the matching date and
+    group partitions and row groups are read. The results have the same shapes as the ones of
+    `generate_analysis`.
+    """
+    filter = failure_filter(start, end, equipment_ids, equipment_groups, sensor_ids)
+    equipment_failures = process_stored_data(_question_columns(_analysis_keys(telemetry)), filter)
+
+    print("Aggregating failures...")
+    return answer_questions(aggregate_failures(equipment_failures, telemetry), **question_options)
+
+
+def iter_analysis(
+    chunk_size: int = None,
+    use_store: bool = False,
+    incremental: bool = False,
+    workers: int = 1,
+    use_database: bool = False,
+    compact: bool = False,
+    from_archive: bool = False,
+    use_cache: bool = False,
+    question_workers: int = 1,
+    top_sensors: int = DEFAULT_TOP_SENSORS,
+    keep_ties: bool = False,
+    telemetry: bool = False,
+    rolling_window: str = DEFAULT_ROLLING_WINDOW,
+    event_gap=None,
+    approximate: bool = False,
+    distinct_error: float = DEFAULT_DISTINCT_ERROR,
+    count_error: float = DEFAULT_COUNT_ERROR,
+    backend: str = DEFAULT_BACKEND,
+):
+    """
+    Generate the analysis for the equipment failures, yielding (question key, result) pairs as
+    the questions are answered.
+
+    When `chunk_size` is given, the log is streamed in chunks of that many bytes, at least
+    `MIN_CHUNK_SIZE`, instead of being loaded at once (see `generate_streaming_analysis`). With
+    `use_store`, only the columns used by the analysis are read from the Parquet failure store.
+    With `incremental`, only the log bytes appended since the last run are parsed (see
+    `generate_incremental_analysis`).
+    With `use_database`, the questions are answered with SQL queries on the SQLite failure
+    database. Otherwise the whole log is parsed at once by the lazy `failure_query`, which only
+    reads the columns the questions need, by `workers` processes, into compact column types
+    when `compact` is set. With `from_archive`, the log read by the streaming or
+    whole log analyses comes straight out of the .tar.gz archive, without extracting it to disk.
+    With `use_cache`, the whole log analysis loads the failures from the data cache when its
+    inputs did not change (see `cached_dataframe`). With more than one `question_workers`, the
+    questions of the exact whole log and store analyses are answered concurrently by that many
+    threads (see `iter_concurrent_answers`). Question 4 ranks the `top_sensors` sensors of every
+    equipment, with all the sensors tied with the last one when `keep_ties` is set.
+
+    With `telemetry`, the statistics of the temperature and vibration readings per sensor and per
+    equipment and their means over a `rolling_window` are yielded as well, from the log or the
+    store; the database and incremental analyses only keep the failure counts. They are computed
+    from the mergeable `TelemetryPartials` of the readings in every analysis, so the results do
+    not depend on how the log was read; the percentiles are interpolated between readings
+    estimated within 1%.
+
+    With `event_gap`, such as "5s", the failure events of questions 1 to 3 are sessions of
+    failures of an equipment at most that far apart (see `sessionize_events`), instead of the
+    distinct (equipment, timestamp) pairs, in all but the database analysis.
+
+    With `approximate`, the streaming, whole log and store analyses sketch the failure events of
+    every equipment with a HyperLogLog, with a relative standard error of `distinct_error`, and
+    the failures of its sensors with a Space-Saving summary, overestimating them by about
+    `count_error` of its failures (see `failure_sketches`), then answer the questions from the
+    sketches, in memory that does not grow with the number of distinct failure events.
+
+    With another `backend` than pandas, such as "arrow", "polars" or "spark", the whole log
+    analysis joins the log with the equipment and aggregates the failures with that backend
+    (see `data.backends`), then answers the questions from its aggregates as usual.
+    """
+    if chunk_size is not None and chunk_size < MIN_CHUNK_SIZE:
+        raise ValueError(f"chunk_size must be at least {MIN_CHUNK_SIZE} bytes, got {chunk_size}")
+    if top_sensors < 1:
+        raise ValueError(f"top_sensors must be at least 1, got {top_sensors}")
+    if telemetry and (use_database or incremental):
+        raise ValueError("The telemetry is computed from the log or the failure store only")
+    if event_gap is not None and use_database:
+        raise ValueError("The failure events are sessionized from the log or the failure store only")
+    if approximate and (use_database or incremental):
+        raise ValueError("The approximate analysis sketches the failures of the log or the failure store only")
+    if approximate and event_gap is not None:
+        raise ValueError("The failure events cannot be sessionized from their sketches")
+    if backend != DEFAULT_BACKEND:
+        get_backend(backend)
+        if (
+            chunk_size is not None or use_store or incremental or use_database
+            or compact or approximate or question_workers > 1
+        ):
+            raise ValueError(f"The {backend} backend runs the exact whole log analysis only, with the standard types")
+    sketches = failure_sketches(distinct_error, count_error) if approximate else None
+    question_options = {"top_sensors": top_sensors, "keep_ties": keep_ties}
+    answer_options = {**question_options, "rolling_window": rolling_window, "event_gap": event_gap}
+
+    if use_database:
+        with stage("query_database"):
+            aggregates = query_failure_aggregates(top=top_sensors)
+        yield from build_results(*aggregates, **question_options).items()
+        return
+
+    if incremental:
+        yield from generate_incremental_analysis(chunk_size or DEFAULT_CHUNK_SIZE, **answer_options).items()
+        return
+
+    if chunk_size is not None:
+        yield from generate_streaming_analysis(chunk_size, from_archive, telemetry, sketches, **answer_options).items()
+        return
+
+    if backend != DEFAULT_BACKEND:
+        aggregates = _backend_aggregates(backend, workers, from_archive, use_cache, telemetry)
+        yield from answer_questions(aggregates, **answer_options).items()
+        return
+
+    analysis_keys = _analysis_keys(telemetry)
+    if use_store:
+        with stage("read_store") as rows:
+            equipment_failures = process_stored_data(_question_columns(analysis_keys))
+            rows["rows_out"] = len(equipment_failures)
+    else:
+        equipment_failures = failure_query(analysis_keys).collect(workers, compact, from_archive, use_cache)
+
+    print("Aggregating failures...")
+    if question_workers > 1 and sketches is None:
+        yield from iter_concurrent_answers(equipment_failures, question_workers, telemetry=telemetry, **answer_options)
+    else:
+        aggregates = aggregate_failures(equipment_failures, telemetry, sketches)
+        yield from answer_questions(aggregates, **answer_options).items()
+
+
+def generate_analysis(**analysis_options) -> dict:
+    """Generate the analysis for the equipment failures, see `iter_analysis` for the options."""
+    with stage("generate_analysis"):
+        results = dict(iter_analysis(**analysis_options))
+    return {key: results[key] for key in QUESTION_KEYS + TELEMETRY_KEYS if key in results}
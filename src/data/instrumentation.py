@@ -0,0 +1,144 @@
+"""
+Per stage instrumentation of the pipeline: wall time, CPU time, rows in and out and peak memory
+of every stage, saved as a JSON run profile.
+"""
+
+import cProfile
+import json
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+SAMPLE_INTERVAL = 0.01
+
+_lock = threading.Lock()
+_local = threading.local()
+_stages = {}
+_running = {}
+_sampler = None
+_profiled_stage = None
+_profiler = None
+_profiler_depth = 0
+_started_at = None
+
+
+def current_rss() -> int:
+    """Resident memory of the process in bytes, or its peak so far where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _sample_rss() -> None:
+    """Raise the peak RSS of the running stages, until no stage is running."""
+    global _sampler
+    while True:
+        time.sleep(SAMPLE_INTERVAL)
+        rss = current_rss()
+        with _lock:
+            if not _running:
+                _sampler = None
+                return
+            for record in _running.values():
+                record["peak_rss"] = max(record["peak_rss"], rss)
+
+
+def start_run(profile_stage: str = None) -> None:
+    """
+    Forget the stages recorded so far. With `profile_stage`, every run of the stages with that
+    name is profiled with cProfile.
+    """
+    global _profiled_stage, _profiler, _profiler_depth, _started_at
+    with _lock:
+        _stages.clear()
+        _profiled_stage = profile_stage
+        _profiler = cProfile.Profile() if profile_stage else None
+        _profiler_depth = 0
+        _started_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+@contextmanager
+def stage(name: str, rows_in: int = None):
+    """
+    Record a run of a pipeline stage, nested in the stage running in the same thread.
+
+    Yields a dict where the stage sets its `rows_out`. The runs of a stage are summed in the run
+    profile under its path, such as "process_data/parse_log".
+    """
+    global _sampler, _profiler_depth
+    parents = getattr(_local, "parents", [])
+    path = "/".join(parents + [name])
+    rows = {"rows_in": rows_in, "rows_out": None}
+    record = {"peak_rss": current_rss()}
+
+    with _lock:
+        summary = _stages.setdefault(path, {
+            "stage": path,
+            "calls": 0,
+            "wall_seconds": 0.0,
+            "cpu_seconds": 0.0,
+            "rows_in": None,
+            "rows_out": None,
+            "peak_rss_mb": 0.0,
+        })
+        _running[id(record)] = record
+        if _sampler is None:
+            _sampler = threading.Thread(target=_sample_rss, daemon=True)
+            _sampler.start()
+        profiler = _profiler if name == _profiled_stage else None
+        if profiler is not None:
+            _profiler_depth += 1
+            if _profiler_depth == 1:
+                profiler.enable()
+
+    _local.parents = parents + [name]
+    start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        yield rows
+    finally:
+        wall_seconds, cpu_seconds = time.perf_counter() - start, time.process_time() - cpu_start
+        _local.parents = parents
+
+        with _lock:
+            if profiler is not None:
+                _profiler_depth -= 1
+                if _profiler_depth == 0:
+                    profiler.disable()
+            del _running[id(record)]
+
+            summary["calls"] += 1
+            summary["wall_seconds"] += wall_seconds
+            summary["cpu_seconds"] += cpu_seconds
+            for key, value in rows.items():
+                if value is not None:
+                    summary[key] = (summary[key] or 0) + int(value)
+            summary["peak_rss_mb"] = max(summary["peak_rss_mb"], max(record["peak_rss"], current_rss()) / 1024 ** 2)
+
+
+def run_profile() -> dict:
+    """The stages recorded since `start_run`, in the order they first ran."""
+    with _lock:
+        return {"started_at": _started_at, "stages": [dict(summary) for summary in _stages.values()]}
+
+
+def save_run_profile(profile_path: str) -> None:
+    """
+    Write the run profile as JSON. When a stage was profiled, its cProfile statistics are written
+    next to it, with the stage name and the .prof extension, to be read with `pstats`.
+    """
+    profile = run_profile()
+    os.makedirs(os.path.dirname(profile_path) or ".", exist_ok=True)
+    if _profiler is not None:
+        stats_path = f"{os.path.splitext(profile_path)[0]}.{_profiled_stage}.prof"
+        _profiler.dump_stats(stats_path)
+        profile["cprofile"] = {"stage": _profiled_stage, "stats_path": stats_path}
+        print(f"Profile of stage {_profiled_stage} saved to {stats_path}")
+
+    with open(profile_path, "w") as f:
+        json.dump(profile, f, indent=4)
+    print(f"Run profile saved to {profile_path}")
@@ -1,66 +1,737 @@
+import inspect
+import io
 import os
 import re
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from multiprocessing import get_context
 
+import numpy as np
 import pandas as pd
-from data.extract_tar_gz import extract_tar_gz
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+from data.data_cache import cached_dataframe, code_version
+from data.extract_tar_gz import extract_tar_gz, stream_tar_member
+from data.failure_keys import FailureKeys
+from data.instrumentation import stage
 
 
-def get_log_dataframe(log_file_path: str) -> pd.DataFrame:
-    """Read a log file with the specific format, and convert it to a Pandas DataFrame."""
+TAR_FILE_PATH = "data/equipment_failure_sensors.tar.gz"
+EXTRACTED_PATH = "data/extracted"
+EQUIPMENT_FILE_PATH = "data/equipment.json"
+EQUIPMENT_SENSORS_FILE_PATH = "data/equipment_sensors.csv"
+EQUIPMENT_FILE_PATHS = [EQUIPMENT_FILE_PATH, EQUIPMENT_SENSORS_FILE_PATH]
+LOG_FILE_PATH = "data/extracted/equipment_failure_sensors/equpment_failure_sensors.txt"
+DEFAULT_CHUNK_SIZE = 64 * 1024 ** 2
+# Arrow parses a chunk block by block, and every block must hold whole log lines.
+MIN_CHUNK_SIZE = 64 * 1024
+EQUIPMENT_COLUMN_NAMES = {"name": "equipment_name", "group_name": "equipment_group"}
+EQUIPMENT_COLUMNS = ["equipment_id", "equipment_name", "equipment_group"]
+FAILURE_COLUMNS = [
+    "equipment_id", "equipment_name", "equipment_group", "sensor_id",
+    "timestamp", "status", "temperature", "vibration",
+]
+# The equipment name and group follow from its id. The status is part of the key only when the
+# failures are not filtered on one status, see `failure_key_columns`.
+FAILURE_KEY_COLUMNS = ["equipment_id", "sensor_id", "timestamp", "temperature", "vibration"]
+COMPACT_DTYPES = {
+    "equipment_id": "int32",
+    "sensor_id": "int32",
+    "status": "category",
+    "temperature": "float32",
+    "vibration": "float32",
+}
+
+LOG_REGEX = re.compile(r"^\[(\d{4}[-/]\d{1,2}[-/]\d{1,2}(?:\s\d{1,2}:\d{1,2}:\d{1,2})?)\]\t(\w+)\tsensor\[(\d+)\]:\t\(temperature\t(-?\d+\.\d+|err),\svibration\t(-?\d+\.\d+|err)\)$")
+LOG_COLUMNS = ["timestamp", "status", "sensor_id", "temperature", "vibration"]
+
+# A well formed line splits into six tab separated fields:
+# "[2020-01-01 00:00:00]", "ERROR", "sensor[1]:", "(temperature", "1.00, vibration", "2.00)"
+LOG_FIELDS = ["timestamp", "status", "sensor", "temperature_label", "temperature", "vibration"]
+LOG_FIELD_PATTERNS = {
+    "timestamp": r"^\[\d{4}[-/]\d{1,2}[-/]\d{1,2}(?: \d{1,2}:\d{1,2}:\d{1,2})?\]$",
+    "status": r"^\w+$",
+    "sensor": r"^sensor\[\d+\]:$",
+    "temperature_label": r"^\(temperature$",
+    "temperature": r"^(?:-?\d+\.\d+|err), vibration$",
+    "vibration": r"^(?:-?\d+\.\d+|err)\)$",
+}
+
+
+def _log_columns(columns: list = None) -> list:
+    """The log columns among `columns`, in log order, or all of them."""
+    return LOG_COLUMNS if columns is None else [column for column in LOG_COLUMNS if column in columns]
 
-    if not os.path.exists(log_file_path):
-        extract_tar_gz("data/equipment_failure_sensors.tar.gz", "data/extracted")
 
-    regex = re.compile(r"^\[(\d{4}[-/]\d{1,2}[-/]\d{1,2}(?:\s\d{1,2}:\d{1,2}:\d{1,2})?)\]\t(\w+)\tsensor\[(\d+)\]:\t\(temperature\t(-?\d+\.\d+|err),\svibration\t(-?\d+\.\d+|err)\)$")
+def _parse_log_lines_regex(lines, status: str = None, columns: list = None) -> pd.DataFrame:
+    """
+    Parse raw log lines one by one with the log regex, keeping the values as strings.
+
+    When `status` is given, only the lines with that status are kept. When `columns` is given,
+    only those log columns are returned.
+    """
     log_data = []
 
-    with open(log_file_path, "r") as f:
-        for row in f:
-            match = regex.match(row.strip())
-            
-            if match:
-                timestamp = match.group(1)
-                status = match.group(2)
-                sensor_id = match.group(3)
-                temperature = match.group(4)
-                vibration = match.group(5)
-                
-                log_data.append({
-                    "timestamp": timestamp,
-                    "status": status,
-                    "sensor_id": sensor_id,
-                    "temperature": temperature,
-                    "vibration": vibration
-                })
-
-    df = pd.DataFrame(log_data)
-
-    df["timestamp"] = pd.to_datetime(df["timestamp"], format="mixed")
-    df["sensor_id"] = pd.to_numeric(df["sensor_id"])
-    df["temperature"] = pd.to_numeric(df["temperature"], errors="coerce")
-    df["vibration"] = pd.to_numeric(df["vibration"], errors="coerce")
-    
+    with stage("parse_regex") as rows:
+        for row in lines:
+            match = LOG_REGEX.match(row.strip())
+
+            if match and (status is None or match.group(2) == status):
+                log_data.append(match.groups())
+
+        rows["rows_out"] = len(log_data)
+
+    return pd.DataFrame(log_data, columns=LOG_COLUMNS)[_log_columns(columns)]
+
+
+def _log_csv_options(malformed_lines: list, block_size: int = None) -> dict:
+    """Arrow CSV options splitting the log on tabs, collecting lines that have another layout."""
+    def handle_invalid_row(row) -> str:
+        malformed_lines.append(row.text)
+        return "skip"
+
+    read_options = pv.ReadOptions(column_names=LOG_FIELDS)
+    if block_size is not None:
+        read_options.block_size = block_size
+
+    return {
+        "read_options": read_options,
+        "parse_options": pv.ParseOptions(
+            delimiter="\t",
+            quote_char=False,
+            escape_char=False,
+            invalid_row_handler=handle_invalid_row,
+        ),
+        "convert_options": pv.ConvertOptions(
+            column_types={field: pa.string() for field in LOG_FIELDS},
+            strings_can_be_null=False,
+        ),
+    }
+
+
+def _parse_measure(values: pa.ChunkedArray, suffix_length: int) -> pa.ChunkedArray:
+    """Cut the suffix of a temperature or vibration field and cast it to float, with err as null."""
+    values = pc.utf8_slice_codeunits(values, 0, -suffix_length)
+    return pc.cast(pc.if_else(pc.equal(values, "err"), None, values), pa.float64())
+
+
+def _parse_log_fields(fields: pa.Table, malformed_lines: list, status: str = None, columns: list = None) -> pd.DataFrame:
+    """
+    Validate and decode the log fields with vectorized Arrow compute functions.
+
+    Rows rejected by the field patterns are joined back into lines and added to `malformed_lines`.
+    When `status` is given, the rows with another status are dropped before being decoded. When
+    `columns` is given, the other log columns are validated but not decoded.
+    """
+    is_valid = None
+    for field, pattern in LOG_FIELD_PATTERNS.items():
+        matches = pc.match_substring_regex(fields[field], pattern)
+        is_valid = matches if is_valid is None else pc.and_(is_valid, matches)
+
+    rejected = fields.filter(pc.invert(is_valid))
+    if rejected.num_rows:
+        malformed_lines.extend(pc.binary_join_element_wise(*rejected.columns, "\t").to_pylist())
+
+    if status is not None:
+        is_valid = pc.and_(is_valid, pc.equal(fields["status"], status))
+
+    fields = fields.filter(is_valid)
+    decoders = {
+        "timestamp": lambda: pc.utf8_slice_codeunits(fields["timestamp"], 1, -1),
+        "status": lambda: fields["status"],
+        "sensor_id": lambda: pc.cast(pc.utf8_slice_codeunits(fields["sensor"], 7, -2), pa.int64()),
+        "temperature": lambda: _parse_measure(fields["temperature"], len(", vibration")),
+        "vibration": lambda: _parse_measure(fields["vibration"], len(")")),
+    }
+    return pa.table({column: decoders[column]() for column in _log_columns(columns)}).to_pandas()
+
+
+def _decode_log_fields(fields: pa.Table, malformed_lines: list, status: str = None, columns: list = None) -> pd.DataFrame:
+    """
+    Decode a table of log fields, then parse the collected malformed lines with the log regex.
+
+    The rows recovered by the regex are appended after the columnar ones and `malformed_lines`
+    is emptied. When `status` is given, only the rows with that status are kept, and when
+    `columns` is given, only those log columns.
+    """
+    df = _parse_log_fields(fields, malformed_lines, status, columns)
+
+    if malformed_lines:
+        df = pd.concat([df, _parse_log_lines_regex(malformed_lines, status, columns)], ignore_index=True)
+        malformed_lines.clear()
+
     return df
 
 
-def process_data() -> pd.DataFrame:
-    """Process the raw data and return the equipment failures."""
+def _parse_log_columnar(source, status: str = None, columns: list = None) -> pd.DataFrame:
+    """
+    Parse the log as columns: the Arrow CSV reader splits the tab delimited layout and the fields
+    are validated and decoded with vectorized compute functions, without a Python loop per line.
+
+    Lines that do not fit the plain layout (other whitespace, stray tabs, values the field
+    patterns reject) fall back to `_parse_log_lines_regex`, so the rows kept are exactly the ones
+    accepted by the log regex. `source` is a file path or an Arrow stream.
+    """
+    malformed_lines = []
+    with stage("parse") as rows:
+        fields = pv.read_csv(source, **_log_csv_options(malformed_lines))
+        df = _decode_log_fields(fields, malformed_lines, status, columns)
+        rows["rows_out"] = len(df)
+    return df
+
+
+def decode_timestamps(values: pd.Series) -> tuple:
+    """
+    Decode the log timestamps, returning them with the distinct values that could not be parsed.
+
+    Every distinct string is decoded once, as the sensors of an asset share the timestamp of its
+    failure. The strings are grouped by the date and time layouts allowed in the log, and each
+    group is parsed with its explicit format; the few left over, such as dates and times split by
+    other whitespace, are parsed with the mixed format. Unparseable values are decoded as NaT.
+    """
+    codes, uniques = pd.factorize(values)
+    uniques = pd.Series(uniques, dtype=object)
+    decoded = pd.Series(pd.NaT, index=uniques.index, dtype="datetime64[ns]")
+
+    has_slash = uniques.str.contains("/", regex=False)
+    has_time = uniques.str.contains(":", regex=False)
+    for timestamp_format, is_format in [
+        ("%Y-%m-%d %H:%M:%S", ~has_slash & has_time),
+        ("%Y/%m/%d %H:%M:%S", has_slash & has_time),
+        ("%Y-%m-%d", ~has_slash & ~has_time),
+        ("%Y/%m/%d", has_slash & ~has_time),
+    ]:
+        if is_format.any():
+            decoded[is_format] = pd.to_datetime(uniques[is_format], format=timestamp_format, errors="coerce")
+
+    for value in uniques[decoded.isna()].index:
+        try:
+            decoded[value] = pd.to_datetime(uniques[value], format="mixed")
+        except (ValueError, OverflowError):
+            pass
+
+    timestamps = pd.Series(decoded.to_numpy().take(codes), index=values.index, name=values.name)
+    return timestamps, pd.Index(uniques[decoded.isna()])
+
+
+def _convert_log_types(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert the parsed log values to their types, with `err` readings as NaN.
+
+    Rows with unparseable timestamps are dropped and reported. The columns that were not parsed
+    are left out.
+    """
+    with stage("convert_types", rows_in=len(df)) as rows:
+        if "timestamp" in df:
+            df["timestamp"], unparseable = decode_timestamps(df["timestamp"])
+            if len(unparseable):
+                print(f"Dropping log rows with {len(unparseable)} unparseable timestamps: {list(unparseable[:10])}")
+                df = df[df["timestamp"].notna()]
+
+        if "sensor_id" in df:
+            df["sensor_id"] = pd.to_numeric(df["sensor_id"])
+        for column in ["temperature", "vibration"]:
+            if column in df:
+                df[column] = pd.to_numeric(df[column], errors="coerce")
+        rows["rows_out"] = len(df)
+    return df
+
+
+def compact_types(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert log or failure columns to their compact types: the timestamp to int64 epoch seconds,
+    the ids to int32, the status to a categorical code and the readings to float32.
+    """
+    df = df.astype({column: dtype for column, dtype in COMPACT_DTYPES.items() if column in df})
+    if "timestamp" in df and pd.api.types.is_datetime64_dtype(df["timestamp"]):
+        df["timestamp"] = df["timestamp"].to_numpy().astype("datetime64[s]").view("int64")
+    return df
+
+
+def get_log_dataframe(
+    log_file_path: str,
+    engine: str = "columnar",
+    workers: int = 1,
+    status: str = None,
+    compact: bool = False,
+    archive_path: str = None,
+    use_cache: bool = False,
+    columns: list = None,
+) -> pd.DataFrame:
+    """
+    Read a log file with the specific format, and convert it to a Pandas DataFrame.
+
+    The "columnar" engine parses the file with Arrow, the "mmap" engine parses it the same way
+    from a memory map, after dropping the lines without `status` from the raw bytes, and the
+    "regex" engine matches the log regex line by line. All return the same rows with the same
+    types. With more than one worker, the columnar and mmap engines parse byte ranges of the
+    memory mapped file in parallel processes. When `status` is given, the lines with another
+    status are dropped while parsing. With `compact`, the columns have
+    the types of `compact_types`. When `archive_path` is given, the log is streamed out of that
+    .tar.gz archive (see `stream_tar_member`) instead of being read from the extracted file.
+    With `use_cache`, the DataFrame is loaded from the data cache when the log and the parser
+    code did not change since it was last parsed with the same options. When `columns` is given,
+    only those log columns are decoded.
+    """
+
+    if use_cache:
+        return cached_dataframe(
+            "log",
+            [log_source_path(log_file_path, archive_path)],
+            _log_cache_params(
+                log_file_path, archive_path, engine=engine, status=status, compact=compact, columns=columns
+            ),
+            lambda: get_log_dataframe(log_file_path, engine, workers, status, compact, archive_path, columns=columns),
+            processing_version(),
+        )
+
+    if archive_path is not None:
+        if workers > 1:
+            raise ValueError("The log is parsed in parallel from the extracted file only")
+        with stream_tar_member(archive_path, log_file_path) as stream:
+            df = _parse_log_stream(stream, engine, status, columns)
+        return compact_types(df) if compact else df
+
+    if not os.path.exists(log_file_path):
+        _extract_log()
+
+    if engine in ("columnar", "mmap") and workers > 1:
+        df = _parse_log_parallel(log_file_path, workers, status, columns)
+    elif engine == "columnar":
+        df = _convert_log_types(_parse_log_columnar(log_file_path, status, columns))
+    elif engine == "mmap":
+        source = _open_log_range(log_file_path, 0, os.path.getsize(log_file_path), status)
+        df = _convert_log_types(_parse_log_columnar(source, status, columns))
+    elif engine == "regex":
+        with open(log_file_path, "r") as f:
+            df = _convert_log_types(_parse_log_lines_regex(f, status, columns))
+    else:
+        raise ValueError(f"Unknown log parser engine: {engine}")
+
+    return compact_types(df) if compact else df
+
+
+def _extract_log() -> None:
+    """Extract the log out of the archive, recorded as the "extract" stage."""
+    with stage("extract"):
+        extract_tar_gz(TAR_FILE_PATH, EXTRACTED_PATH)
+
+
+def log_source_path(log_file_path: str, archive_path: str = None) -> str:
+    """Path of the file the log is read from, extracting the archive when the log is missing."""
+    if archive_path is not None:
+        return archive_path
+    if not os.path.exists(log_file_path):
+        _extract_log()
+    return log_file_path
+
+
+def _log_cache_params(log_file_path: str, archive_path: str = None, **options) -> dict:
+    """Parameters keying a cached output of the log, besides the content of the files read."""
+    return {"log": os.path.basename(log_file_path), "from_archive": archive_path is not None, **options}
+
+
+def processing_version(*source_paths: str) -> str:
+    """
+    Version of the code parsing and joining the data, and of the `source_paths` deriving data
+    from it, for the data cache keys and the metadata of the data kept on disk.
+    """
+    return code_version(__file__, inspect.getsourcefile(stream_tar_member), *source_paths)
+
+
+def _parse_log_stream(stream, engine: str, status: str = None, columns: list = None) -> pd.DataFrame:
+    """
+    Parse a binary log stream, such as an archive member, with an engine of `get_log_dataframe`.
+
+    A stream cannot be memory mapped, so the "mmap" engine parses it as the "columnar" one.
+    """
+    if engine in ("columnar", "mmap"):
+        return _convert_log_types(_parse_log_columnar(stream, status, columns))
+    if engine == "regex":
+        return _convert_log_types(_parse_log_lines_regex(io.TextIOWrapper(stream), status, columns))
+    raise ValueError(f"Unknown log parser engine: {engine}")
+
+
+def complete_lines_size(log_file_path: str) -> int:
+    """Size in bytes of a log file up to the end of its last complete line."""
+    with open(log_file_path, "rb") as f:
+        end = f.seek(0, os.SEEK_END)
+        while end > 0:
+            start = max(0, end - 64 * 1024)
+            f.seek(start)
+            last_newline = f.read(end - start).rfind(b"\n")
+            if last_newline != -1:
+                return start + last_newline + 1
+            end = start
+    return 0
+
+
+def log_lines(buffer: pa.Buffer) -> pa.LargeBinaryArray:
+    """
+    View the raw bytes of a log as an array of lines, each with its line break, without copying them.
+
+    Only the newline offsets are computed, with a vectorized scan of the bytes.
+    """
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    line_ends = np.flatnonzero(data == ord("\n")) + 1
+    if len(data) and (len(line_ends) == 0 or line_ends[-1] != len(data)):
+        line_ends = np.append(line_ends, len(data))
+
+    offsets = np.concatenate([[0], line_ends]).astype(np.int64)
+    return pa.LargeBinaryArray.from_buffers(pa.large_binary(), len(line_ends), [None, pa.py_buffer(offsets), buffer])
+
+
+def select_log_lines(buffer: pa.Buffer, status: str) -> pa.Buffer:
+    """
+    Select the bytes of the log lines that may have the given status, out of the raw log bytes.
+
+    A line with that status contains "]\t<status>\t", so the lines without it are dropped with a
+    vectorized substring search, before any of their fields is decoded or copied. The lines kept
+    are still validated by the parser.
+    """
+    with stage("select_lines") as rows:
+        lines = log_lines(buffer)
+        rows["rows_in"] = len(lines)
+        lines = pc.filter(lines, pc.match_substring(lines, f"]\t{status}\t"))
+        rows["rows_out"] = len(lines)
+
+    offsets = np.frombuffer(lines.buffers()[1], dtype=np.int64)[lines.offset:lines.offset + len(lines) + 1]
+    return lines.buffers()[2].slice(offsets[0], offsets[-1] - offsets[0])
+
+
+def _open_log_range(log_file_path: str, start: int, end: int, status: str = None):
+    """
+    Open the bytes [start, end) of a log file as a zero copy stream over a memory map.
+
+    When `status` is given, the stream only has the lines selected by `select_log_lines`.
+    """
+    source = pa.memory_map(log_file_path)
+    source.seek(start)
+    buffer = source.read_buffer(end - start)
+    return pa.BufferReader(buffer if status is None else select_log_lines(buffer, status))
+
+
+def _log_shards(log_file_path: str, shards: int) -> list:
+    """Split a log file in about `shards` byte ranges of the same size, aligned to line starts."""
+    size = os.path.getsize(log_file_path)
+    boundaries = [0]
+
+    with open(log_file_path, "rb") as f:
+        for shard in range(1, shards):
+            f.seek(max(size * shard // shards, boundaries[-1]))
+            f.readline()
+            if f.tell() < size:
+                boundaries.append(f.tell())
+
+    boundaries.append(size)
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if start < end]
+
+
+def _parse_log_shard(
+    log_file_path: str, start: int, end: int, status: str = None, columns: list = None
+) -> pd.DataFrame:
+    """Parse a byte range of the log in a worker, with a categorical status so it is sent back compactly."""
+    df = _convert_log_types(_parse_log_columnar(_open_log_range(log_file_path, start, end, status), status, columns))
+    if "status" in df:
+        df["status"] = df["status"].astype("category")
+    return df
+
+
+def _parse_log_parallel(log_file_path: str, workers: int, status: str = None, columns: list = None) -> pd.DataFrame:
+    """
+    Parse the log with the columnar engine in `workers` processes, one per byte range of the file.
+
+    The shards come back as typed columns and are concatenated in file order.
+    """
+    shards = _log_shards(log_file_path, workers)
+
+    with stage("parse_parallel") as rows:
+        with ProcessPoolExecutor(workers, mp_context=get_context("spawn")) as executor:
+            frames = list(executor.map(
+                _parse_log_shard,
+                repeat(log_file_path),
+                [start for start, _ in shards],
+                [end for _, end in shards],
+                repeat(status),
+                repeat(columns),
+            ))
+
+        df = pd.concat(frames, ignore_index=True)
+        if "status" in df:
+            df["status"] = df["status"].astype(object)
+        rows["rows_out"] = len(df)
+    return df
+
+
+def iter_log_dataframes(
+    log_file_path: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    start: int = 0,
+    end: int = None,
+    status: str = None,
+    archive_path: str = None,
+    columns: list = None,
+):
+    """
+    Read a log file in chunks of about `chunk_size` bytes, yielding one typed DataFrame per chunk.
+
+    Uses the columnar engine of `get_log_dataframe` on a streaming reader, so memory is bounded
+    by the chunk size instead of the file size. `start` and `end` restrict the reading to a byte
+    range, which must begin and finish at line boundaries. When `status` is given, only the
+    lines with that status are kept, and when `columns` is given, only those log columns. When
+    `archive_path` is given, the whole log is streamed out of that .tar.gz archive.
+    """
+
+    if archive_path is not None:
+        if start != 0 or end is not None:
+            raise ValueError("A byte range of the log is read from the extracted file only")
+        with stream_tar_member(archive_path, log_file_path) as stream:
+            yield from _iter_log_stream(stream, chunk_size, status, columns)
+        return
+
+    if not os.path.exists(log_file_path):
+        _extract_log()
+
+    size = os.path.getsize(log_file_path)
+    end = size if end is None else end
+    if start >= end:
+        return
+
+    source = log_file_path if (start, end) == (0, size) else _open_log_range(log_file_path, start, end)
+    yield from _iter_log_stream(source, chunk_size, status, columns)
+
+
+def _iter_log_stream(source, chunk_size: int, status: str = None, columns: list = None):
+    """Parse a log file path or stream in chunks, see `iter_log_dataframes`."""
+    malformed_lines = []
+    with pv.open_csv(source, **_log_csv_options(malformed_lines, chunk_size)) as reader:
+        for batch in reader:
+            with stage("parse", rows_in=batch.num_rows) as rows:
+                df = _decode_log_fields(pa.Table.from_batches([batch]), malformed_lines, status, columns)
+                rows["rows_out"] = len(df)
+            yield _convert_log_types(df)
+
+    if malformed_lines:
+        yield _convert_log_types(_parse_log_lines_regex(malformed_lines, status, columns))
+
+
+def get_equipment_sensors() -> pd.DataFrame:
+    """Load the equipment data joined with the sensors of each asset."""
+    equipment = pd.read_json(EQUIPMENT_FILE_PATH)
+    equipment_sensors = pd.read_csv(EQUIPMENT_SENSORS_FILE_PATH)
+    return equipment.merge(equipment_sensors, on="equipment_id", how="left")
+
+
+def get_equipment_lookup() -> tuple:
+    """
+    Load the equipment data, with categorical names and groups, and an array mapping every
+    sensor id to the position of its equipment (-1 for sensors without equipment).
+
+    The array holds one equipment per sensor: unlike a merge on the sensor id, which repeats the
+    failures of a sensor for each of its equipment, a sensor attached to more than one equipment
+    raises a ValueError. Sensors with a negative id, which no log line has, are left out.
+    """
+    with stage("load_equipment") as rows:
+        equipment = pd.read_json(EQUIPMENT_FILE_PATH).rename(columns=EQUIPMENT_COLUMN_NAMES)
+        equipment_sensors = pd.read_csv(EQUIPMENT_SENSORS_FILE_PATH).drop_duplicates()
+        equipment_sensors = equipment_sensors[equipment_sensors["sensor_id"] >= 0]
+
+        shared_sensors = equipment_sensors.loc[equipment_sensors["sensor_id"].duplicated(), "sensor_id"].unique()
+        if len(shared_sensors):
+            raise ValueError(f"Sensors attached to more than one equipment: {sorted(shared_sensors.tolist())}")
+
+        n_sensor_ids = equipment_sensors["sensor_id"].max() + 1 if len(equipment_sensors) else 0
+        sensor_lookup = np.full(n_sensor_ids, -1, dtype=np.int32)
+        sensor_lookup[equipment_sensors["sensor_id"]] = pd.Index(equipment["equipment_id"]) \
+            .get_indexer(equipment_sensors["equipment_id"])
+
+        equipment = equipment.astype({"equipment_name": "category", "equipment_group": "category"})
+        rows["rows_out"] = len(equipment_sensors)
+    return equipment, sensor_lookup
+
+
+def failure_key_columns(status: str = "ERROR") -> list:
+    """
+    The columns the duplicated failures are dropped on: the key columns, and the status when the
+    failures are not filtered on one `status`, so rows of different statuses are all kept.
+    """
+    return FAILURE_KEY_COLUMNS if status is not None else FAILURE_KEY_COLUMNS + ["status"]
+
+
+def failure_scan_columns(columns: list = None, distinct: bool = True, status: str = "ERROR") -> tuple:
+    """
+    The log and equipment columns read for failures with `columns`: the ones kept, the sensor id
+    the join is made on and, with `distinct`, the columns of `failure_key_columns` the duplicates
+    are dropped on.
+    """
+    read_columns = set(FAILURE_COLUMNS if columns is None else columns) | {"sensor_id"}
+    if distinct:
+        read_columns |= set(failure_key_columns(status))
+    return _log_columns(read_columns), [column for column in EQUIPMENT_COLUMNS if column in read_columns]
+
+
+def join_equipment_failures(
+    equipment_lookup: tuple,
+    log: pd.DataFrame,
+    columns: list = None,
+    status: str = "ERROR",
+    distinct: bool = True,
+) -> pd.DataFrame:
+    """
+    Join the log rows with `status` with the equipment of their sensors, dropping duplicated rows
+    on the columns of `failure_key_columns`.
+
+    The equipment of each row is found by indexing the sensor lookup array of
+    `get_equipment_lookup` with its sensor id, instead of merging on it; the sensor ids outside
+    the array, negative ones included, have no equipment. The status is checked when the log has
+    a status column. When `columns` is given, only the equipment columns among them are joined
+    and only those failure columns are kept once the duplicates are dropped on the key columns;
+    the log must have the other columns read by `failure_scan_columns`.
+    """
+    equipment, sensor_lookup = equipment_lookup
+    columns = FAILURE_COLUMNS if columns is None else columns
+    log_columns, equipment_columns = failure_scan_columns(columns, distinct, status)
+
+    with stage("join_equipment", rows_in=len(log)) as rows:
+        sensor_ids = log["sensor_id"].to_numpy()
+        positions = np.full(len(sensor_ids), -1, dtype=np.int32)
+        is_known = (sensor_ids >= 0) & (sensor_ids < len(sensor_lookup))
+        positions[is_known] = sensor_lookup[sensor_ids[is_known]]
+
+        is_failure = positions >= 0
+        if status is not None and "status" in log:
+            is_failure &= (log["status"] == status).to_numpy()
+        equipment_failures = pd.concat([
+            equipment[equipment_columns].take(positions[is_failure]).reset_index(drop=True),
+            log.loc[is_failure, log_columns].reset_index(drop=True),
+        ], axis=1)[[column for column in FAILURE_COLUMNS if column in equipment_columns + log_columns]]
+        rows["rows_out"] = len(equipment_failures)
+
+    if distinct:
+        with stage("drop_duplicates", rows_in=len(equipment_failures)) as rows:
+            # A log without status column was already filtered on one.
+            key_columns = [column for column in failure_key_columns(status) if column in equipment_failures]
+            equipment_failures = equipment_failures.drop_duplicates(subset=key_columns)
+            rows["rows_out"] = len(equipment_failures)
+
+    kept_columns = [column for column in FAILURE_COLUMNS if column in columns]
+    if kept_columns != list(equipment_failures.columns):
+        equipment_failures = equipment_failures[kept_columns]
+    return equipment_failures
+
+
+def process_data(
+    workers: int = 1,
+    compact: bool = False,
+    from_archive: bool = False,
+    use_cache: bool = False,
+    columns: list = None,
+    status: str = "ERROR",
+    distinct: bool = True,
+) -> pd.DataFrame:
+    """
+    Process the raw data and return the equipment failures, parsing the log with `workers`
+    processes. With `compact`, the failures have the types of `compact_types`. With
+    `from_archive`, the log is streamed out of the .tar.gz archive without extracting it. With
+    `use_cache`, the failures, or else the parsed log, are loaded from the data cache when their
+    input files and code did not change.
+
+    The log lines with another `status` are dropped from the raw bytes, before being parsed, and
+    only the columns of `failure_scan_columns` are decoded and joined. Duplicated failures are
+    dropped on the key columns when `distinct` is set, then only `columns` are kept. See
+    `FailureQuery` for the lazy interface to this.
+    """
+    archive_path = TAR_FILE_PATH if from_archive else None
+
+    with stage("process_data") as rows:
+        if use_cache:
+            equipment_failures = cached_dataframe(
+                "equipment_failures",
+                EQUIPMENT_FILE_PATHS + [log_source_path(LOG_FILE_PATH, archive_path)],
+                _log_cache_params(
+                    LOG_FILE_PATH, archive_path, compact=compact, columns=columns, status=status, distinct=distinct
+                ),
+                lambda: _process_data(workers, compact, archive_path, use_cache, columns, status, distinct),
+                processing_version(),
+            )
+        else:
+            equipment_failures = _process_data(workers, compact, archive_path, columns=columns, status=status, distinct=distinct)
+        rows["rows_out"] = len(equipment_failures)
+
+    return equipment_failures
+
+
+def _process_data(
+    workers: int,
+    compact: bool,
+    archive_path: str = None,
+    use_cache: bool = False,
+    columns: list = None,
+    status: str = "ERROR",
+    distinct: bool = True,
+) -> pd.DataFrame:
+    """Parse the log and join it with the equipment, see `process_data`."""
 
     print("Loading data...")
-    equipment = pd.read_json("data/equipment.json")
-    equipment_sensors = pd.read_csv("data/equipment_sensors.csv")
-    equipment_failure_sensors = get_log_dataframe("data/extracted/equipment_failure_sensors/equpment_failure_sensors.txt")
+    equipment_lookup = get_equipment_lookup()
+    log_columns, _ = failure_scan_columns(columns, distinct, status)
+    equipment_failure_sensors = get_log_dataframe(
+        LOG_FILE_PATH,
+        engine="mmap",
+        workers=workers,
+        status=status,
+        compact=compact,
+        archive_path=archive_path,
+        use_cache=use_cache,
+        columns=log_columns,
+    )
 
     print("Processing data...")
-    equipment_failures = (
-        equipment
-        .merge(equipment_sensors, on="equipment_id", how="left")
-        .merge(equipment_failure_sensors, on="sensor_id", how="left")
-        .drop_duplicates()
+    equipment_failures = join_equipment_failures(
+        equipment_lookup, equipment_failure_sensors, columns, status, distinct
     )
-
-    equipment_failures = equipment_failures[equipment_failures["status"] == "ERROR"]
-    equipment_failures.rename(columns={"name": "equipment_name", "group_name": "equipment_group"}, inplace=True)
+    if compact:
+        equipment_failures = compact_types(equipment_failures)
     
     print("Data processed successfully!")
     return equipment_failures
+
+
+def iter_equipment_failures(
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    start: int = 0,
+    end: int = None,
+    from_archive: bool = False,
+    columns: list = None,
+    failure_keys: FailureKeys = None,
+):
+    """
+    Process the raw data in chunks, yielding the equipment failures of each log chunk.
+
+    Duplicated failures are dropped across the chunks, as in the whole log: the failures whose
+    key columns were seen in a previous chunk, or are in `failure_keys` when given, are dropped
+    and the keys of the others added to it, so a run resumed with the `failure_keys` of the
+    previous ones drops the failures they saw. `start` and `end` restrict the log to a byte
+    range, see `iter_log_dataframes`. With `from_archive`, the log is streamed out of the .tar.gz
+    archive. When `columns` is given, only those failure columns are kept, and only the log
+    columns they need, and the key columns, are decoded.
+    """
+
+    print("Loading data...")
+    equipment_lookup = get_equipment_lookup()
+    failure_keys = FailureKeys() if failure_keys is None else failure_keys
+    kept_columns = FAILURE_COLUMNS if columns is None else [column for column in FAILURE_COLUMNS if column in columns]
+    read_columns = [column for column in FAILURE_COLUMNS if column in kept_columns or column in FAILURE_KEY_COLUMNS]
+
+    print("Processing data in chunks...")
+    archive_path = TAR_FILE_PATH if from_archive else None
+    log_columns, _ = failure_scan_columns(read_columns)
+    for equipment_failure_sensors in iter_log_dataframes(
+        LOG_FILE_PATH, chunk_size, start, end, status="ERROR", archive_path=archive_path, columns=log_columns
+    ):
+        equipment_failures = join_equipment_failures(equipment_lookup, equipment_failure_sensors, read_columns)
+        with stage("drop_seen_failures", rows_in=len(equipment_failures)) as rows:
+            equipment_failures = failure_keys.drop_seen(equipment_failures, FAILURE_KEY_COLUMNS)
+            rows["rows_out"] = len(equipment_failures)
+        yield equipment_failures if read_columns == kept_columns else equipment_failures[kept_columns]
@@ -0,0 +1,127 @@
+"""
+Lazy queries of the equipment failures: the parsing, join and filter stages are described first,
+then optimized into a physical plan and run at once by `collect`.
+"""
+
+from data.instrumentation import stage
+from data.process_raw_data import FAILURE_COLUMNS, failure_key_columns, failure_scan_columns, process_data
+
+
+class FailureQuery():
+    """
+    A lazy query of the equipment failures, the log rows joined with the equipment of their sensors.
+
+    Building a query only records its operations, each returning a new query. `optimize` turns
+    them into a plan run in a fixed order, whatever the order they were added in: the status
+    filter, the join, `distinct`, the other filters, then the projection. A query has the results
+    of that order:
+
+    - projection pushdown: only the columns selected, filtered on or deduplicated on are decoded
+      from the log and joined with the equipment;
+    - predicate pushdown: a filter on the status drops the other lines from the raw log bytes,
+      before they are parsed, and the status is then only decoded when it is selected;
+    - the duplicates are dropped on the columns of `failure_key_columns`, not on the columns
+      joined to them, and on the status as well when there is no status filter, so failures
+      with the same readings but different statuses are all kept.
+    """
+
+    def __init__(self, operations: tuple = ()):
+        self.operations = operations
+
+    def _columns(self) -> list:
+        """The columns of the failures of the query."""
+        columns = FAILURE_COLUMNS
+        for operation, *args in self.operations:
+            if operation == "select":
+                columns = args[0]
+        return columns
+
+    def _check_columns(self, columns) -> None:
+        """Raise a ValueError for the columns the query does not have."""
+        unknown = [column for column in columns if column not in self._columns()]
+        if unknown:
+            raise ValueError(f"Unknown failure columns: {unknown}")
+
+    def filter(self, **values) -> "FailureQuery":
+        """Keep the failures whose columns equal the given values, such as `filter(status="ERROR")`."""
+        self._check_columns(values)
+        return FailureQuery(self.operations + tuple(("filter", column, value) for column, value in values.items()))
+
+    def distinct(self) -> "FailureQuery":
+        """Drop the duplicated failures, the ones with the same columns of `failure_key_columns`."""
+        return FailureQuery(self.operations + (("distinct",),))
+
+    def select(self, *columns) -> "FailureQuery":
+        """Keep only the given columns, in that order."""
+        self._check_columns(columns)
+        return FailureQuery(self.operations + (("select", list(columns)),))
+
+    def optimize(self) -> dict:
+        """
+        The physical plan of the query: the status the log lines are selected by, the columns
+        read from the log and the equipment, whether the duplicates are dropped, the filters left
+        to apply on the joined failures and the columns returned.
+        """
+        status, filters, distinct = None, [], False
+        for operation, *args in self.operations:
+            if operation == "filter" and args[0] == "status":
+                if status is not None and status != args[1]:
+                    raise ValueError(f"Conflicting status filters: {status!r} and {args[1]!r}")
+                status = args[1]
+            elif operation == "filter":
+                filters.append(tuple(args))
+            elif operation == "distinct":
+                distinct = True
+
+        columns = self._columns()
+        filter_columns = {column for column, _ in filters}
+        read_columns = [column for column in FAILURE_COLUMNS if column in columns or column in filter_columns]
+        log_columns, equipment_columns = failure_scan_columns(read_columns, distinct, status)
+
+        return {
+            "status": status,
+            "log_columns": log_columns,
+            "equipment_columns": equipment_columns,
+            "read_columns": read_columns,
+            "distinct": distinct,
+            "filters": filters,
+            "columns": columns,
+        }
+
+    def explain(self) -> str:
+        """Describe the physical plan of the query, from the last step to the log scan."""
+        plan = self.optimize()
+        steps = [f"Project {', '.join(plan['columns'])}"]
+        steps += [f"Filter {column} == {value!r}" for column, value in plan["filters"]]
+        if plan["distinct"]:
+            steps.append(f"Distinct on {', '.join(failure_key_columns(plan['status']))}")
+        steps.append(f"Join equipment ({', '.join(plan['equipment_columns'])}) on sensor_id")
+
+        scan = f"Scan log ({', '.join(plan['log_columns'])})"
+        if plan["status"] is not None:
+            scan += f", lines with status == {plan['status']!r} selected from the raw bytes"
+        steps.append(scan)
+
+        return "\n".join("  " * depth + step for depth, step in enumerate(steps))
+
+    def collect(self, workers: int = 1, compact: bool = False, from_archive: bool = False, use_cache: bool = False):
+        """Run the query with `process_data`, see it for the options, returning the failures as a DataFrame."""
+        plan = self.optimize()
+        equipment_failures = process_data(
+            workers, compact, from_archive, use_cache, plan["read_columns"], plan["status"], plan["distinct"]
+        )
+
+        if plan["filters"]:
+            with stage("filter", rows_in=len(equipment_failures)) as rows:
+                for column, value in plan["filters"]:
+                    equipment_failures = equipment_failures[equipment_failures[column] == value]
+                rows["rows_out"] = len(equipment_failures)
+
+        if list(equipment_failures.columns) != plan["columns"]:
+            equipment_failures = equipment_failures[plan["columns"]]
+        return equipment_failures
+
+
+def scan_failures() -> FailureQuery:
+    """A lazy query of all the equipment failures, to add operations to."""
+    return FailureQuery()
@@ -0,0 +1,501 @@
+"""
+Long-running query service of the equipment failures: the failures are reduced once to aggregates
+indexed by equipment, sensor and day, kept in memory, and the questions are answered from them
+for any date range, equipment, equipment group and sensor filter over HTTP.
+
+A background thread folds the log bytes appended since the last refresh into the aggregates, as
+the incremental analysis does, and swaps in the new index without stopping the queries. The
+aggregates are checkpointed, so a restarted service only parses the bytes appended meanwhile.
+
+Run from the repository root:
+    PYTHONPATH=src python -m data.query_service --port 8000
+
+Then query it, for instance:
+    curl "http://127.0.0.1:8000/questions?start=2020-01-01&end=2020-02-01&equipment_group=FGHQWR2Q"
+    curl "http://127.0.0.1:8000/q4?sensor_id=2020,8866&top_sensors=5"
+    curl "http://127.0.0.1:8000/status"
+"""
+
+import argparse
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+from data.aggregates import EVENT_COLUMNS, SENSOR_COLUMNS, fold_partials
+from data.checkpoint import load_checkpoint, log_fingerprint, save_checkpoint
+from data.failure_keys import FailureKeys
+from data.generate_analysis import (
+    DEFAULT_TOP_SENSORS,
+    QUESTION_KEYS,
+    build_results,
+    sensor_failures_table,
+    typed_equipment,
+)
+from data.instrumentation import stage
+from data.process_raw_data import (
+    DEFAULT_CHUNK_SIZE,
+    EQUIPMENT_COLUMNS,
+    EQUIPMENT_FILE_PATHS,
+    LOG_FILE_PATH,
+    complete_lines_size,
+    iter_equipment_failures,
+    processing_version,
+)
+
+SERVICE_CHECKPOINT_PATH = "data/service_checkpoint"
+INDEX_COLUMNS = ["equipment_id", "equipment_name", "equipment_group", "sensor_id", "timestamp"]
+SENSOR_DAY_COLUMNS = ["equipment_id", "sensor_id", "day"]
+SENSOR_EVENT_COLUMNS = ["equipment_id", "sensor_id", "timestamp"]
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8000
+DEFAULT_REFRESH_INTERVAL = 5.0
+QUESTION_PATHS = {"/q1": "q1_result", "/q2": "q2_result", "/q3": "q3_result", "/q4": "q4_result"}
+
+
+def _index_aggregates(equipment_failures: pd.DataFrame) -> dict:
+    """
+    Reduce equipment failures to the aggregates of the index: the failure count, the equipment,
+    the distinct (equipment, sensor, timestamp) failure events and the failures per sensor and day.
+    """
+    with stage("index_aggregates", rows_in=len(equipment_failures)) as rows:
+        sensor_days = equipment_failures[SENSOR_COLUMNS] \
+            .assign(day=equipment_failures["timestamp"].dt.normalize()) \
+            .groupby(SENSOR_DAY_COLUMNS) \
+            .size() \
+            .rename("failures") \
+            .reset_index()
+        rows["rows_out"] = len(sensor_days)
+
+    return {
+        "failures": equipment_failures.shape[0],
+        "equipment": equipment_failures[EQUIPMENT_COLUMNS].drop_duplicates(),
+        "sensor_events": equipment_failures[SENSOR_EVENT_COLUMNS].drop_duplicates(),
+        "sensor_days": sensor_days,
+    }
+
+
+def _merge_index_aggregates(parts: list) -> dict:
+    """Merge the index aggregates of some log chunks, deduplicating the events of all of them at once."""
+    with stage("merge_index_aggregates"):
+        return {
+            "failures": sum(part["failures"] for part in parts),
+            "equipment": pd.concat([part["equipment"] for part in parts]).drop_duplicates(),
+            "sensor_events": pd.concat([part["sensor_events"] for part in parts]).drop_duplicates(),
+            "sensor_days": pd.concat([part["sensor_days"] for part in parts])
+                .groupby(SENSOR_DAY_COLUMNS)["failures"]
+                .sum()
+                .reset_index(),
+        }
+
+
+def _list_filter(values) -> np.ndarray:
+    """The values of a list filter as an array, or None when the filter is not set."""
+    return None if values is None else np.asarray(list(values))
+
+
+def _day_numbers(days) -> np.ndarray:
+    """Days as numbers of days since the epoch."""
+    return np.asarray(days, dtype="datetime64[ns]").astype("datetime64[D]").astype("int64")
+
+
+def _day(value, name: str) -> int:
+    """A `start` or `end` filter as a day number, raising a ValueError when it is not a date."""
+    day = pd.Timestamp(value)
+    if day != day.normalize():
+        raise ValueError(f"The index is by day, {name} must be a date, got {value!r}")
+    return int(_day_numbers([day.to_datetime64()])[0])
+
+
+class DailyCounts():
+    """
+    Counts of items, such as sensors, per day, summed over any range of days with a prefix sum.
+
+    The counts are sorted by item and day under a single int64 key, the item code then the day,
+    and summed cumulatively, so the sum of every item over a range of days is the difference of
+    the cumulative sums at two binary searches of the key, whatever the number of days.
+    """
+
+    def __init__(self, counts: pd.DataFrame, item_columns: list, count_column: str):
+        counts = counts.sort_values(by=item_columns + ["day"]).reset_index(drop=True)
+        items = counts[item_columns]
+        item_starts = np.ones(len(counts), dtype=bool)
+        item_starts[1:] = (items.iloc[1:].to_numpy() != items.iloc[:-1].to_numpy()).any(axis=1)
+
+        self.items = items[item_starts].reset_index(drop=True)
+        days = _day_numbers(counts["day"])
+        self.first_day = int(days.min()) if len(days) else 0
+        self.span = int(days.max()) - self.first_day + 2 if len(days) else 1
+        self.keys = (np.cumsum(item_starts) - 1) * self.span + days - self.first_day
+        self.cumulative = np.concatenate([[0], np.cumsum(counts[count_column].to_numpy(dtype="int64"))])
+
+    def range_counts(self, start: int = None, end: int = None) -> np.ndarray:
+        """The counts of every item from the `start` day number (included) to the `end` one (excluded)."""
+        start = 0 if start is None else min(max(start - self.first_day, 0), self.span - 1)
+        end = self.span - 1 if end is None else min(max(end - self.first_day, 0), self.span - 1)
+        bases = np.arange(len(self.items), dtype="int64") * self.span
+        first = np.searchsorted(self.keys, bases + start)
+        last = np.searchsorted(self.keys, bases + max(start, end))
+        return self.cumulative[last] - self.cumulative[first]
+
+
+class FailureIndex():
+    """
+    The aggregates of the failures, as `DailyCounts` summed over any date range:
+
+    - the failures per equipment sensor and day, which questions 1 and 4 are answered from;
+    - the distinct failure events per equipment and day, which questions 1 to 3 are answered from.
+
+    The failure events of some sensors are not a sum of daily counts, as sensors of an equipment
+    share the timestamps of its failures, so they are counted from the distinct (equipment,
+    sensor, timestamp) events, sorted by sensor, for the queries with a sensor filter.
+
+    An index is never modified: a refresh builds a new one, so queries need no lock.
+    """
+
+    def __init__(self, aggregates: dict, offset: int):
+        self.offset = offset
+        self.failures = int(aggregates["failures"])
+        self.refreshed_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        self.equipment = typed_equipment(aggregates["equipment"]) \
+            .sort_values(by="equipment_id") \
+            .reset_index(drop=True)
+
+        sensor_days = aggregates["sensor_days"].astype({"equipment_id": "int64", "sensor_id": "int64"})
+        self.sensor_failures = DailyCounts(sensor_days, SENSOR_COLUMNS, "failures")
+
+        sensor_events = aggregates["sensor_events"] \
+            .astype({"equipment_id": "int64", "sensor_id": "int64"}) \
+            .sort_values(by="sensor_id", kind="stable") \
+            .reset_index(drop=True)
+        self.event_sensor_ids = sensor_events["sensor_id"].to_numpy()
+        self.sensor_events = sensor_events[EVENT_COLUMNS]
+
+        events = self.sensor_events.drop_duplicates()
+        event_days = events[["equipment_id"]] \
+            .assign(day=events["timestamp"].dt.normalize()) \
+            .groupby(["equipment_id", "day"]) \
+            .size() \
+            .rename("events") \
+            .reset_index()
+        self.equipment_events = DailyCounts(event_days, ["equipment_id"], "events")
+
+    def _equipment_ids(self, equipment_ids=None, equipment_groups=None, sensor_ids=None) -> np.ndarray:
+        """The ids of the equipment matching all the filters set, or None when none is set."""
+        ids = None
+        if equipment_ids is not None:
+            ids = _list_filter(equipment_ids).astype("int64")
+        if equipment_groups is not None:
+            group_ids = self.equipment.loc[self.equipment["equipment_group"].isin(list(equipment_groups)), "equipment_id"]
+            ids = group_ids.to_numpy() if ids is None else np.intersect1d(ids, group_ids)
+        if sensor_ids is not None:
+            sensors = self.sensor_failures.items
+            sensor_equipment = sensors.loc[sensors["sensor_id"].isin(sensor_ids), "equipment_id"]
+            ids = sensor_equipment.to_numpy() if ids is None else np.intersect1d(ids, sensor_equipment)
+        return ids
+
+    def _sensor_equipment_events(self, sensor_ids: np.ndarray, start: int = None, end: int = None) -> pd.DataFrame:
+        """
+        The distinct failure events of every equipment among the failures of some sensors, from
+        the `start` day number (included) to the `end` one (excluded).
+        """
+        sensor_ids = np.unique(sensor_ids)
+        firsts = np.searchsorted(self.event_sensor_ids, sensor_ids, side="left")
+        lasts = np.searchsorted(self.event_sensor_ids, sensor_ids, side="right")
+        positions = np.concatenate([np.arange(first, last) for first, last in zip(firsts, lasts)] + [np.empty(0, "int64")])
+
+        events = self.sensor_events.take(positions)
+        days = _day_numbers(events["timestamp"])
+        in_range = np.ones(len(events), dtype=bool)
+        if start is not None:
+            in_range &= days >= start
+        if end is not None:
+            in_range &= days < end
+
+        return events[in_range] \
+            .drop_duplicates() \
+            .groupby("equipment_id") \
+            .size() \
+            .rename("failures") \
+            .reset_index()
+
+    def query(
+        self,
+        start=None,
+        end=None,
+        equipment_ids: list = None,
+        equipment_groups: list = None,
+        sensor_ids: list = None,
+        top_sensors: int = DEFAULT_TOP_SENSORS,
+        keep_ties: bool = False,
+    ) -> dict:
+        """
+        Answer the questions for the failures from the `start` day (included) to the `end` day
+        (excluded), of some equipment ids, equipment groups and sensor ids, with the results of
+        `generate_filtered_analysis`.
+        """
+        with stage("query_index") as rows:
+            start = None if start is None else _day(start, "start")
+            end = None if end is None else _day(end, "end")
+            sensor_ids = None if sensor_ids is None else _list_filter(sensor_ids).astype("int64")
+            equipment_ids = self._equipment_ids(equipment_ids, equipment_groups, sensor_ids)
+
+            sensors = self.sensor_failures.items.assign(failures=self.sensor_failures.range_counts(start, end))
+            if sensor_ids is None:
+                equipment = self.equipment_events.items.assign(failures=self.equipment_events.range_counts(start, end))
+            else:
+                sensors = sensors[sensors["sensor_id"].isin(sensor_ids)]
+                equipment = self._sensor_equipment_events(sensor_ids, start, end)
+            if equipment_ids is not None:
+                sensors = sensors[sensors["equipment_id"].isin(equipment_ids)]
+                equipment = equipment[equipment["equipment_id"].isin(equipment_ids)]
+            sensors = sensors[sensors["failures"] > 0]
+            equipment = equipment[equipment["failures"] > 0]
+            rows["rows_out"] = len(sensors) + len(equipment)
+
+            return build_results(
+                int(sensors["failures"].sum()),
+                int(equipment["failures"].sum()),
+                self.equipment.merge(equipment, on="equipment_id"),
+                sensor_failures_table(sensors.set_index(SENSOR_COLUMNS)["failures"], self.equipment),
+                top_sensors,
+                keep_ties,
+            )
+
+
+class QueryService():
+    """
+    The failure index of the log, kept up to date by `refresh`, which a background thread calls
+    every `refresh_interval` seconds once the service is started.
+    """
+
+    def __init__(
+        self,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        refresh_interval: float = DEFAULT_REFRESH_INTERVAL,
+        checkpoint_path: str = SERVICE_CHECKPOINT_PATH,
+    ):
+        self.chunk_size = chunk_size
+        self.refresh_interval = refresh_interval
+        self.checkpoint_path = checkpoint_path
+        self.index = None
+        self._aggregates = None
+        self._failure_keys = FailureKeys()
+        self._offset = 0
+        self._fingerprint = None
+        self._refresh_lock = threading.Lock()
+        self._stopped = threading.Event()
+        # The checkpoint is discarded when the equipment files or the indexing code changed.
+        self._checkpoint_options = {"input_paths": EQUIPMENT_FILE_PATHS, "version": processing_version(__file__)}
+
+    def load(self) -> None:
+        """Load the aggregates of the checkpoint, if it matches the log, and fold the bytes appended since."""
+        self._offset, self._aggregates = load_checkpoint(LOG_FILE_PATH, self.checkpoint_path, **self._checkpoint_options)
+        if self._aggregates is not None:
+            self._failure_keys = FailureKeys(self._aggregates.pop("failure_keys"))
+            self._fingerprint = log_fingerprint(LOG_FILE_PATH, self._offset)
+            self.index = FailureIndex(self._aggregates, self._offset)
+        self.refresh()
+
+    def refresh(self) -> bool:
+        """
+        Fold the complete log lines appended since the last refresh into the aggregates, and swap
+        in their new index. The failures seen in earlier lines are dropped, as in the whole log. A
+        log that was rewritten instead of appended to is indexed again from the start. Returns
+        whether the index changed.
+        """
+        with self._refresh_lock:
+            end = complete_lines_size(LOG_FILE_PATH)
+            if self._offset > 0 and (
+                end < self._offset or log_fingerprint(LOG_FILE_PATH, self._offset) != self._fingerprint
+            ):
+                print("The log was rewritten, indexing it from the start")
+                self._offset, self._aggregates, self._failure_keys = 0, None, FailureKeys()
+            if end == self._offset:
+                return False
+
+            print(f"Indexing log bytes {self._offset:,} to {end:,}...")
+            with stage("refresh_index"):
+                # A copy, so a failed refresh leaves the keys of the current aggregates.
+                failure_keys = self._failure_keys.copy()
+                partials = (
+                    _index_aggregates(equipment_failures)
+                    for equipment_failures in iter_equipment_failures(
+                        self.chunk_size, self._offset, end, columns=INDEX_COLUMNS, failure_keys=failure_keys
+                    )
+                )
+                aggregates = fold_partials(self._aggregates, partials, _merge_index_aggregates)
+                if aggregates is None:
+                    return False
+
+                save_checkpoint(
+                    LOG_FILE_PATH,
+                    end,
+                    {**aggregates, "failure_keys": failure_keys.hashes()},
+                    self.checkpoint_path,
+                    **self._checkpoint_options,
+                )
+                self._offset, self._aggregates, self._failure_keys = end, aggregates, failure_keys
+                self._fingerprint = log_fingerprint(LOG_FILE_PATH, end)
+                self.index = FailureIndex(aggregates, end)
+
+            print(f"Index ready: {self.index.failures:,} failures up to byte {end:,}")
+            return True
+
+    def _refresh_periodically(self) -> None:
+        """Refresh the index every `refresh_interval` seconds until the service is stopped."""
+        while not self._stopped.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Error refreshing the index: {e}")
+
+    def start(self) -> None:
+        """Build the index, then keep refreshing it in a background thread."""
+        self.load()
+        threading.Thread(target=self._refresh_periodically, daemon=True).start()
+
+    def stop(self) -> None:
+        """Stop refreshing the index."""
+        self._stopped.set()
+
+    def status(self) -> dict:
+        """How far the log was indexed and when."""
+        index = self.index
+        return {
+            "log_file_path": LOG_FILE_PATH,
+            "offset": None if index is None else index.offset,
+            "failures": None if index is None else index.failures,
+            "refreshed_at": None if index is None else index.refreshed_at,
+        }
+
+
+def _query_options(query: str) -> dict:
+    """
+    The `FailureIndex.query` options of a URL query string. List filters are given comma
+    separated or repeated, such as `equipment_id=1,2&equipment_id=3`.
+    """
+    params = parse_qs(query)
+
+    def values(name):
+        return None if name not in params else [value for param in params[name] for value in param.split(",") if value]
+
+    options = {
+        "start": params.get("start", [None])[-1],
+        "end": params.get("end", [None])[-1],
+        "equipment_ids": values("equipment_id"),
+        "equipment_groups": values("equipment_group"),
+        "sensor_ids": values("sensor_id"),
+    }
+    if "top_sensors" in params:
+        options["top_sensors"] = int(params["top_sensors"][-1])
+    if "keep_ties" in params:
+        options["keep_ties"] = params["keep_ties"][-1].lower() in ("1", "true", "yes")
+    return options
+
+
+def _json_result(result):
+    """A question result as JSON values: DataFrames become lists of records."""
+    if isinstance(result, pd.DataFrame):
+        return result.to_dict(orient="records")
+    return result
+
+
+def _json_default(value):
+    """Encode the numpy scalars and timestamps left in the results."""
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """
+    The HTTP endpoints of a `QueryService`:
+
+    - `/questions`: the results of the four questions;
+    - `/q1` to `/q4`: the result of one of them;
+    - `/status`: how far the log was indexed.
+
+    The questions take the filters and options of `_query_options` as query string.
+    """
+
+    service: QueryService = None
+
+    def _send_json(self, status: int, body, milliseconds: float = None) -> None:
+        content = json.dumps(body, default=_json_default).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        if milliseconds is not None:
+            self.send_header("Server-Timing", f"query;dur={milliseconds:.3f}")
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/status":
+            self._send_json(200, self.service.status())
+            return
+        if url.path != "/questions" and url.path not in QUESTION_PATHS:
+            self._send_json(404, {"error": f"Unknown path {url.path}"})
+            return
+
+        index = self.service.index
+        if index is None:
+            self._send_json(503, {"error": "The index is not built yet"})
+            return
+
+        start = time.perf_counter()
+        try:
+            results = index.query(**_query_options(url.query))
+        except (ValueError, TypeError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        keys = QUESTION_KEYS if url.path == "/questions" else [QUESTION_PATHS[url.path]]
+        body = {key: _json_result(results[key]) for key in keys}
+        self._send_json(200, body, (time.perf_counter() - start) * 1000)
+
+
+def serve(
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    refresh_interval: float = DEFAULT_REFRESH_INTERVAL,
+) -> None:
+    """Build the failure index and answer queries over HTTP on `host` and `port` until interrupted."""
+    service = QueryService(chunk_size, refresh_interval)
+    service.start()
+
+    handler = type("ServiceQueryHandler", (QueryHandler,), {"service": service})
+    with ThreadingHTTPServer((host, port), handler) as server:
+        print(f"Serving the failure index on http://{host}:{server.server_port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            service.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="log bytes parsed at once")
+    parser.add_argument(
+        "--refresh-interval",
+        type=float,
+        default=DEFAULT_REFRESH_INTERVAL,
+        help="seconds between the checks for appended log lines",
+    )
+    args = parser.parse_args()
+
+    serve(args.host, args.port, args.chunk_size, args.refresh_interval)
+
+
+if __name__ == "__main__":
+    main()
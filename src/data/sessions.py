@@ -0,0 +1,39 @@
+"""Sessionization of the failure events of every equipment by the time gap between them."""
+
+import numpy as np
+import pandas as pd
+
+
+def sessionize_events(events: pd.DataFrame, gap) -> pd.DataFrame:
+    """
+    Group the (equipment_id, timestamp) failure events of every equipment into sessions, where
+    each event follows the previous one of its equipment by at most `gap`, such as "5s".
+
+    The events are sorted once by equipment and timestamp, then a single vectorized scan of the
+    consecutive differences marks where sessions start, without comparing pairs of events.
+    Timestamps are datetimes or, with compact types, epoch seconds. Returns one row per session,
+    ordered by equipment and start: its equipment_id, its start as timestamp, its end and its
+    number of distinct timestamps as events.
+    """
+    # Parsed as a list, straight to nanoseconds: the scalar parser goes through the generic NumPy
+    # timedelta unit, deprecated since NumPy 2.5.
+    gap = pd.to_timedelta([gap]).to_numpy()[0]
+    events = events.sort_values(by=["equipment_id", "timestamp"], kind="stable")
+    equipment_ids = events["equipment_id"].to_numpy()
+    timestamps = events["timestamp"].to_numpy()
+    gap = gap if np.issubdtype(timestamps.dtype, np.datetime64) else gap / np.timedelta64(1, "s")
+
+    starts = np.ones(len(events), dtype=bool)
+    starts[1:] = (equipment_ids[1:] != equipment_ids[:-1]) | (timestamps[1:] - timestamps[:-1] > gap)
+    sessions = np.cumsum(starts) - 1
+
+    ends = np.zeros(len(events), dtype=bool)
+    ends[:-1] = starts[1:]
+    ends[-1:] = True
+    first, last = np.flatnonzero(starts), np.flatnonzero(ends)
+    return pd.DataFrame({
+        "equipment_id": equipment_ids[first],
+        "timestamp": timestamps[first],
+        "end": timestamps[last],
+        "events": np.bincount(sessions, minlength=len(first)),
+    })
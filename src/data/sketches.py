@@ -0,0 +1,152 @@
+"""
+Mergeable sketches of the failures per group, for the approximate analysis: HyperLogLog for the
+distinct failure events of every equipment and Space-Saving for the top sensors of every
+equipment. Their memory does not grow with the number of failures, and the sketches of two log
+chunks or shards merge into the sketch of both.
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+from data.top_k import top_k_per_group
+
+MIN_PRECISION = 4
+MAX_PRECISION = 18
+DEFAULT_DISTINCT_ERROR = 0.01
+DEFAULT_COUNT_ERROR = 0.01
+
+
+def _bit_lengths(values: np.ndarray) -> np.ndarray:
+    """The number of bits of every uint64 value, 0 for 0, by a binary search on the shifts."""
+    values = values.copy()
+    lengths = np.zeros(len(values), dtype="int64")
+    for shift in (32, 16, 8, 4, 2, 1):
+        high = values >= np.uint64(1) << np.uint64(shift)
+        lengths[high] += shift
+        values[high] >>= np.uint64(shift)
+    return lengths + (values > 0)
+
+
+class HyperLogLog():
+    """
+    A HyperLogLog of the distinct values of every group, such as the failure timestamps of every
+    equipment, with 2 ** `precision` registers per group.
+
+    A value is hashed to 64 bits: the first `precision` bits pick a register, which keeps the
+    highest rank of the first set bit among the other bits. The relative standard error of the
+    distinct counts is about 1.04 / sqrt(2 ** precision). Merging two sketches takes the maximum
+    of their registers.
+    """
+
+    def __init__(self, precision: int, groups: np.ndarray = None, registers: np.ndarray = None):
+        if not MIN_PRECISION <= precision <= MAX_PRECISION:
+            raise ValueError(f"precision must be between {MIN_PRECISION} and {MAX_PRECISION}, got {precision}")
+        self.precision = precision
+        self.groups = np.empty(0, dtype="int64") if groups is None else groups
+        self.registers = np.zeros((0, 2 ** precision), dtype="uint8") if registers is None else registers
+
+    @classmethod
+    def from_error(cls, error: float = DEFAULT_DISTINCT_ERROR) -> "HyperLogLog":
+        """An empty sketch with the lowest precision whose relative standard error is at most `error`."""
+        precision = math.ceil(math.log2((1.04 / error) ** 2))
+        return cls(min(max(precision, MIN_PRECISION), MAX_PRECISION))
+
+    @property
+    def error(self) -> float:
+        """The relative standard error of the distinct counts."""
+        return 1.04 / math.sqrt(2 ** self.precision)
+
+    def add(self, groups: np.ndarray, values: np.ndarray) -> "HyperLogLog":
+        """The sketch with the values of `values` added to their groups in `groups`."""
+        codes, group_keys = pd.factorize(groups, sort=True)
+        hashes = pd.util.hash_array(np.asarray(values).astype("int64"))
+
+        value_bits = np.uint64(64 - self.precision)
+        registers = hashes >> value_bits
+        ranks = value_bits.astype("int64") - _bit_lengths(hashes & ((np.uint64(1) << value_bits) - np.uint64(1))) + 1
+
+        partial = np.zeros((len(group_keys), 2 ** self.precision), dtype="uint8")
+        np.maximum.at(partial.reshape(-1), codes * 2 ** self.precision + registers.astype("int64"), ranks.astype("uint8"))
+        return self.merge(HyperLogLog(self.precision, np.asarray(group_keys, dtype="int64"), partial))
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        """The sketch of the values of both sketches."""
+        if other.precision != self.precision:
+            raise ValueError(f"Cannot merge HyperLogLogs of precisions {self.precision} and {other.precision}")
+        groups = np.union1d(self.groups, other.groups)
+        registers = np.zeros((len(groups), 2 ** self.precision), dtype="uint8")
+        for sketch in (self, other):
+            rows = np.searchsorted(groups, sketch.groups)
+            registers[rows] = np.maximum(registers[rows], sketch.registers)
+        return HyperLogLog(self.precision, groups, registers)
+
+    def estimates(self) -> pd.Series:
+        """The estimated number of distinct values of every group, with linear counting for the small ones."""
+        m = 2 ** self.precision
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype("int64")), axis=1)
+        zeros = np.count_nonzero(self.registers == 0, axis=1)
+        linear = m * np.log(m / np.maximum(zeros, 1))
+        estimates = np.where((raw <= 2.5 * m) & (zeros > 0), linear, raw)
+        return pd.Series(np.rint(estimates).astype("int64"), index=pd.Index(self.groups, name="group"))
+
+
+class SpaceSaving():
+    """
+    A Space-Saving summary of the most frequent items of every group, such as the sensors with
+    the most failures of every equipment, keeping at most `capacity` counters per group.
+
+    Every counter overestimates the count of its item by at most the floor of its group, which
+    bounds the count of the items without a counter and stays around the failures of the group
+    over `capacity`. Merging two summaries adds their counters, an item missing from one taking
+    the floor of that one, then keeps the `capacity` highest counters of every group.
+    """
+
+    def __init__(self, capacity: int, counters: pd.Series = None, floors: pd.Series = None):
+        if capacity < 1:
+            raise ValueError(f"capacity must be at least 1, got {capacity}")
+        self.capacity = capacity
+        self.counters = counters
+        self.floors = floors
+
+    @classmethod
+    def from_error(cls, error: float = DEFAULT_COUNT_ERROR) -> "SpaceSaving":
+        """An empty summary whose floors stay around `error` times the count of their group."""
+        return cls(math.ceil(1 / error))
+
+    def _truncate(self, counts: pd.Series, floors: pd.Series) -> "SpaceSaving":
+        """The summary of the `capacity` highest counts of every group, the others raising the floors."""
+        group_name, item_name = counts.index.names
+        table = counts.rename("count").reset_index()
+        top = top_k_per_group(table, group_name, item_name, "count", self.capacity)
+
+        dropped = table.drop(index=top.index).groupby(group_name)["count"].max()
+        floors = pd.concat([floors, dropped], axis=1).max(axis=1).astype("int64").rename_axis(group_name)
+        counters = top.set_index([group_name, item_name])["count"].sort_index()
+        return SpaceSaving(self.capacity, counters, floors)
+
+    def add(self, counts: pd.Series) -> "SpaceSaving":
+        """The summary with exact counts, indexed by (group, item), added to it."""
+        partial = SpaceSaving(self.capacity)._truncate(
+            counts.astype("int64"), pd.Series(0, index=counts.index.levels[0][:0], dtype="int64")
+        )
+        return partial if self.counters is None else self.merge(partial)
+
+    def merge(self, other: "SpaceSaving") -> "SpaceSaving":
+        """The summary of the items of both summaries."""
+        if other.counters is None:
+            return self
+        if self.counters is None:
+            return other
+
+        table = pd.concat([self.counters.rename("a"), other.counters.rename("b")], axis=1)
+        groups = table.index.get_level_values(0)
+        counts = table["a"].fillna(pd.Series(self.floors.reindex(groups).fillna(0).to_numpy(), index=table.index)) \
+            + table["b"].fillna(pd.Series(other.floors.reindex(groups).fillna(0).to_numpy(), index=table.index))
+        floors = self.floors.add(other.floors, fill_value=0)
+        return SpaceSaving(self.capacity)._truncate(counts.astype("int64"), floors)
+
+    def counts(self) -> pd.Series:
+        """The estimated count of every item with a counter, indexed by (group, item)."""
+        return self.counters
@@ -0,0 +1,67 @@
+"""Top k ranking of the items of every group by count, without sorting the whole count table."""
+
+import numpy as np
+import pandas as pd
+
+
+def _kth_counts(groups: np.ndarray, counts: np.ndarray, n_groups: int, k: int) -> np.ndarray:
+    """
+    The k-th highest count of every group, counting tied items, or its lowest count when the
+    group has fewer than `k` items.
+
+    Each pass takes the per group maximum of the counts not taken yet, with all the items tied
+    at it, so at most `k` linear passes are made over the counts.
+    """
+    kth_counts = np.full(n_groups, -np.inf)
+    taken = np.zeros(n_groups, dtype="int64")
+    active = np.ones(n_groups, dtype=bool)
+    remaining = np.ones(len(counts), dtype=bool)
+
+    for _ in range(k):
+        candidates = remaining & active[groups]
+        maxima = np.full(n_groups, -np.inf)
+        np.maximum.at(maxima, groups[candidates], counts[candidates])
+
+        found = active & (maxima > -np.inf)
+        kth_counts[found] = maxima[found]
+        at_maxima = candidates & (counts == maxima[groups])
+        taken += np.bincount(groups[at_maxima], minlength=n_groups)
+        remaining &= ~at_maxima
+        active = found & (taken < k)
+        if not active.any():
+            break
+
+    return kth_counts
+
+
+def top_k_per_group(
+    df: pd.DataFrame,
+    group_column: str,
+    item_column: str,
+    count_column: str,
+    k: int = 3,
+    keep_ties: bool = False,
+) -> pd.DataFrame:
+    """
+    Select the `k` items with the highest counts of every group, with their rank in the group.
+
+    Ranks count ties the way competitions do (1, 2, 2, 4). Items tied at the k-th count are
+    taken by ascending item, unless `keep_ties` is set, which keeps all of them. Only the rows at
+    or above the k-th count of their group are sorted, by group, descending count and item.
+    """
+    if k < 1:
+        raise ValueError(f"k must be at least 1, got {k}")
+
+    groups, group_keys = pd.factorize(df[group_column])
+    counts = df[count_column].to_numpy(dtype="float64")
+    kth_counts = _kth_counts(groups, counts, len(group_keys), k)
+
+    top = df[counts >= kth_counts[groups]] \
+        .sort_values(by=[group_column, count_column, item_column], ascending=[True, False, True], kind="stable")
+    top["rank"] = top.groupby(group_column, sort=False)[count_column] \
+        .rank(method="min", ascending=False) \
+        .astype("int64")
+
+    if keep_ties:
+        return top[top["rank"] <= k]
+    return top.groupby(group_column, sort=False).head(k)
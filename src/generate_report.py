@@ -2,39 +2,143 @@
 Generate the HTML report for the Shape Data Engineering Challenge.
 """
 
+import argparse
+import os
+
 from reports.html_report import HtmlReport
-from data.generate_analysis import generate_analysis
-
-
-def get_html_content():
-    """Get the HTML content for the report."""
-    print()
-    print("=" * 50)
-    print("Generating analysis...")
-    print("=" * 50)
-    results = generate_analysis()
-    
-    print()
-    print("=" * 50)
-    print("Generating HTML report...")
-    print("=" * 50)
-    report = HtmlReport(results)
-    html_content = report.generate()
-    
-    return html_content
-
-
-def generate_html_report(output_file: str) -> None:
-    """Generate the HTML report."""
+from data.backends import BACKENDS, DEFAULT_BACKEND
+from data.generate_analysis import DEFAULT_TOP_SENSORS, iter_analysis
+from data.instrumentation import save_run_profile, stage, start_run
+from data.sketches import DEFAULT_COUNT_ERROR, DEFAULT_DISTINCT_ERROR
+from data.telemetry import DEFAULT_ROLLING_WINDOW
+
+
+def generate_html_report(
+    output_file: str,
+    profile_path: str = None,
+    profile_stage: str = None,
+    **analysis_options,
+) -> None:
+    """
+    Generate the HTML report, see `iter_analysis` for the analysis options.
+
+    The section of every question is written out as soon as its result comes in, so the report is
+    never held in memory as a whole. It is written to a new file next to `output_file`, which
+    only replaces the output file once the report is complete, so a failed run leaves the
+    previous report in place. With
+    `profile_path`, the wall and CPU time, rows and peak memory of every pipeline stage are saved
+    there as a JSON run profile, along with the cProfile statistics of `profile_stage`.
+    """
+    start_run(profile_stage)
     try:
-        html_content = get_html_content()
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write(html_content)
+        print()
+        print("=" * 50)
+        print("Generating analysis and HTML report...")
+        print("=" * 50)
+        new_output_file = f"{output_file}.new"
+        try:
+            with open(new_output_file, 'w', encoding='utf-8') as f:
+                report = HtmlReport()
+                report.start(f)
+                for key, result in iter_analysis(**analysis_options):
+                    with stage("render_section"):
+                        report.add_result(key, result)
+                with stage("render_report"):
+                    report.finish()
+        except BaseException:
+            if os.path.exists(new_output_file):
+                os.remove(new_output_file)
+            raise
+        os.replace(new_output_file, output_file)
         print(f"HTML report generated successfully: {output_file}")
     except Exception as e:
         print(f"Error generating HTML report: {e}")
         raise
+    finally:
+        if profile_path is not None:
+            save_run_profile(profile_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the HTML report of the equipment failures.")
+    parser.add_argument("--output", default="matheus_braganca_teste_shape.html")
+
+    source = parser.add_argument_group("data source, one at most")
+    source = source.add_mutually_exclusive_group()
+    source.add_argument("--use-store", action="store_true", help="read the failures from the Parquet failure store")
+    source.add_argument(
+        "--incremental", action="store_true", help="only parse the log bytes appended since the last run"
+    )
+    source.add_argument("--use-database", action="store_true", help="query the SQLite failure database")
+
+    parsing = parser.add_argument_group("log parsing")
+    parsing.add_argument(
+        "--chunk-size", type=int, default=None, help="stream the log, or the bytes of an incremental run, in chunks"
+    )
+    parsing.add_argument("--workers", type=int, default=1, help="processes parsing the log")
+    parsing.add_argument("--compact", action="store_true", help="keep the failures in compact column types")
+    parsing.add_argument(
+        "--from-archive", action="store_true", help="stream the log out of the .tar.gz archive without extracting it"
+    )
+    parsing.add_argument(
+        "--use-cache", action="store_true", help="load the parsed failures from the data cache when unchanged"
+    )
+    parsing.add_argument(
+        "--backend",
+        default=DEFAULT_BACKEND,
+        choices=list(BACKENDS),
+        help="engine joining and aggregating the failures",
+    )
+
+    parser.add_argument("--question-workers", type=int, default=1, help="threads answering the questions")
+    parser.add_argument(
+        "--top-sensors", type=int, default=DEFAULT_TOP_SENSORS, help="sensors ranked for every equipment"
+    )
+    parser.add_argument("--keep-ties", action="store_true", help="also rank the sensors tied with the last one")
+    parser.add_argument(
+        "--telemetry", action="store_true", help="add the temperature and vibration statistics sections"
+    )
+    parser.add_argument(
+        "--rolling-window", default=DEFAULT_ROLLING_WINDOW, help="time window of the rolling telemetry means"
+    )
+    parser.add_argument("--event-gap", default=None, help="group failures at most this far apart into events, e.g. 5s")
+    parser.add_argument(
+        "--approximate", action="store_true", help="estimate the failure events and sensor failures with sketches"
+    )
+    parser.add_argument(
+        "--distinct-error", type=float, default=DEFAULT_DISTINCT_ERROR, help="relative error of the estimated events"
+    )
+    parser.add_argument(
+        "--count-error", type=float, default=DEFAULT_COUNT_ERROR, help="error of the estimated sensor failures"
+    )
+    parser.add_argument("--profile", default=None, help="path of the JSON run profile to write")
+    parser.add_argument("--profile-stage", default=None, help="stage to profile with cProfile, e.g. parse")
+    args = parser.parse_args()
+
+    generate_html_report(
+        args.output,
+        args.profile,
+        args.profile_stage,
+        chunk_size=args.chunk_size,
+        use_store=args.use_store,
+        incremental=args.incremental,
+        use_database=args.use_database,
+        workers=args.workers,
+        compact=args.compact,
+        from_archive=args.from_archive,
+        use_cache=args.use_cache,
+        backend=args.backend,
+        question_workers=args.question_workers,
+        top_sensors=args.top_sensors,
+        keep_ties=args.keep_ties,
+        telemetry=args.telemetry,
+        rolling_window=args.rolling_window,
+        event_gap=args.event_gap,
+        approximate=args.approximate,
+        distinct_error=args.distinct_error,
+        count_error=args.count_error,
+    )
 
 
 if __name__ == "__main__":
-    generate_html_report("matheus_braganca_teste_shape.html")
+    main()
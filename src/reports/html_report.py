@@ -1,24 +1,96 @@
 """HTML report implementation using Template Method pattern."""
 
+import html
 from datetime import datetime
 
 import pandas as pd
 
+QUESTION_KEYS = ["q1_result", "q2_result", "q3_result", "q4_result"]
+TELEMETRY_KEYS = ["equipment_telemetry", "rolling_telemetry", "sensor_telemetry"]
+DEFAULT_PAGE_SIZE = 50
+DEFAULT_MAX_INLINE_ROWS = 500
+ROW_CHUNK_SIZE = 10_000
+SECTION_KEYS = QUESTION_KEYS + TELEMETRY_KEYS
+
 
 class HtmlReport():
     """HTML report generator for failure analysis results."""
 
-    def __init__(self, analysis: dict):
-        self.analysis = analysis
+    def __init__(
+        self,
+        analysis: dict = None,
+        page_size: int = DEFAULT_PAGE_SIZE,
+        max_inline_rows: int = DEFAULT_MAX_INLINE_ROWS,
+    ):
+        self.analysis = {} if analysis is None else analysis
+        self.page_size = page_size
+        self.max_inline_rows = max_inline_rows
+        self._output = None
+        self._next_section = 0
+
+    def start(self, f) -> None:
+        """
+        Start writing the report to a text file: the header and introduction are written right
+        away, then every section as soon as its result is added with `add_result`.
+        """
+        self._output = f
+        self._next_section = 0
+        f.write(self._generate_header())
+        f.write(self._generate_introduction())
+        f.write(self._generate_analysis_start())
+
+    def add_result(self, key: str, result) -> None:
+        """
+        Add the result of a question. While the report is written, its section is written as soon
+        as the ones before it are, and the result is then no longer kept.
+        """
+        self.analysis[key] = result
+        if self._output is not None:
+            self._write_sections()
+
+    def finish(self) -> None:
+        """Write the sections left, after the ones of the results missing, and the footer."""
+        self._write_sections(finished=True)
+        self._output.write(self._generate_analysis_end())
+        self._output.write(self._generate_footer())
+        self._output = None
+
+    def _write_sections(self, finished: bool = False) -> None:
+        """
+        Write the sections of the results added, in report order, up to the first result missing,
+        or skipping the missing ones once the analysis is `finished`.
+        """
+        while self._next_section < len(SECTION_KEYS):
+            key = SECTION_KEYS[self._next_section]
+            if key in self.analysis:
+                for piece in self._iter_section(key, self.analysis.pop(key)):
+                    self._output.write(piece)
+            elif not finished:
+                return
+            self._next_section += 1
 
     def generate(self) -> str:
         """Generate the HTML report."""
-        return f"""
-            {self._generate_header()}
-            {self._generate_introduction()}
-            {self._generate_analysis()}
-            {self._generate_footer()}
+        return "".join(self.iter_html())
+
+    def write(self, f) -> None:
+        """Write the HTML report to a text file as it is generated, section by section."""
+        for piece in self.iter_html():
+            f.write(piece)
+
+    def iter_html(self):
         """
+        Generate the HTML report of the analysis in pieces: the header, the introduction, every
+        question section and the footer, with the rows of the large tables in chunks.
+        """
+        yield self._generate_header()
+        yield self._generate_introduction()
+        yield self._generate_analysis_start()
+        for key in SECTION_KEYS:
+            if key in self.analysis:
+                yield from self._iter_section(key, self.analysis[key])
+        yield self._generate_analysis_end()
+        yield self._generate_footer()
     
     def _generate_header(self) -> str:
         """Generate the HTML header with styles."""
@@ -250,6 +322,30 @@ class HtmlReport():
                     background: #f5f5f5;
                 }
                 
+                .pagination {
+                    display: flex;
+                    align-items: center;
+                    justify-content: flex-end;
+                    gap: 10px;
+                    margin-top: 10px;
+                    color: #666;
+                }
+                
+                .pagination button {
+                    padding: 5px 12px;
+                    border: 1px solid #667eea;
+                    border-radius: 5px;
+                    background: white;
+                    color: #667eea;
+                    cursor: pointer;
+                }
+                
+                .pagination button:disabled {
+                    border-color: #e0e0e0;
+                    color: #e0e0e0;
+                    cursor: default;
+                }
+                
                 .footer {
                     margin-top: 50px;
                     padding-top: 20px;
@@ -468,33 +564,106 @@ class HtmlReport():
                         // Add active class to clicked tab
                         event.target.classList.add('active');
                     }}
+                    
+                    // Render the large tables a page at a time, from their JSON data blocks
+                    function showTablePage(table, rows, page) {{
+                        const pageSize = Number(table.dataset.pageSize);
+                        const pages = Math.max(1, Math.ceil(rows.length / pageSize));
+                        page = Math.min(Math.max(page, 0), pages - 1);
+                        
+                        const body = table.querySelector('tbody');
+                        body.replaceChildren();
+                        rows.slice(page * pageSize, (page + 1) * pageSize).forEach(row => {{
+                            const tr = body.insertRow();
+                            row.forEach(value => {{
+                                tr.insertCell().textContent = value;
+                            }});
+                        }});
+                        
+                        const pagination = document.getElementById(table.id + '-pages');
+                        pagination.querySelector('span').textContent = `Page ${{page + 1}} of ${{pages}} (${{rows.length}} rows)`;
+                        pagination.querySelector('.previous').disabled = page === 0;
+                        pagination.querySelector('.next').disabled = page === pages - 1;
+                        pagination.querySelector('.previous').onclick = () => showTablePage(table, rows, page - 1);
+                        pagination.querySelector('.next').onclick = () => showTablePage(table, rows, page + 1);
+                    }}
+                    
+                    document.querySelectorAll('table[data-page-size]').forEach(table => {{
+                        const rows = JSON.parse(document.getElementById(table.id + '-data').textContent);
+                        showTablePage(table, rows, 0);
+                    }});
                 </script>
         </body>
         </html>
     """
     
-    def _generate_analysis(self) -> str:
-        """Generate the analysis section with all questions."""
-        q1_html = self._format_question_1(self.analysis["q1_result"])
-        q2_html = self._format_question_2(self.analysis["q2_result"])
-        q3_html = self._format_question_3(self.analysis["q3_result"])
-        q4_html = self._format_question_4(self.analysis["q4_result"])
-        
-        return f"""
+    def _generate_analysis_start(self) -> str:
+        """Open the analysis section, which has all the questions, then the telemetry sections."""
+        return """
         <!-- Analysis Report Page -->
             <div id="analysis-page" class="page">
-                {q1_html}
-                {q2_html}
-                {q3_html}
-                {q4_html}
-            </div>
+                """
+
+    def _generate_analysis_end(self) -> str:
+        """Close the analysis section."""
+        return """</div>
         """
+
+    def _iter_section(self, key: str, result):
+        """Format the section of a result, separated from the next one."""
+        yield from self._iter_question(key, result)
+        yield "\n                "
     
-    def _format_question_1(self, q1_result: dict) -> str:
+    def _iter_question(self, key: str, result):
+        """Format the result of a question by its key."""
+        return {
+            "q1_result": self._format_question_1,
+            "q2_result": self._format_question_2,
+            "q3_result": self._format_question_3,
+            "q4_result": self._format_question_4,
+            "sensor_telemetry": self._format_sensor_telemetry,
+            "equipment_telemetry": self._format_equipment_telemetry,
+            "rolling_telemetry": self._format_rolling_telemetry,
+        }[key](result)
+    
+    def _iter_table(self, df: pd.DataFrame, table_id: str):
+        """
+        Format a table. Tables longer than `max_inline_rows` are written as a JSON data block, in
+        chunks of rows, that the page renders `page_size` rows at a time.
+        """
+        if len(df) <= self.max_inline_rows:
+            yield df.to_html(index=False, classes='', table_id=table_id, escape=False)
+            return
+        
+        header = "".join(f"<th>{html.escape(str(column))}</th>" for column in df.columns)
+        yield f"""<table border="1" class="dataframe" id="{table_id}" data-page-size="{self.page_size}">
+                        <thead>
+                            <tr style="text-align: right;">{header}</tr>
+                        </thead>
+                        <tbody></tbody>
+                    </table>
+                    <div class="pagination" id="{table_id}-pages">
+                        <button class="previous">Previous</button>
+                        <span></span>
+                        <button class="next">Next</button>
+                    </div>
+                    <script type="application/json" id="{table_id}-data">["""
+        for start in range(0, len(df), ROW_CHUNK_SIZE):
+            rows = df.iloc[start:start + ROW_CHUNK_SIZE].to_json(orient="values")[1:-1].replace("</", "<\\/")
+            yield rows if start == 0 else "," + rows
+        yield "]</script>"
+
+    def _format_question_1(self, q1_result: dict):
         """Format failure count results."""
         total = q1_result["v1"]
         unique = q1_result["v2"]
-        return f"""<!-- Question 1 -->
+        if "event_gap" in q1_result:
+            unique_label = f"Total equipment failures<br>(failure events of an equipment at most {q1_result['event_gap']} apart)"
+        else:
+            unique_label = "Total equipment failures<br>(unique events per equipment and timestamp)"
+        if "event_error" in q1_result:
+            unique_label += f"<br>estimated, relative standard error {q1_result['event_error']:.2%}"
+        yield f"""<!-- Question 1 -->
             <div class="question">
                 <h2>1. How many equipment failures happened?</h2>
                 <div class="answer">
@@ -505,20 +674,22 @@ class HtmlReport():
                         </div>
                         <div class="answer-number-box">
                             <div class="answer-number">{unique:,}</div>
-                            <div class="answer-number-label">Total equipment failures<br>(unique events per equipment and timestamp)</div>
+                            <div class="answer-number-label">{unique_label}</div>
                         </div>
                     </div>
                 </div>
             </div>"""
     
-    def _format_question_2(self, q2_result: pd.DataFrame) -> str:
+    def _format_question_2(self, q2_result: pd.DataFrame):
         """Format equipment ranking results."""
         top_equipment = q2_result.iloc[0]
-        return f"""<!-- Question 2 -->
+        yield """<!-- Question 2 -->
             <div class="question">
                 <h2>2. Which piece of equipment had most failures?</h2>
                 <div class="answer">
-                    {q2_result.to_html(index=False, classes='', table_id='q2-table', escape=False)}
+                    """
+        yield from self._iter_table(q2_result, "q2-table")
+        yield f"""
                     <p style="margin-top: 15px; color: #666;">
                         <strong>Equipment with most failures:</strong> {top_equipment['equipment_name']} (ID: {top_equipment['equipment_id']}) 
                         with {top_equipment['failures']:,} failures.
@@ -526,25 +697,92 @@ class HtmlReport():
                 </div>
             </div>"""
     
-    def _format_question_3(self, q3_result: pd.DataFrame) -> str:
+    def _format_question_3(self, q3_result: pd.DataFrame):
         """Format group statistics results."""
-        return f"""<!-- Question 3 -->
+        yield """<!-- Question 3 -->
             <div class="question">
                 <h2>3. Find the average amount of failures per asset across equipment groups, ordered by the total number of failures in ascending order.</h2>
                 <div class="answer">
-                    {q3_result.to_html(index=False, classes='', table_id='q3-table', escape=False)}
+                    """
+        yield from self._iter_table(q3_result, "q3-table")
+        yield """
                 </div>
             </div>"""
     
-    def _format_question_4(self, q4_result: pd.DataFrame) -> str:
+    def _format_question_4(self, q4_result: pd.DataFrame):
         """Format sensor ranking results."""
-        return f"""<!-- Question 4 -->
+        yield """<!-- Question 4 -->
             <div class="question">
                 <h2>4. For each asset, rank the sensors which present the most number of failures, and also include the equipment group in the output.</h2>
                 <div class="answer">
-                    {q4_result.to_html(index=False, classes='', table_id='q4-table', escape=False)}
+                    """
+        yield from self._iter_table(q4_result, "q4-table")
+        yield f"""
+                    <p style="margin-top: 15px; color: #666;">
+                        <em>Showing the top {q4_result.attrs.get("top_sensors", 3)} sensors with most failures for each equipment.</em>
+                    </p>"""
+        if "count_errors" in q4_result.attrs:
+            yield f"""
+                    <p style="color: #666;">
+                        <em>The failures are estimated, overestimating the ones of a sensor by at most
+                        {max(q4_result.attrs["count_errors"].values(), default=0):,} failures.</em>
+                    </p>"""
+        yield """
+                </div>
+            </div>"""
+    
+    def _format_equipment_telemetry(self, equipment_telemetry: pd.DataFrame):
+        """Format the reading statistics per equipment."""
+        yield """<!-- Equipment telemetry -->
+            <div class="question">
+                <h2>Telemetry: temperature and vibration readings of the failures of each asset</h2>
+                <div class="answer">
+                    """
+        yield from self._iter_table(equipment_telemetry.round(2), "equipment-telemetry-table")
+        yield """
+                    <p style="margin-top: 15px; color: #666;">
+                        <em>Missing counts the <code>err</code> readings, left out of the other statistics.</em>
+                    </p>"""
+        yield from self._format_quantile_error(equipment_telemetry)
+        yield """
+                </div>
+            </div>"""
+    
+    def _format_rolling_telemetry(self, rolling_telemetry: pd.DataFrame):
+        """Format the rolling means of the readings per equipment."""
+        yield """<!-- Rolling telemetry -->
+            <div class="question">
+                <h2>Telemetry: rolling mean of the readings of each asset</h2>
+                <div class="answer">
+                    """
+        rolling_telemetry = rolling_telemetry.round(2) \
+            .astype({"peak_window_end": str})
+        yield from self._iter_table(rolling_telemetry, "rolling-telemetry-table")
+        yield """
                     <p style="margin-top: 15px; color: #666;">
-                        <em>Showing the top 3 sensors with most failures for each equipment.</em>
+                        <em>The latest mean is the one of the window ending at the last failure of the asset.</em>
                     </p>
                 </div>
             </div>"""
+    
+    def _format_sensor_telemetry(self, sensor_telemetry: pd.DataFrame):
+        """Format the reading statistics per sensor."""
+        yield """<!-- Sensor telemetry -->
+            <div class="question">
+                <h2>Telemetry: temperature and vibration readings of the failures of each sensor</h2>
+                <div class="answer">
+                    """
+        yield from self._iter_table(sensor_telemetry.round(2), "sensor-telemetry-table")
+        yield from self._format_quantile_error(sensor_telemetry)
+        yield """
+                </div>
+            </div>"""
+    
+    def _format_quantile_error(self, telemetry: pd.DataFrame):
+        """Format the error of the estimated percentiles of a telemetry summary, when it has one."""
+        if "quantile_error" in telemetry.attrs:
+            yield f"""
+                    <p style="color: #666;">
+                        <em>The percentiles are interpolated between readings estimated within
+                        {telemetry.attrs["quantile_error"]:.0%}.</em>
+                    </p>"""
@@ -0,0 +1,57 @@
+"""
+Conformance of the execution backends of `data.backends`: every installed backend must give the
+results of the pandas backend, column types included, on a synthetic dataset. The backends whose
+packages are not installed are skipped.
+
+Run from the repository root:
+    PYTHONPATH=src python -m unittest discover tests
+"""
+
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+from benchmarks.synthetic_data import write_dataset
+from data.backends import BACKENDS, DEFAULT_BACKEND
+from data.generate_analysis import generate_analysis
+
+N_LINES = 20_000
+# The telemetry compares the readings of the failures, and the sessions their timestamps.
+ANALYSIS_OPTIONS = [{"telemetry": True}, {"event_gap": "1h", "keep_ties": True}]
+
+
+class BackendConformanceTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.dataset = tempfile.TemporaryDirectory()
+        write_dataset(cls.dataset.name, N_LINES, n_events=500)
+        cls.working_directory = os.getcwd()
+        os.chdir(cls.dataset.name)
+        cls.references = [generate_analysis(backend=DEFAULT_BACKEND, **options) for options in ANALYSIS_OPTIONS]
+
+    @classmethod
+    def tearDownClass(cls):
+        os.chdir(cls.working_directory)
+        cls.dataset.cleanup()
+
+    def assert_same_results(self, results: dict, reference: dict) -> None:
+        self.assertEqual(list(results), list(reference))
+        for key, expected in reference.items():
+            if isinstance(expected, pd.DataFrame):
+                pd.testing.assert_frame_equal(results[key], expected, obj=key)
+            else:
+                self.assertEqual(results[key], expected, key)
+
+    def test_backends_match_pandas(self):
+        for name, backend in BACKENDS.items():
+            with self.subTest(backend=name):
+                if not backend.is_available():
+                    self.skipTest(f"the {name} backend needs {backend.requirements} to be installed")
+                for options, reference in zip(ANALYSIS_OPTIONS, self.references):
+                    self.assert_same_results(generate_analysis(backend=name, **options), reference)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+"""
+The streaming, incremental and query service analyses must give the results of the whole log
+analysis on a synthetic log whose first lines are appended again, duplicated across chunks and
+across runs. Invalid analysis options must be rejected before the log is read.
+
+Run from the repository root:
+    PYTHONPATH=src python -m unittest discover tests
+"""
+
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+from benchmarks.synthetic_data import write_dataset
+from data.generate_analysis import QUESTION_KEYS, generate_analysis
+from data.process_raw_data import LOG_FILE_PATH
+from data.query_service import QueryService
+
+N_LINES = 20_000
+N_DUPLICATES = 2_000
+CHUNK_SIZE = 100_000
+
+
+class DuplicatedFailuresTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.dataset = tempfile.TemporaryDirectory()
+        write_dataset(cls.dataset.name, N_LINES, n_events=500)
+        cls.working_directory = os.getcwd()
+        os.chdir(cls.dataset.name)
+
+        with open(LOG_FILE_PATH) as f:
+            cls.lines = f.readlines()
+        cls.lines += cls.lines[:N_DUPLICATES]
+        cls.write_log(cls.lines)
+        cls.reference = generate_analysis(telemetry=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        os.chdir(cls.working_directory)
+        cls.dataset.cleanup()
+
+    @staticmethod
+    def write_log(lines: list) -> None:
+        with open(LOG_FILE_PATH, "w") as f:
+            f.writelines(lines)
+
+    def assert_same_results(self, results: dict, keys: list) -> None:
+        for key in keys:
+            expected = self.reference[key]
+            if isinstance(expected, pd.DataFrame):
+                pd.testing.assert_frame_equal(results[key], expected, obj=key)
+            else:
+                self.assertEqual(results[key], expected, key)
+
+    def test_duplicates_are_dropped_across_chunks(self):
+        self.assert_same_results(generate_analysis(chunk_size=CHUNK_SIZE, telemetry=True), list(self.reference))
+
+    def test_duplicates_are_dropped_across_incremental_runs(self):
+        # The first run reads up to the middle of the log, the second the rest and the duplicates.
+        self.write_log(self.lines[:N_LINES // 2])
+        generate_analysis(incremental=True, chunk_size=CHUNK_SIZE)
+        self.write_log(self.lines)
+        self.assert_same_results(generate_analysis(incremental=True, chunk_size=CHUNK_SIZE), QUESTION_KEYS)
+
+    def test_duplicates_are_dropped_across_service_refreshes(self):
+        checkpoint = tempfile.TemporaryDirectory()
+        self.addCleanup(checkpoint.cleanup)
+        self.write_log(self.lines[:N_LINES // 2])
+        service = QueryService(CHUNK_SIZE, checkpoint_path=os.path.join(checkpoint.name, "service"))
+        service.load()
+        self.write_log(self.lines)
+        service.refresh()
+
+        results = service.index.query()
+        self.assertEqual(results["q1_result"], self.reference["q1_result"])
+        self.assertEqual(results["q4_result"]["failures"].sum(), self.reference["q4_result"]["failures"].sum())
+
+
+class AnalysisOptionsTest(unittest.TestCase):
+
+    def test_invalid_options_are_rejected(self):
+        for options in [{"chunk_size": 0}, {"chunk_size": 80}, {"top_sensors": 0}]:
+            with self.subTest(**options), self.assertRaises(ValueError):
+                generate_analysis(**options)
+
+
+if __name__ == "__main__":
+    unittest.main()